@@ -517,7 +517,16 @@ Chaque transaction retourne une donnée `MarketTx` comprenant:
   En cas de succès, retournera `{"ping": "pong"}`
 ], none)
 
-#descr("Récupérer les logs du système", "syslog", "/syslogs", "get_syslogs", [
+#descr("Temps de calcul du jeu", "tickstats", "/tickstats", "tickstats", [
+  Le jeu avance par tours de 20 millisecondes, les joueurs y sont mis à jour par groupes
+  en parallèle. Retourne, en millisecondes, le temps moyen (`avg`), le dernier (`last`)
+  et le plus long (`max`) des tours, ainsi que du groupe le plus lent (`shard_last`,
+  `shard_max`), et le nombre de tours plus longs que 20 millisecondes (`slow`).
+
+  Ne nécessite pas de clé de joueur pour être appelée.
+], none)
+
+#descr("Récupérer les logs du système", "syslog", "/syslogs?since=...&wait=...", "get_syslogs", [
   Lorsque le jeu réalise une action automatiquement, ou si une alerte est lancée,
   cela sera visible dans les logs associés au joueur.
 
@@ -531,6 +540,47 @@ Chaque transaction retourne une donnée `MarketTx` comprenant:
   Et produiront des alertes lorsque:
   - Le déchargement des resources d'un vaisseau n'est pas possible (voir @unload)
   - Il ne reste que 60 secondes avant que les frais n'épuisent les réserves d'argent
+
+  Chaque événement a un numéro (`seq`), à partir de 0 puis +1 à chaque événement.
+  Seuls les 1000 derniers événements du joueur sont gardés.
+
+  Avec le paramètre `since`, retourne les événements à partir de ce numéro, sans les
+  retirer: l'appel suivant se fait avec le champ `next` de la réponse. Le champ `first`
+  est le numéro du plus ancien événement encore gardé, ceux d'avant sont perdus.
+
+  Avec le paramètre `wait` (en millisecondes, au plus 30000), la requête attend
+  qu'un événement arrive s'il n'y en a aucun à retourner.
+
+  Sans `since`, retourne les événements qui n'ont pas encore été retournés
+  par un appel sans `since`.
 ], none)
 
+#descr("Suivre le marché et les logs en direct", "stream", "/stream?since=...", "event_stream", [
+  Garde la connexion ouverte, et envoie une ligne JSON (NDJSON) à chaque changement:
+  - `{"stream": "market", "prices": {...}}`: tous les prix en premier, puis ceux qui
+    ont changé (évolution du marché, achats et ventes des joueurs)
+  - `{"stream": "syslog", "seq": ..., ...}`: les événements de @syslog, à partir du
+    numéro `since`, seulement si la clé du joueur est donnée
+  - `{"stream": "ping"}`: rien n'a changé depuis 15 secondes
+
+  Un client qui lit moins vite que les prix ne changent reçoit à nouveau tous les
+  prix une fois à jour. Un client qui ne lit plus rien pendant 30 secondes voit
+  son flux fermé, il peut se reconnecter avec `since`.
+], "la clé donnée ne correspond à aucun joueur")
+
+#descr("Enchaîner plusieurs requêtes", "batch", "/batch?paths=[...]", "batch", [
+  Exécute dans l'ordre une liste d'endpoints (au plus 64), passée en JSON dans le
+  paramètre `paths`, par exemple `["/ship/1/unload/Iron/10", "/market/2/sell/Iron/10"]`.
+
+  Seules les actions sur les vaisseaux, l'équipage, les stations et le marché
+  peuvent être enchaînées.
+
+  Une partie `{N.champ}` d'un chemin est remplacée par le champ `champ` du résultat
+  du N-ième chemin, ce qui permet par exemple d'assigner un membre d'équipage
+  que l'on vient d'embaucher: `/station/1/crew/assign/{0.id}/trading`
+
+  Retourne `{"results": [...]}`, le résultat de chacun des chemins
+], "l'un des chemins échoue: les suivants ne sont pas exécutés, et la réponse contient
+  sa position `index` dans la liste ainsi que les `results` des chemins précédents")
+
 // TODO IMPORTANT  Add the /resources endpoint
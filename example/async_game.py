@@ -0,0 +1,511 @@
+import os
+import sys
+import json
+import time
+import string
+import asyncio
+import urllib.parse
+
+try:
+    from .player import URL, RECHECK_DELAY, SCAN_INTERVAL, SimeisError, BatchError, check_has
+    from .transport import STALE_ERRORS
+    from .cache import TTLCache
+    from .scheduler import Scheduler
+    from .metrics import Metrics
+    from .spatial import PlanetIndex
+    from .models import Player, Station, as_ship, loads
+except ImportError:
+    from player import URL, RECHECK_DELAY, SCAN_INTERVAL, SimeisError, BatchError, check_has
+    from transport import STALE_ERRORS
+    from cache import TTLCache
+    from scheduler import Scheduler
+    from metrics import Metrics
+    from spatial import PlanetIndex
+    from models import Player, Station, as_ship, loads
+
+# Same keep-alive pool as transport.ConnectionPool, but built on asyncio streams
+# At most `size` requests are running at the same time, the others wait for a free slot
+class AsyncConnectionPool:
+    def __init__(self, url, size=8, timeout=1):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    async def connect(self):
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+
+    async def request(self, path):
+        async with self.slots:
+            if self.idle:
+                conn, reused = self.idle.pop(), True
+            else:
+                conn, reused = await self.connect(), False
+
+            try:
+                try:
+                    body, keep = await asyncio.wait_for(self.send(conn, path), self.timeout)
+                except STALE_ERRORS:
+                    # A fresh socket failing is a real error, only retry on a reused one
+                    if not reused:
+                        raise
+                    self.close_conn(conn)
+                    conn = await self.connect()
+                    body, keep = await asyncio.wait_for(self.send(conn, path), self.timeout)
+            except BaseException:
+                self.close_conn(conn)
+                raise
+
+            if keep:
+                self.idle.append(conn)
+            else:
+                self.close_conn(conn)
+            return body
+
+    async def send(self, conn, path):
+        reader, writer = conn
+        writer.write((
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode())
+        await writer.drain()
+
+        status = await reader.readline()
+        if not status:
+            raise ConnectionResetError("Connection closed by the server")
+        headers = await self.read_headers(reader)
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.read_headers(reader) # Trailers
+                    break
+                body += await reader.readexactly(size)
+                await reader.readline()
+        else:
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+        keep = status.startswith(b"HTTP/1.1") and headers.get("connection", "").lower() != "close"
+        return body, keep
+
+    async def read_headers(self, reader):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            key, _, val = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = val.strip()
+
+    def close_conn(self, conn):
+        conn[1].close()
+
+    def close(self):
+        while self.idle:
+            self.close_conn(self.idle.pop())
+
+# Asynchronous counterpart of player.Game
+# Every ship can be handled in its own task, `concurrency` limits the number of requests in flight
+class AsyncGame:
+    def __init__(self, username, concurrency=8, cache_ttls=None, metrics_port=None):
+        self.pool = AsyncConnectionPool(URL, size=concurrency)
+        self.metrics = Metrics()
+        if metrics_port is not None:
+            self.metrics.serve(metrics_port)
+        self.cache = TTLCache(ttls=cache_ttls)
+        self.scheduler = Scheduler()
+        self.planets = PlanetIndex()
+        self.scanned_at = None
+        # The tasks of the ships share the money of the player and the cargo of the station, the
+        # checks and the purchases using them must not be interleaved
+        self.shopping = asyncio.Lock()
+        self.station_cargo = asyncio.Lock()
+        self.username = username
+        self.pid = None
+        self.sta = None
+
+    # Init connection & setup player, must be awaited before anything else
+    async def connect(self):
+        assert (await self.get("/ping"))["ping"] == "pong"
+        print("[*] Connection to server OK")
+        await self.setup_player(self.username)
+        self.pid = self.player["playerId"] # ID of our player
+        return self
+
+    async def get(self, path, **qry):
+        # Catalog endpoints are served from the cache while they are fresh
+        reply = self.cache.get(path) if len(qry) == 0 else None
+        if reply is not None:
+            data = loads(reply)
+            data.pop("error")
+            return data
+
+        if hasattr(self, "player"):
+            qry["key"] = self.player["key"]
+
+        tail = ""
+        if len(qry) > 0:
+            tail += "?"
+            tail += "&".join([
+                "{}={}".format(k, urllib.parse.quote(v)) for k, v in qry.items()
+            ])
+
+        reply, data, err = await self.send(path, tail)
+        if err != "ok":
+            raise SimeisError(err)
+
+        self.cache.update(path, reply)
+        return data
+
+    # Same as Game.send
+    async def send(self, path, tail=""):
+        tstart = time.perf_counter()
+        try:
+            reply = await self.pool.request(f"{path}{tail}")
+        except TimeoutError:
+            self.metrics.record(path, time.perf_counter() - tstart, timeout=True)
+            raise
+        except Exception as e:
+            self.metrics.record(path, time.perf_counter() - tstart, error=type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - tstart
+
+        data = loads(reply)
+        err = data.pop("error")
+        code = None if err == "ok" else data.get("type", err).split("(")[0]
+        self.metrics.record(path, elapsed, len(reply), error=code)
+        return reply, data, err
+
+    # Same as Game.batch
+    async def batch(self, paths):
+        if len(paths) == 0:
+            return []
+        key = urllib.parse.quote(self.player["key"])
+        qry = urllib.parse.quote(json.dumps(paths, separators=(",", ":")))
+        _, data, err = await self.send("/batch", f"?key={key}&paths={qry}")
+
+        results = data.get("results", [])
+        for path in paths[:len(results)]:
+            self.cache.notify(path)
+        if err != "ok":
+            raise BatchError(err, data.get("index"), results)
+        return results
+
+    async def setup_player(self, username, force_register=False):
+        # Sanitize the username, remove any symbols
+        username = "".join([c for c in username if c in string.ascii_letters + string.digits]).lower()
+
+        # If we don't have any existing account
+        if force_register or not os.path.isfile(f"./{username}.json"):
+            player = await self.get(f"/player/new/{username}")
+            with open(f"./{username}.json", "w") as f:
+                json.dump(player, f, indent=2)
+            print(f"[*] Created player {username}")
+            self.player = player
+
+        # If an account already exists
+        else:
+            with open(f"./{username}.json", "r") as f:
+                self.player = json.load(f)
+            print(f"[*] Loaded data for player {username}")
+
+        # Try to get the profile
+        try:
+            player = await self.get("/player/{}".format(self.player["playerId"]))
+
+        # If we fail, that must be that the player doesn't exist on the server
+        except SimeisError:
+            return await self.setup_player(username, force_register=True)
+
+        if player["money"] <= 0.0:
+            print("!!! Player already lost, please restart the server to reset the game")
+            sys.exit(0)
+
+    async def init_game(self):
+        status = await self.get(f"/player/{self.pid}")
+        self.sta = list(status["stations"].keys())[0]
+        station = await self.getStation()
+
+        if not station.has_crew("Trader"):
+            trader = (await self.get(f"/station/{self.sta}/crew/hire/trader"))["id"]
+            await self.get(f"/station/{self.sta}/crew/assign/{trader}/trading")
+            print("[*] Hired a trader, assigned it on station", self.sta)
+
+        if len(status["ships"]) == 0:
+            available = (await self.get(f"/station/{self.sta}/shipyard/list"))["ships"]
+            cheapest = sorted(available, key = lambda ship: ship["price"])[0]
+            if status["money"] > cheapest["price"]:
+                await self.get(f"/station/{self.sta}/shipyard/buy/" + str(cheapest["id"]))
+            status = await self.get(f"/player/{self.pid}")
+
+        for ship in status["ships"]:
+            if not check_has(ship["crew"], "member_type", "Pilot"):
+                pilot = (await self.get(f"/station/{self.sta}/crew/hire/pilot"))["id"]
+                await self.get(f"/station/{self.sta}/crew/assign/{pilot}/{ship['id']}/pilot")
+                print("[*] Hired a pilot, assigned it on ship", ship["id"])
+
+        print("[*] Game initialisation finished successfully")
+
+    async def getStation(self):
+        return Station(await self.get(f"/station/{self.sta}"))
+
+    async def getPlayer(self):
+        return Player(await self.get(f"/player/{self.pid}"))
+
+    async def moneyPlayer(self):
+        return (await self.get(f"/player/{self.pid}"))["money"]
+
+    async def moduleList(self):
+        return await self.get(f"/station/{self.sta}/shop/modules")
+
+    async def infoVaisseaux(self, idVaisseaux):
+        ship = (await self.getPlayer()).ship(idVaisseaux)
+        return [] if ship is None else [ship]
+
+    async def checkStatusVaisseau(self):
+        return (await self.getPlayer()).ships
+
+    async def travel(self, sid, pos):
+        costs = await self.get(f"/ship/{sid}/navigate/{pos[0]}/{pos[1]}/{pos[2]}")
+        print("[*] Traveling to {}, will take {}".format(pos, costs["duration"]))
+        self.scheduler.expect(sid, costs["duration"])
+        return costs
+
+    # Sleeps until the expected end of the action of the ship, then a single request confirms it
+    async def wait_idle(self, sid, ts=2):
+        remaining = self.scheduler.remaining(sid)
+        if remaining is not None:
+            await asyncio.sleep(remaining)
+        ship = await self.get(f"/ship/{sid}")
+        while ship["state"] != "Idle":
+            await asyncio.sleep(ts)
+            ship = await self.get(f"/ship/{sid}")
+        self.scheduler.cancel(sid)
+
+    async def buyMiningModule(self, modtype, vaisseau):
+        paths = [f"/station/{self.sta}/shop/modules/{vaisseau['id']}/buy/{modtype}"]
+
+        # If the ship has no operator, hire one and assign it to the mining module
+        if not as_ship(vaisseau).has_crew("Operator"):
+            paths.append(f"/station/{self.sta}/crew/hire/operator")
+            paths.append(f"/station/{self.sta}/crew/assign/{{1.id}}/{vaisseau['id']}/{{0.id}}")
+        await self.batch(paths)
+
+    # Same as Game.scan_planets
+    async def scan_planets(self, force=False):
+        now = time.monotonic()
+        if force or self.scanned_at is None or now - self.scanned_at > SCAN_INTERVAL:
+            self.planets.add((await self.get(f"/station/{self.sta}/scan"))["planets"])
+            self.scanned_at = now
+
+    async def goPlanet(self, vaisseau, planet=None):
+        vaisseau = (await self.infoVaisseaux(vaisseau['id']))[0]
+
+        has_miner = vaisseau.has_module("Miner")
+        has_gas = vaisseau.has_module("GasSucker")
+
+        # No module, check if we can buy one
+        if not has_miner and not has_gas:
+            modules_shop, money = await asyncio.gather(self.moduleList(), self.moneyPlayer())
+            if money < min(modules_shop['GasSucker'], modules_shop['Miner']):
+                print("[!] Aucun module installé et pas assez d'argent pour en acheter.")
+                return False
+
+        if planet is None:
+            # Only look at the planets we can mine with our modules
+            await self.scan_planets()
+            solid = None if has_miner == has_gas else has_miner
+            planets = self.planets.nearest(vaisseau.position, 1, solid)
+
+            if not planets:
+                print("[!] Aucune planète compatible avec les modules du vaisseau.")
+                return False
+            planet = planets[0]
+
+            # No module yet, buy the one matching the planet
+            if not has_miner and not has_gas:
+                modtype = "Miner" if planet.solid else "GasSucker"
+                await self.buyMiningModule(modtype, vaisseau)
+
+            print("[*] Planète ciblée :", planet["position"])
+
+        await self.travel(vaisseau.id, planet["position"])
+        return True
+
+    async def startMinage(self, vaisseau):
+        info = await self.get(f"/ship/{vaisseau.id}/extraction/start")
+        print("[*] Starting extraction:")
+        for res, amnt in info.items():
+            print(f"\t- Extraction of {res}: {amnt}/sec")
+        self.scheduler.expect_extraction(vaisseau.id, info, vaisseau.cargo, await self.get("/resources"))
+
+    # Buy the missing resource in the station cargo, then apply it on the ship
+    async def ship_maintenance(self, vaisseauid, resource, needed, action, key):
+        req = int(needed)
+        if req == 0:
+            return
+
+        async with self.station_cargo:
+            station = (await self.getStation())["cargo"]
+            stock = station["resources"].get(resource, 0)
+            if stock < req:
+                bought = await self.get(f"/market/{self.sta}/buy/{resource}/{req - stock}")
+                print(f"[*] Bought {req - stock} of {resource} for", bought["removed_money"])
+                stock = (await self.getStation())["cargo"]["resources"].get(resource, 0)
+
+            if stock > 0:
+                done = await self.get(f"/station/{self.sta}/{action}/{vaisseauid}")
+                print(f"[*] {action}: {done[key]} {resource} used on the ship")
+
+    async def ship_repair(self, vaisseauid):
+        ship = await self.get(f"/ship/{vaisseauid}")
+        await self.ship_maintenance(vaisseauid, "HullPlate", ship["hull_decay"], "repair", "added-hull")
+
+    async def ship_refuel(self, vaisseauid):
+        ship = await self.get(f"/ship/{vaisseauid}")
+        await self.ship_maintenance(vaisseauid, "Fuel", ship["fuel_tank_capacity"] - ship["fuel_tank"], "refuel", "added-fuel")
+
+    async def unloadAndSell(self, vaisseau):
+        station = await self.getStation()
+
+        if vaisseau.position != station.position:
+            print("Erreur de position :", vaisseau.id)
+
+        # Each resource must be unloaded before being sold, all in a single request
+        cargo = [(res, amnt) for res, amnt in vaisseau.cargo.resources.items() if amnt != 0.0]
+        async with self.station_cargo:
+            results = await self.batch([
+                path
+                for res, amnt in cargo
+                for path in (f"/ship/{vaisseau.id}/unload/{res}/{amnt}", f"/market/{self.sta}/sell/{res}/{amnt}")
+            ])
+        for i, (res, amnt) in enumerate(cargo):
+            unloaded, sold = results[2 * i], results[2 * i + 1]
+            print("[*] Unloaded and sold {} of {}, for {} credits".format(
+                unloaded["unloaded"], res, sold["added_money"]
+            ))
+
+        # Both use the station cargo, don't run them concurrently
+        await self.ship_repair(vaisseau.id)
+        await self.ship_refuel(vaisseau.id)
+
+    # Returns the money of the player if we can pay `price` and still survive 500 secs
+    async def can_afford(self, price):
+        status = await self.get(f"/player/{self.pid}")
+        return price < status["money"] and int((status["money"] - price) / status["costs"]) > 500
+
+    async def ship_docked(self, sid):
+        ship, station = await asyncio.gather(self.get(f"/ship/{sid}"), self.getStation())
+        return ship["position"] == station.position
+
+    async def buy_module_upgrade(self, sid):
+        if not await self.ship_docked(sid):
+            return
+
+        listUpgrade = await self.get(f"/station/{self.sta}/shop/modules/{sid}/upgrade")
+        for module_id, module_info in listUpgrade.items():
+            if await self.can_afford(module_info['price']):
+                await self.get(f"/station/{self.sta}/shop/modules/{sid}/upgrade/{module_id}")
+                print("[*] Fonds suffisants, module {} upgrade".format(module_info['module-type']))
+            else:
+                print("[*] Fonds insuffisants")
+
+    async def buy_ship_upgrade(self, sid):
+        if not await self.ship_docked(sid):
+            return
+
+        listUpgrade = await self.get(f"/station/{self.sta}/shipyard/upgrade")
+        for upgrade in ['ReactorUpgrade', 'CargoExpansion']: # HullUpgrade
+            if await self.can_afford(listUpgrade[upgrade]['price']):
+                await self.get(f"/station/{self.sta}/shipyard/upgrade/{sid}/{upgrade}")
+                print("[*] Fonds suffisants, {} upgrade".format(upgrade))
+            else:
+                print("[*] Fonds insuffisants pour {}".format(upgrade))
+
+    async def buy_human_upgrade(self, sid):
+        if not await self.ship_docked(sid):
+            return
+
+        upgradeListEquipage = await self.get(f"/station/{self.sta}/crew/upgrade/ship/{sid}")
+        for crew_id, info in upgradeListEquipage.items():
+            if info["member-type"] != "Operator":
+                continue
+            if await self.can_afford(info["price"]):
+                await self.get(f"/station/{self.sta}/crew/upgrade/ship/{sid}/{crew_id}")
+                print("[*] Operator upgrade")
+            else:
+                print("[*] Fonds insuffisants pour upgrader l'operator")
+
+    async def shipAction(self, vaisseau, station):
+        if not vaisseau.idle:
+            # A busy ship we know nothing about (e.g. when starting the bot), check it later
+            if not self.scheduler.pending(vaisseau.id):
+                self.scheduler.expect(vaisseau.id, RECHECK_DELAY)
+            return
+
+        # Upgrades share the money of the player, one ship at a time checks it and buys them
+        async with self.shopping:
+            await self.buy_module_upgrade(vaisseau.id)
+            await self.buy_ship_upgrade(vaisseau.id)
+            await self.buy_human_upgrade(vaisseau.id)
+
+        if vaisseau.position != station.position:
+            if vaisseau.cargo.full:
+                await self.travel(vaisseau.id, station.position)
+            else:
+                await self.startMinage(vaisseau)
+        elif vaisseau.cargo.usage < 10:
+            if not await self.goPlanet(vaisseau):
+                self.scheduler.expect(vaisseau.id, RECHECK_DELAY)
+        else:
+            await self.unloadAndSell(vaisseau)
+
+        # Still idle (e.g. just unloaded), handle it again right away
+        if not self.scheduler.pending(vaisseau.id):
+            self.scheduler.expect(vaisseau.id, 0)
+
+    # Same as Game.ActionToDo, but all the ships are handled concurrently
+    async def ActionToDo(self):
+        vaisseaux, station = await asyncio.gather(self.checkStatusVaisseau(), self.getStation())
+        results = await asyncio.gather(
+            *[self.shipAction(vaisseau, station) for vaisseau in vaisseaux],
+            return_exceptions=True,
+        )
+        for vaisseau, res in zip(vaisseaux, results):
+            if isinstance(res, Exception):
+                print(f"[!] Ship {vaisseau.id}: {res!r}")
+                self.metrics.failure("shipAction", res)
+
+    # Sleeps until the earliest deadline of our ships
+    async def wait_next_ship(self, timeout=RECHECK_DELAY):
+        delay = self.scheduler.next_delay()
+        await asyncio.sleep(timeout if delay is None else min(delay, timeout))
+        return self.scheduler.pop_due()
+
+async def main(name, concurrency, metrics_port=None):
+    game = await AsyncGame(name, concurrency=concurrency, metrics_port=metrics_port).connect()
+    await game.init_game()
+    try:
+        while True:
+            await game.ActionToDo()
+            await game.wait_next_ship()
+    finally:
+        game.pool.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: async_game.py <playername> [concurrency] [metrics_port]")
+        sys.exit(1)
+
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    metrics_port = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    try:
+        asyncio.run(main(sys.argv[1], concurrency, metrics_port))
+    except KeyboardInterrupt:
+        print("\nExiting...")
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import multiprocessing
+
+try:
+    from .player import Game, URL, RECHECK_DELAY, SimeisError
+    from .metrics import Metrics
+except ImportError:
+    from player import Game, URL, RECHECK_DELAY, SimeisError
+    from metrics import Metrics
+
+# Load generation against a local server
+#     - N players play the usual game (setup, buy ship, mine, sell) at the same time
+#     - The players are split over a pool of processes, each process runs its players in threads
+#     - The metrics of all the players are merged, one round per value of N
+#     - The results are saved as JSON, so that the runs can be compared
+#     - With --server, the release build is started if nothing answers on URL, and stopped at the end
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_COMMAND = ["cargo", "run", "--release", "--package", "simeis-server"]
+
+# Game also recording how late the server finishes the flights of our ships
+# The end of a flight is expected at (time the navigate request is sent + its duration),
+# the lag is the difference with the timestamp of the ShipFlightFinished event in the syslogs
+class BenchGame(Game):
+    def __init__(self, username):
+        self.flights = {}
+        self.lags = []
+        super().__init__(username)
+        self.events.listeners.append(self.on_events)
+
+    def travel(self, sid, pos):
+        tsent = time.time()
+        costs = super().travel(sid, pos)
+        self.flights[sid] = tsent + costs["duration"]
+        return costs
+
+    def on_events(self, events):
+        for ev in events:
+            if ev["type"] != "ShipFlightFinished":
+                continue
+            expected = self.flights.pop(ev["event"][ev["type"]], None)
+            if expected is not None:
+                self.lags.append(ev["timestamp"] - expected)
+
+def play(name, duration, results):
+    tstart = time.monotonic()
+    try:
+        game = BenchGame(name)
+        game.init_game()
+    except Exception as e:
+        results.append({"name": name, "setup_error": repr(e)})
+        return
+
+    deadline = tstart + duration
+    while True:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            break
+        try:
+            game.ActionToDo()
+        except Exception as e:
+            game.metrics.failure("ActionToDo", e)
+        game.wait_next_ship(min(RECHECK_DELAY, left))
+
+    # Needs a request, before the pool is closed. A player that lost can't read its money
+    try:
+        money = game.snapshot.get_player().money
+    except SimeisError as e:
+        game.metrics.failure("get_player", e)
+        money = None
+    game.events.stop()
+    game.pool.close()
+    endpoints, failures = game.metrics.dump()
+    results.append({
+        "name": name,
+        "endpoints": endpoints,
+        "failures": failures,
+        "lags": game.lags,
+        "money": money,
+    })
+
+# Runs in a process of the pool, plays all its players at the same time
+def run_players(names, duration):
+    results = []
+    threads = [
+        threading.Thread(target=play, args=(name, duration, results), daemon=True)
+        for name in names
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+# Each process writes the files of its players in a temporary folder, and doesn't print anything
+def init_worker(workdir, quiet):
+    os.chdir(workdir)
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+
+def percentile(values, q):
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+def run_round(nplayers, duration, processes, run_id, workdir, quiet=True):
+    names = [f"bench{run_id}n{nplayers}p{i}" for i in range(nplayers)]
+    processes = max(1, min(processes, nplayers))
+    groups = [names[i::processes] for i in range(processes)]
+
+    tstart = time.monotonic()
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(workdir, quiet)) as pool:
+        per_process = pool.starmap(run_players, [(group, duration) for group in groups])
+    elapsed = time.monotonic() - tstart
+
+    metrics = Metrics()
+    lags = []
+    setup_errors = []
+    money = []
+    for results in per_process:
+        for res in results:
+            if "setup_error" in res:
+                setup_errors.append(res)
+                continue
+            metrics.merge(res["endpoints"], res["failures"])
+            lags += res["lags"]
+            if res["money"] is not None:
+                money.append(res["money"])
+
+    data = metrics.to_json()
+    requests = sum(ep["count"] for ep in data["endpoints"].values())
+    errors = sum(sum(ep["errors"].values()) + ep["timeouts"] for ep in data["endpoints"].values())
+    for ep in data["endpoints"].values():
+        ep["error_rate"] = (sum(ep["errors"].values()) + ep["timeouts"]) / ep["count"]
+
+    return {
+        "players": nplayers,
+        "processes": processes,
+        "duration": duration,
+        "elapsed": elapsed,
+        "requests": requests,
+        "throughput": requests / elapsed,
+        "errors": errors,
+        "error_rate": errors / requests if requests > 0 else None,
+        "endpoints": data["endpoints"],
+        "failures": data["failures"],
+        "tick_lag": {
+            "count": len(lags),
+            "mean": sum(lags) / len(lags) if len(lags) > 0 else None,
+            "p50": percentile(lags, 0.50),
+            "p95": percentile(lags, 0.95),
+            "p99": percentile(lags, 0.99),
+            "max": max(lags) if len(lags) > 0 else None,
+        },
+        "setup_errors": setup_errors,
+        "money": {
+            "min": min(money) if len(money) > 0 else None,
+            "mean": sum(money) / len(money) if len(money) > 0 else None,
+        },
+    }
+
+def fmt_ms(secs):
+    return "-" if secs is None else f"{secs * 1000:.1f}ms"
+
+def print_round(res):
+    print("[*] {} players: {} requests in {:.1f}s, {:.1f} req/s, error rate {}, tick lag p50 {} p95 {}".format(
+        res["players"], res["requests"], res["elapsed"], res["throughput"],
+        "-" if res["error_rate"] is None else f"{res['error_rate'] * 100:.2f}%",
+        fmt_ms(res["tick_lag"]["p50"]), fmt_ms(res["tick_lag"]["p95"]),
+    ))
+    for ep, stats in sorted(res["endpoints"].items(), key=lambda item: -item[1]["count"]):
+        print("\t{:<48} {:>7} p50 {:>9} p95 {:>9} p99 {:>9} err {:.2f}%".format(
+            ep, stats["count"], fmt_ms(stats["p50"]), fmt_ms(stats["p95"]), fmt_ms(stats["p99"]),
+            stats["error_rate"] * 100,
+        ))
+    if len(res["setup_errors"]) > 0:
+        print(f"\t[!] {len(res['setup_errors'])} players could not be created")
+
+def ping(url=URL):
+    try:
+        with urllib.request.urlopen(f"{url}/ping", timeout=1) as resp:
+            return json.loads(resp.read()).get("ping") == "pong"
+    except OSError:
+        return False
+
+# Same as test.harness.TestServer.start & stop, with the release build
+def start_server(timeout=600):
+    if ping():
+        return None
+    proc = subprocess.Popen(SERVER_COMMAND, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while not ping():
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        if time.monotonic() > deadline:
+            stop_server(proc)
+            raise TimeoutError("Server didn't start")
+        time.sleep(0.2)
+    return proc
+
+def stop_server(proc):
+    if proc is None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generation benchmark of a local Simeis server")
+    parser.add_argument("-n", "--players", default="1,2,4,8,16",
+        help="Comma separated numbers of players, one round for each (default: 1,2,4,8,16)")
+    parser.add_argument("-d", "--duration", type=float, default=60, help="Secs of each round (default: 60)")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count(),
+        help="Maximum size of the process pool (default: number of CPUs)")
+    parser.add_argument("-o", "--output", default=None, help="JSON file of the results (default: bench-<date>.json)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Keep the output of the players")
+    parser.add_argument("--server", action="store_true",
+        help="Start the release server if none is running, and stop it at the end")
+    args = parser.parse_args()
+
+    rounds = [int(n) for n in args.players.split(",")]
+    output = args.output or time.strftime("bench-%Y%m%d-%H%M%S.json")
+    # Every run creates new players, the server refuses an existing name
+    run_id = "".join(random.choices(string.ascii_lowercase + string.digits, k=6))
+
+    results = {
+        "url": URL,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "run_id": run_id,
+        "rounds": [],
+    }
+    server = start_server() if args.server else None
+    try:
+        with tempfile.TemporaryDirectory(prefix="simeis-bench-") as workdir:
+            for nplayers in rounds:
+                print(f"[*] Round with {nplayers} players for {args.duration} secs")
+                res = run_round(nplayers, args.duration, args.processes, run_id, workdir, quiet=not args.verbose)
+                print_round(res)
+                results["rounds"].append(res)
+                # Saved after each round, a long run interrupted still has its results
+                with open(output, "w") as f:
+                    json.dump(results, f, indent=2)
+    finally:
+        stop_server(server)
+    print(f"[*] Results saved in {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+
+# Endpoints whose data rarely changes, and how long (in secs) we keep them by default
+CACHED_ENDPOINTS = {
+    "resources": (re.compile(r"^/resources$"), 3600),
+    "shipyard": (re.compile(r"^/station/\d+/shipyard/list$"), 60),
+    "modules": (re.compile(r"^/station/\d+/shop/modules$"), 3600),
+    "upgrades": (re.compile(r"^/station/\d+/shipyard/upgrade$"), 3600),
+    "scan": (re.compile(r"^/station/\d+/scan$"), 300),
+}
+
+# Actions that modify the state of a station, of its market or of its ships
+MUTATING = re.compile(
+    r"/shipyard/(buy|upgrade)/|/shop/modules/\d+/(buy|upgrade)/|/shop/cargo/buy/"
+    r"|/crew/(hire|assign)/|/crew/upgrade/(trader|ship/\d+/)|/(repair|refuel)/|/market/\d+/(buy|sell)/"
+)
+STATION = re.compile(r"^/(?:station|market)/(\d+)/")
+
+# Read-through cache for the replies of the endpoints above
+#     - Each entry expires after the TTL of its endpoint
+#     - When full, the least recently used entry is dropped
+#     - A successful mutating call on a station drops all the entries of this station
+class TTLCache:
+    def __init__(self, maxsize=128, ttls=None):
+        self.maxsize = maxsize
+        self.rules = [
+            (rule, (ttls or {}).get(name, ttl))
+            for name, (rule, ttl) in CACHED_ENDPOINTS.items()
+        ]
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def ttl(self, path):
+        for rule, ttl in self.rules:
+            if rule.match(path):
+                return ttl
+        return None
+
+    # Returns the cached reply, or None if we have to ask the server
+    def get(self, path):
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[path]
+            if self.ttl(path) is not None:
+                self.misses += 1
+            return None
+
+    # Called with every successful reply from the server
+    def update(self, path, reply):
+        ttl = self.ttl(path)
+        with self.lock:
+            if ttl is not None:
+                self.entries[path] = (time.monotonic() + ttl, reply)
+                self.entries.move_to_end(path)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+
+            elif MUTATING.search(path):
+                self.invalidate(path)
+
+    # Called with the paths run by a batch, their replies are never cached
+    def notify(self, path):
+        if MUTATING.search(path):
+            with self.lock:
+                self.invalidate(path)
+
+    def invalidate(self, path):
+        station = STATION.match(path)
+        if station is None:
+            self.entries.clear()
+            return
+        prefix = f"/station/{station.group(1)}/"
+        for key in [k for k in self.entries if k.startswith(prefix)]:
+            del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
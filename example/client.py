@@ -11,20 +11,64 @@ import string
 import urllib.request
 import threading
 
+try:
+    from .transport import ConnectionPool
+    from .cache import TTLCache
+    from .snapshot import Snapshot
+    from .events import SyslogDispatcher
+    from .stream import EventStream
+    from .scheduler import Scheduler
+    from .metrics import Metrics
+    from .spatial import PlanetIndex
+    from .history import PriceHistory, HISTORY_PATH, HISTORY_MAX_AGE
+    from .models import loads
+except ImportError:
+    from transport import ConnectionPool
+    from cache import TTLCache
+    from snapshot import Snapshot
+    from events import SyslogDispatcher
+    from stream import EventStream
+    from scheduler import Scheduler
+    from metrics import Metrics
+    from spatial import PlanetIndex
+    from history import PriceHistory, HISTORY_PATH, HISTORY_MAX_AGE
+    from models import loads
+
 class SimeisError(Exception):
     pass
 
+# A path of a batch failed, `results` are the ones of the paths run before it
+class BatchError(SimeisError):
+    def __init__(self, msg, index, results):
+        super().__init__(msg)
+        self.index = index
+        self.results = results
+
 # Théorème de Pythagore pour récupérer la distance entre 2 points dans l'espace 3D
 def get_dist(a, b):
     return math.sqrt(((a[0] - b[0]) ** 2) + ((a[1] - b[1]) ** 2) + ((a[2] - b[2]) ** 2))
 
 # Check if types are present in the list
 def check_has(alld, key, *req):
-    alltypes = [c[key] for c in alld.values()]
-    return all([k in alltypes for k in req])
+    return {c[key] for c in alld.values()}.issuperset(req)
 
 class Game:
-    def __init__(self, username):
+    def __init__(self, username, pool_size=4, cache_ttls=None, snapshot_interval=0.5, metrics_port=None, pool=None):
+        # Keep-alive connections shared by all the threads using this game
+        # (or anything with the same `request`, like simulator.SimPool to play offline)
+        self.pool = ConnectionPool(URL, size=pool_size) if pool is None else pool
+        # Latency & errors of our requests, per endpoint
+        self.metrics = Metrics()
+        if metrics_port is not None:
+            self.metrics.serve(metrics_port)
+        # Catalog data (resources, shipyard, shop, scan), see cache.CACHED_ENDPOINTS for the TTLs
+        self.cache = TTLCache(ttls=cache_ttls)
+        # All the planets seen in our scans
+        self.planets = PlanetIndex()
+        # Market prices recorded by watch_game.py, opened when first needed
+        self.history = None
+        # Our player & station, fetched at most once every `snapshot_interval` secs
+        self.snapshot = Snapshot(self, interval=snapshot_interval)
         # Init connection & setup player
         assert self.get("/ping")["ping"] == "pong"
         print("[*] Connection to server OK")
@@ -34,8 +78,21 @@ class Game:
         self.pid = self.player["playerId"] # ID of our player
         self.sid = None    # ID of our ship
         self.sta = None    # ID of our station
+        # Expected end of the actions of our ships
+        self.scheduler = Scheduler()
+        # Ship events from the syslogs, wakes up wait_idle
+        self.events = SyslogDispatcher(self).start()
+        # Prices & events pushed by the server, see start_stream()
+        self.stream = None
 
     def get(self, path, **qry):
+        # Catalog endpoints are served from the cache while they are fresh
+        reply = self.cache.get(path) if len(qry) == 0 else None
+        if reply is not None:
+            data = loads(reply)
+            data.pop("error")
+            return data
+
         if hasattr(self, "player"):
             qry["key"] = self.player["key"]
 
@@ -46,20 +103,55 @@ class Game:
                 "{}={}".format(k, urllib.parse.quote(v)) for k, v in qry.items()
             ])
 
-        qry = f"{URL}{path}{tail}"
-        reply = urllib.request.urlopen(qry, timeout=1)
-
-        data = json.loads(reply.read().decode())
-        err = data.pop("error")
+        reply, data, err = self.send(path, tail)
         if err != "ok":
             raise SimeisError(err)
 
+        self.cache.update(path, reply)
+        self.snapshot.notify(path)
         return data
 
+    # Send the request, its latency, size and error are recorded in self.metrics
+    def send(self, path, tail=""):
+        tstart = time.perf_counter()
+        try:
+            reply = self.pool.request(f"{path}{tail}")
+        except TimeoutError:
+            self.metrics.record(path, time.perf_counter() - tstart, timeout=True)
+            raise
+        except Exception as e:
+            self.metrics.record(path, time.perf_counter() - tstart, error=type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - tstart
+
+        data = loads(reply)
+        err = data.pop("error")
+        # The type of the error is like "ShipNotFound(42)", only keep its name
+        code = None if err == "ok" else data.get("type", err).split("(")[0]
+        self.metrics.record(path, elapsed, len(reply), error=code)
+        return reply, data, err
+
+    # Runs the paths in order, in a single request to the server
+    # A part "{N.field}" of a path is replaced by the field of the result of the Nth path
+    def batch(self, paths):
+        if len(paths) == 0:
+            return []
+        key = urllib.parse.quote(self.player["key"])
+        qry = urllib.parse.quote(json.dumps(paths, separators=(",", ":")))
+        _, data, err = self.send("/batch", f"?key={key}&paths={qry}")
+
+        results = data.get("results", [])
+        for path in paths[:len(results)]:
+            self.cache.notify(path)
+            self.snapshot.notify(path)
+        if err != "ok":
+            raise BatchError(err, data.get("index"), results)
+        return results
+
     def disp_status(self):
-        status = self.get("/player/" + str(self.pid))
+        status = self.snapshot.get_player()
         print("[*] Current status: {} credits, costs: {}, time left before lost: {} secs".format(
-            round(status["money"], 2), round(status["costs"], 2), int(status["money"] / status["costs"]),
+            round(status.money, 2), round(status.costs, 2), int(status.lifetime),
         ))
 
     # If we have a file containing the player ID and key, use it
@@ -110,35 +202,49 @@ class Game:
     def buy_first_mining_module(self, modtype, sta, sid):
         # Buy the mining module
         all = self.get(f"/station/{sta}/shop/modules")
-        mod_id = self.get(f"/station/{sta}/shop/modules/{sid}/buy/{modtype}")["id"]
+        paths = [f"/station/{sta}/shop/modules/{sid}/buy/{modtype}"]
 
         # Check if we have the crew assigned on this module
         # If not, hire an operator, and assign it to the mining module of our ship
         ship = self.get(f"/ship/{sid}")
         if not check_has(ship["crew"], "member_type", "Operator"):
-            op = self.get(f"/station/{sta}/crew/hire/operator")["id"]
-            self.get(f"/station/{sta}/crew/assign/{op}/{sid}/{mod_id}")
+            paths.append(f"/station/{sta}/crew/hire/operator")
+            paths.append(f"/station/{sta}/crew/assign/{{1.id}}/{sid}/{{0.id}}")
+        self.batch(paths)
 
     def hire_pilot(self, sta, ship):
         # Hire a pilot, and assign it to our ship
-        pilot = self.get(f"/station/{sta}/crew/hire/pilot")["id"]
-        self.get(f"/station/{sta}/crew/assign/{pilot}/{ship}/pilot")
+        self.batch([
+            f"/station/{sta}/crew/hire/pilot",
+            f"/station/{sta}/crew/assign/{{0.id}}/{ship}/pilot",
+        ])
 
     def hire_trader(self, sta):
         # Hire a trader, assign it on our station
-        trader = self.get(f"/station/{sta}/crew/hire/trader")["id"]
-        self.get(f"/station/{sta}/crew/assign/{trader}/trading")
+        self.batch([
+            f"/station/{sta}/crew/hire/trader",
+            f"/station/{sta}/crew/assign/{{0.id}}/trading",
+        ])
 
     def travel(self, sid, pos):
         costs = self.get(f"/ship/{sid}/navigate/{pos[0]}/{pos[1]}/{pos[2]}")
         print("[*] Traveling to {}, will take {}".format(pos, costs["duration"]))
-        self.wait_idle(sid, ts=costs["duration"])
+        self.scheduler.expect(sid, costs["duration"])
+        self.wait_idle(sid)
 
-    def wait_idle(self, sid, ts=2):
-        ship = self.get(f"/ship/{sid}")
-        while ship["state"] != "Idle":
-            time.sleep(ts)
+    # Sleeps until the expected end of the action of the ship, then a single request confirms it
+    # The syslog events can wake us up earlier, `ts` is only used when the deadline was missed
+    def wait_idle(self, sid, ts=10):
+        while True:
+            marker = self.events.marker(sid)
+            remaining = self.scheduler.remaining(sid)
+            if remaining is not None and remaining > 0:
+                self.events.wait(sid, marker, remaining)
             ship = self.get(f"/ship/{sid}")
+            if ship["state"] == "Idle":
+                self.scheduler.cancel(sid)
+                return
+            self.events.wait(sid, marker, ts)
 
     # Repair the ship:     Buy the plates, then ask for reparation
     def ship_repair(self, sid):
@@ -235,11 +341,8 @@ class Game:
         station = self.get(f"/station/{self.sta}")
 
         # Scan the galaxy sector, detect which planet is the nearest
-        station = self.get(f"/station/{self.sta}")
-        planets = self.get(f"/station/{self.sta}/scan")["planets"]
-        nearest = sorted(planets,
-            key=lambda pla: get_dist(station["position"], pla["position"])
-        )[0]
+        self.planets.add(self.get(f"/station/{self.sta}/scan")["planets"])
+        nearest = self.planets.nearest(station["position"])[0]
 
         # If the planet is solid, we need a Miner to mine it
         # If it's gaseous, we need a GasSucker to mine it
@@ -270,6 +373,7 @@ class Game:
         print("[*] Starting extraction:")
         for res, amnt in info.items():
             print(f"\t- Extraction of {res}: {amnt}/sec")
+        self.scheduler.expect_extraction(self.sid, info, ship["cargo"], self.get("/resources"))
 
         # Wait until the cargo is full
         self.wait_idle(self.sid) # The ship will have the state "Idle" once the cargo is full
@@ -290,21 +394,20 @@ class Game:
 
 
     def costPerSecond(self):
-        return self.get(f"/player/{self.pid}")["costs"]
+        return self.snapshot.get_player().costs
     
     def moneyPlayer(self):
-        return self.get(f"/player/{self.pid}")["money"]
+        return self.snapshot.get_player().money
     
     def lifeTime(self):
-        player =  self.get(f"/player/{self.pid}")
-        return player["money"] / player["costs"]
+        return self.snapshot.get_player().lifetime
     
     def getPriceVaisseaux(self):
         return self.get(f"/station/{self.sta}/shipyard/list")
 
     def infoVaisseaux(self, idVaisseaux):
-        vaisseaux = self.get(f"/player/{self.pid}")["ships"]
-        return list(filter(lambda id: id['id'] == idVaisseaux, vaisseaux))
+        ship = self.snapshot.get_ship(idVaisseaux)
+        return [] if ship is None else [ship]
 
     def trajet(self, idVaisseaux, destination=None):
         if destination == None:
@@ -337,27 +440,28 @@ class Game:
         return(f"\nAffichage Joueur : Player id : {self.pid} \ Player name : {self.username} \n\nBalance : {int(self.moneyPlayer())}\nCoût par seconde : {round(self.costPerSecond(), 2)} \nTemps de vie restant : {int(self.lifeTime())} secondes\n")
 
     def getShipsInfo(self):
-        ships = list(self.get(f"/player/{self.pid}")["ships"])
+        ships = self.snapshot.get_player().ships
         return f"Nombre de vaisseaux : {len(ships)}, {ships}"
 
     def go_sell(self):
         self.wait_idle(self.sid) # If we are currently occupied, wait
         ship = self.get(f"/ship/{self.sid}")
         station = self.get(f"/station/{self.sta}")
-        status = game.get("/player/" + str(game.pid))
+        status = self.snapshot.get_player()
 
         # If we aren't at the station, got there
         if ship["position"] != station["position"]:
             self.travel(ship["id"], station["position"])
 
-        # Unload the cargo and sell it directly on the market
-        for res, amnt in ship["cargo"]["resources"].items():
-            if amnt == 0.0:
-                continue
-
-            unloaded = self.get(f"/ship/{self.sid}/unload/{res}/{amnt}")
-            sold = self.get(f"/market/{self.sta}/sell/{res}/{amnt}")
-
+        # Unload the cargo and sell it directly on the market, all in a single request
+        cargo = [(res, amnt) for res, amnt in ship["cargo"]["resources"].items() if amnt != 0.0]
+        results = self.batch([
+            path
+            for res, amnt in cargo
+            for path in (f"/ship/{self.sid}/unload/{res}/{amnt}", f"/market/{self.sta}/sell/{res}/{amnt}")
+        ])
+        for i, (res, amnt) in enumerate(cargo):
+            unloaded, sold = results[2 * i], results[2 * i + 1]
             print("[*] Unloaded and sold {} of {}, for {} credits".format(
                 unloaded["unloaded"], res, sold["added_money"]
             ))
@@ -376,10 +480,33 @@ class Game:
         self.ship_repair(self.sid)
         self.ship_refuel(self.sid)
 
+    # Prices & events pushed by the server on /stream, instead of polling them
+    def start_stream(self):
+        self.stream = EventStream(URL, key=self.player["key"])
+        self.events.follow(self.stream)
+        self.stream.start()
+        return self.stream
+
+    # Prices pushed on the stream, or from the history of watch_game.py when it is running,
+    # no request needed
+    def market_prices(self):
+        if self.stream is not None:
+            prices = self.stream.last_prices()
+            if prices is not None:
+                return prices
+        if self.history is None and os.path.isdir(HISTORY_PATH):
+            self.history = PriceHistory(HISTORY_PATH, readonly=True)
+        if self.history is not None:
+            self.history.refresh()
+            prices = self.history.prices(max_age=HISTORY_MAX_AGE)
+            if prices is not None:
+                return prices
+        return self.get("/market/prices")["prices"]
+
     def view_trader_prices(self):
                 
         resources = self.get("/resources")
-        market_prices = self.get("/market/prices")["prices"]
+        market_prices = self.market_prices()
 
         print("[*] Minerais avec taux > 110% :")
         found_high = False
@@ -408,20 +535,20 @@ class Game:
             print("Aucun minerai < 90%")
 
     def buy_module_upgrade(self):
-        ship = self.get(f"/ship/{self.sid}")
-        station = self.get(f"/station/{self.sta}")
+        ship = self.snapshot.get_ship(self.sid)
+        station = self.snapshot.get_station()
 
-        if (ship["position"] == station["position"]):
+        if ship is not None and ship.position == station.position:
 
             print("[*] Verification de la possibilité d'achat d'une upgrade de module")
-            status = game.get("/player/" + str(game.pid))
+            status = self.snapshot.get_player()
             print("[*] Money : {} , Temps avant defaite: {}".format(
-                round(status["money"], 2), int(status["money"] / status["costs"])
+                round(status.money, 2), int(status.lifetime)
             ))
 
             listUpgrade = self.get(f"/station/{self.sta}/shop/modules/{self.sid}/upgrade")
             for module_id, module_info in listUpgrade.items():
-                if (module_info['price'] < status['money'] and (int((status["money"] - module_info['price']) / status["costs"]) > 500)):
+                if (module_info['price'] < status.money and (int((status.money - module_info['price']) / status.costs) > 500)):
                     upgrade = self.get(f"/station/{self.sta}/shop/modules/{self.sid}/upgrade/1")
                     print("[*] Fonds suffisants, module {} upgrade".format(
                         module_info['module-type']
@@ -431,19 +558,19 @@ class Game:
 
     
     def buy_ship_upgrade(self):
-        ship = self.get(f"/ship/{self.sid}")
-        station = self.get(f"/station/{self.sta}")
+        ship = self.snapshot.get_ship(self.sid)
+        station = self.snapshot.get_station()
 
-        if (ship["position"] == station["position"]):
+        if ship is not None and ship.position == station.position:
             print("[*] Verification de la possibilité d'achat d'une upgrade vaisseau")
             listInterestedUpgrade = ['ReactorUpgrade', 'CargoExpansion'] # HullUpgrade
             listUpgrade = self.get(f"/station/{self.sta}/shipyard/upgrade")
 
             for upgrade in listInterestedUpgrade:
                 tryUpgrade = listUpgrade[upgrade]
-                status = game.get("/player/" + str(game.pid))
+                status = self.snapshot.get_player()
 
-                if (tryUpgrade['price'] < status['money'] and (int((status["money"] - tryUpgrade['price']) / status["costs"]) > 500)):
+                if (tryUpgrade['price'] < status.money and (int((status.money - tryUpgrade['price']) / status.costs) > 500)):
 
                     buyUpgrade = self.get(f"/station/{self.sta}/shipyard/upgrade/{self.sid}/{upgrade}")
                     print("[*] Fonds suffisants, {} upgrade".format(
@@ -455,10 +582,10 @@ class Game:
                     ))
 
     def buy_human_upgrade(self):
-        ship = self.get(f"/ship/{self.sid}")
-        station = self.get(f"/station/{self.sta}")
+        ship = self.snapshot.get_ship(self.sid)
+        station = self.snapshot.get_station()
 
-        if (ship["position"] == station["position"]):
+        if ship is not None and ship.position == station.position:
             print("[*] Verification de la possibilité d'achat d'une upgrade equipage")
             upgradeListEquipage = self.get(f"/station/{self.sta}/crew/upgrade/ship/{self.sid}")
             operator_id = None
@@ -467,8 +594,8 @@ class Game:
                     operator_id = crew_id
                     operator_price = info["price"]
                     
-                    status = game.get("/player/" + str(game.pid))
-                    if operator_price < status["money"] and int((status["money"] - operator_price) / status["costs"]) > 500:
+                    status = self.snapshot.get_player()
+                    if operator_price < status.money and int((status.money - operator_price) / status.costs) > 500:
                         upgradeEquipage = self.get(f"/station/{self.sta}/crew/upgrade/ship/{self.sid}/{operator_id}")
                         print("[*] Operator upgrade")
                     else:
@@ -476,19 +603,27 @@ class Game:
 
 if __name__ == "__main__":
     name = sys.argv[1]
-    game = Game(name)
+    # Optional port to expose the metrics of our requests on
+    metrics_port = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    game = Game(name, metrics_port=metrics_port)
     game.init_game()
 
     stop_threads = threading.Event()
+    stream = game.start_stream()
 
+    # Shown when the server pushes new prices (at most every 5 secs), or every 5 secs if it can't
     def view_prices():
+        version = 0
         while not stop_threads.is_set():
             try:
+                if stream.ok:
+                    version = stream.wait(version, timeout=30)
                 print("\n[PRICES TRADER] Vérification des prix...")
                 game.view_trader_prices()
                 time.sleep(5)
             except Exception as e:
                 print(f"[PRICES TRADER] Erreur: {e}")
+                game.metrics.failure("view_prices", e)
                 time.sleep(5)
 
     def main():
@@ -502,6 +637,7 @@ if __name__ == "__main__":
                 game.go_sell()
             except Exception as e:
                 print(f"[MAIN] Erreur: {e}")
+                game.metrics.failure("main", e)
                 time.sleep(5)
 
     price_thread = threading.Thread(target=view_prices, daemon=True, name="PriceMonitor")
@@ -516,5 +652,6 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("\n[*] Arrêt...")
         stop_threads.set()
+        stream.stop()
         price_thread.join(timeout=5)
         main_thread.join(timeout=5)
\ No newline at end of file
@@ -0,0 +1,126 @@
+import time
+import threading
+
+# Events of the syslog telling that a ship is no longer busy
+SHIP_EVENTS = ("ShipFlightFinished", "ExtractionStopped", "ShipDestroyed")
+
+# How long a read of the syslog waits on the server for an event, below the timeout of the
+# connections of the pool (1 sec by default)
+LONG_POLL_WAIT = 0.8
+
+# Reads the syslog of our player from a cursor (/syslogs?since=<seq>&wait=<ms>)
+#     - Every event has a sequence number, the next read starts after the last one received,
+#       so nothing is lost as long as the server still keeps it
+#     - `missed` counts the events the server dropped before we could read them
+#     - The server holds the request until an event arrives, or `wait` secs
+#     - An old server ignores `since` & `wait`: it returns all the new events right away
+class SyslogCursor:
+    def __init__(self, game, since=0, wait=LONG_POLL_WAIT):
+        self.game = game
+        self.next = since
+        self.wait = wait
+        self.missed = 0
+
+    def read(self, wait=None):
+        wait = self.wait if wait is None else wait
+        reply = self.game.get(
+            "/syslogs", since=str(self.next), wait=str(int(wait * 1000)))
+        if "next" in reply:
+            self.missed += max(reply["first"] - self.next, 0)
+            self.next = reply["next"]
+        return reply["events"]
+
+    # Every event, forever (or until `stopped` is set)
+    def __iter__(self):
+        return self.follow()
+
+    def follow(self, stopped=None):
+        while stopped is None or not stopped.is_set():
+            yield from self.read()
+
+# Background thread reading /syslogs, wakes up the threads waiting on a ship
+#     - Each ship has a counter of received events, a waiter remembers the value it saw
+#       before asking the ship state, so an event received in between is never missed
+#     - The events are read from a cursor with long-polling (see SyslogCursor), they arrive
+#       as soon as the server has them. A server only keeps the last events, and an old one
+#       doesn't wait: a waiter must still have a timeout
+#     - The functions of `listeners` are given every batch of events received
+#     - With follow(), the events pushed on an EventStream (see stream.py) are used instead, and
+#       /syslogs is only polled while the stream is down
+class SyslogDispatcher:
+    def __init__(self, game, period=0.5, wait=LONG_POLL_WAIT):
+        self.game = game
+        self.period = period
+        self.cursor = SyslogCursor(game, wait=wait)
+        self.stream = None
+        self.cond = threading.Condition()
+        self.counters = {}
+        self.listeners = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True, name="SyslogDispatcher")
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join(timeout=5)
+
+    def follow(self, stream):
+        stream.since = self.cursor.next
+        stream.listeners["syslog"].append(self.on_stream)
+        self.stream = stream
+
+    # An event can come from both sides when the stream (re)connects, it's only dispatched once
+    def on_stream(self, event):
+        if event["seq"] < self.cursor.next:
+            return
+        self.cursor.next = event["seq"] + 1
+        self.dispatch([event])
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.stream is not None and self.stream.connected:
+                self.stopped.wait(self.period)
+                continue
+            tstart = time.monotonic()
+            try:
+                events = self.cursor.read()
+                if self.stream is not None:
+                    self.stream.since = max(self.stream.since, self.cursor.next)
+                self.dispatch(events)
+            except Exception as e:
+                print(f"[SYSLOG] Erreur: {e}")
+                self.game.metrics.failure("syslogs", e)
+                events = []
+            # Nothing came and the server didn't wait, don't poll it in a loop
+            if len(events) == 0 and time.monotonic() - tstart < self.cursor.wait / 2:
+                self.stopped.wait(self.period)
+
+    def dispatch(self, events):
+        for listener in self.listeners:
+            listener(events)
+
+        ships = [ev["event"][ev["type"]] for ev in events if ev["type"] in SHIP_EVENTS]
+        if len(ships) == 0:
+            return
+
+        # The state of our ships changed, the snapshot is outdated
+        self.game.snapshot.invalidate()
+        # These ships are done, no need to wait for their deadline
+        for sid in ships:
+            self.game.scheduler.expect(sid, 0)
+        with self.cond:
+            for sid in ships:
+                self.counters[sid] = self.counters.get(sid, 0) + 1
+            self.cond.notify_all()
+
+    def marker(self, sid):
+        with self.cond:
+            return self.counters.get(sid, 0)
+
+    # Returns True if an event was received for this ship since `marker`
+    def wait(self, sid, marker, timeout):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.counters.get(sid, 0) != marker, timeout)
@@ -0,0 +1,158 @@
+import math
+
+# The forecasts need NumPy, without it the bots simply sell everything right away
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Same as the server (simeis-data/src/market.rs & game.rs)
+MAX_AVG_AMPL = 5.0 / 100.0
+STD_DIV = 1.5
+UPD_PRICE_PROBA = 0.80
+MARKET_CHANGE_SEC = 3.0
+PRICE_INC_DIV = 40000.0
+PRICE_INC_RANGE_MAX = 10.0 / 100.0
+PRICE_INC_MIN_RATIO = 75.0 / 100.0
+ITER_PERIOD = 0.02
+
+# Probabilities of the number of game loop iterations between two updates of the market
+# At each iteration, the market is updated with a probability of
+# (secs since the last update / MARKET_CHANGE_SEC), so it never waits more than MARKET_CHANGE_SEC
+def update_intervals():
+    probs = [0.0]
+    left = 1.0
+    for k in range(1, int(math.ceil(MARKET_CHANGE_SEC / ITER_PERIOD)) + 1):
+        hazard = min(k * ITER_PERIOD / MARKET_CHANGE_SEC, 1.0)
+        probs.append(left * hazard)
+        left *= 1 - hazard
+    total = sum(probs)
+    return [p / total for p in probs]
+
+# Monte Carlo simulation of the prices of the market, many paths at once
+#     - Each update of the market moves a price with a probability UPD_PRICE_PROBA, by a Normal
+#       draw whose mean pulls the price back toward its base price (Market::update_prices)
+#     - A sale lowers the price by a random part of (value / PRICE_INC_DIV * PRICE_INC_RANGE_MAX),
+#       after the sale (Market::sell)
+#     - `hold` compares selling now with selling in N secs, `sliced_sale` and `best_slicing`
+#       compare selling all at once with selling in several parts
+class MarketForecaster:
+    def __init__(self, base_prices, n_paths=10000, seed=None):
+        if np is None:
+            raise RuntimeError("MarketForecaster needs NumPy")
+        self.base_prices = base_prices
+        self.n_paths = n_paths
+        self.rng = np.random.default_rng(seed)
+        self.interval = np.array(update_intervals())
+        # We don't know when the last update was, the wait before the next one is the residual
+        # of an interval: P(wait = r) = P(interval >= r) / mean interval
+        survival = self.interval[::-1].cumsum()[::-1]
+        self.residual = np.concatenate(([0.0], survival[1:])) / (self.interval @ np.arange(len(self.interval)))
+        self.counts = {}
+
+    # Probabilities of the number of updates of the market in the next `ticks` iterations
+    def count_probs(self, ticks):
+        if ticks not in self.counts:
+            ge = [1.0]
+            dist = self.residual[:ticks + 1]
+            while len(ge) < 10000:
+                p = dist.sum()
+                if p < 1e-12:
+                    break
+                ge.append(p)
+                dist = np.convolve(dist, self.interval)[:ticks + 1]
+            ge.append(0.0)
+            probs = np.clip(-np.diff(ge), 0.0, None)
+            self.counts[ticks] = probs / probs.sum()
+        return self.counts[ticks]
+
+    # Number of moves of the price of each path before each of the `times` (secs from now, sorted)
+    # The updates between two times are drawn as if they were independent, and each update
+    # only moves the price with a probability UPD_PRICE_PROBA
+    def moves(self, times):
+        out = np.zeros((self.n_paths, len(times)), dtype=np.int64)
+        total = np.zeros(self.n_paths, dtype=np.int64)
+        prev = 0.0
+        for j, t in enumerate(times):
+            ticks = int(round((t - prev) / ITER_PERIOD))
+            if ticks > 0:
+                probs = self.count_probs(ticks)
+                updates = self.rng.choice(len(probs), size=self.n_paths, p=probs)
+                total = total + self.rng.binomial(updates, UPD_PRICE_PROBA)
+            out[:, j] = total
+            prev = t
+        return out
+
+    # A move of the price, a Normal draw pulling it back toward its base price
+    def move(self, prices, base):
+        avg = (1.0 - prices / base) * MAX_AVG_AMPL
+        std = np.abs(avg) + (MAX_AVG_AMPL / STD_DIV)
+        return prices * (1.0 + avg + std * self.rng.standard_normal(len(prices)))
+
+    # Highest relative drop of the price after selling `amount` at `price`
+    def max_impact(self, price, amount):
+        return (amount * price / PRICE_INC_DIV) * PRICE_INC_RANGE_MAX
+
+    def sell_impact(self, prices, amount):
+        dec_max = self.max_impact(prices, amount)
+        dec = self.rng.uniform(dec_max * PRICE_INC_MIN_RATIO, dec_max)
+        return prices * (1.0 - dec)
+
+    # Prices of the resource at each of the `times` (secs from now), one row per path
+    def simulate(self, res, price, times):
+        base = self.base_prices[res]
+        order = sorted(range(len(times)), key=lambda j: times[j])
+        moves = self.moves([times[j] for j in order])
+        prices = np.full(self.n_paths, float(price))
+        out = np.empty((self.n_paths, len(times)))
+        for k in range(int(moves.max()) + 1):
+            for i, j in enumerate(order):
+                mask = moves[:, i] == k
+                out[mask, j] = prices[mask]
+            prices = self.move(prices, base)
+        return out
+
+    # Selling `amount` now, or in each of the `horizons` secs
+    def hold(self, res, price, amount, horizons, fee_rate=0.0):
+        now = amount * price * (1 - fee_rate)
+        later = self.simulate(res, price, horizons) * amount * (1 - fee_rate)
+        return [{
+            "secs": secs,
+            "now": now,
+            "mean": float(rev.mean()),
+            "p5": float(np.percentile(rev, 5)),
+            "p50": float(np.percentile(rev, 50)),
+            "p95": float(np.percentile(rev, 95)),
+            "gain": float(rev.mean()) / now - 1 if now > 0 else 0.0,
+            "proba": float((rev > now).mean()),
+        } for secs, rev in zip(horizons, later.T)]
+
+    # Revenue of selling `amount` in `slices` equal parts, one every `interval` secs from now
+    def sliced_sale(self, res, price, amount, slices, interval=MARKET_CHANGE_SEC, fee_rate=0.0):
+        base = self.base_prices[res]
+        part = amount / slices
+        moves = self.moves([s * interval for s in range(slices)])
+        prices = np.full(self.n_paths, float(price))
+        revenue = np.zeros(self.n_paths)
+        for k in range(int(moves.max()) + 1):
+            for s in range(slices):
+                # Only the paths where this part is sold after k updates
+                idx = np.flatnonzero(moves[:, s] == k)
+                if idx.size:
+                    revenue[idx] += part * prices[idx] * (1 - fee_rate)
+                    prices[idx] = self.sell_impact(prices[idx], part)
+            prices = self.move(prices, base)
+        return revenue
+
+    # Number of slices (1 to max_slices) with the best expected revenue, and the stats of each
+    def best_slicing(self, res, price, amount, max_slices=4, interval=MARKET_CHANGE_SEC, fee_rate=0.0):
+        options = {}
+        for slices in range(1, max_slices + 1):
+            rev = self.sliced_sale(res, price, amount, slices, interval, fee_rate)
+            options[slices] = {
+                "mean": float(rev.mean()),
+                "p5": float(np.percentile(rev, 5)),
+                "p95": float(np.percentile(rev, 95)),
+            }
+        best = max(options, key=lambda s: options[s]["mean"])
+        return best, options
@@ -0,0 +1,253 @@
+import os
+import math
+import mmap
+import time
+import struct
+import bisect
+
+# Market price history, one append-only file per resource in `path`
+#     - A file is a header (magic, number of records, time of the last poll) followed by
+#       (timestamp, price) records, it is memory mapped and grows by CHUNK records at a time
+#     - A price is only recorded when it changed, the time of the last poll tells the readers
+#       whether the writer is still running
+#     - The number of records is written after the record, so a reader never sees half of one
+#     - Only the watcher (or a single bot) writes, any number of processes can read the same
+#       folder with `readonly=True` and `refresh()` to get the new records
+#     - The indicators are updated in O(1) for each new record:
+#         - ema: exponential moving average of the price
+#         - volatility: exponential moving std dev of the relative price changes
+#         - ratio & percentile: the price vs the base price, and how often it was lower
+
+# Folder written by watch_game.py, and how old its last poll can be for the bots to trust it
+HISTORY_PATH = "market-history"
+HISTORY_MAX_AGE = 10
+
+MAGIC = b"SIMPRICE"
+HEADER = struct.Struct("<8sQd")
+RECORD = struct.Struct("<dd")
+CHUNK = 4096
+
+# Histogram of price / base price, RATIO_BINS bins of RATIO_STEP (the last one takes everything above)
+RATIO_STEP = 0.01
+RATIO_BINS = 400
+
+class Indicators:
+    __slots__ = ("alpha", "count", "price", "ema", "var", "min", "max", "base", "bins")
+
+    def __init__(self, alpha, base=None):
+        self.alpha = alpha
+        self.count = 0
+        self.price = None
+        self.ema = None
+        self.var = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.base = base
+        self.bins = [0] * RATIO_BINS
+
+    def update(self, price):
+        if self.count == 0:
+            self.ema = price
+        else:
+            self.ema += self.alpha * (price - self.ema)
+            if self.price > 0:
+                change = (price - self.price) / self.price
+                self.var = (1 - self.alpha) * self.var + self.alpha * change * change
+        self.price = price
+        self.count += 1
+        self.min = min(self.min, price)
+        self.max = max(self.max, price)
+        if self.base:
+            self.bins[self.bin(price)] += 1
+
+    def bin(self, price):
+        return max(0, min(int(price / self.base / RATIO_STEP), RATIO_BINS - 1))
+
+    # Part of the history (0 to 1) where the price was lower than the current one
+    # Estimated with the histogram, so it costs RATIO_BINS at most whatever the size of the history
+    def percentile(self):
+        if not self.base or self.count == 0:
+            return None
+        cur = self.bin(self.price)
+        return (sum(self.bins[:cur]) + self.bins[cur] / 2) / self.count
+
+    def to_json(self):
+        return {
+            "count": self.count,
+            "price": self.price,
+            "ema": self.ema,
+            "volatility": math.sqrt(self.var),
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "ratio": self.price / self.base if self.base and self.count else None,
+            "percentile": self.percentile(),
+        }
+
+# The records of a single resource
+class Series:
+    def __init__(self, filename, readonly=False):
+        self.filename = filename
+        self.readonly = readonly
+        self.file = None
+        self.map = None
+        if readonly:
+            if os.path.isfile(filename):
+                self.open()
+            return
+
+        if not os.path.isfile(filename):
+            with open(filename, "wb") as f:
+                f.write(HEADER.pack(MAGIC, 0, 0.0))
+                f.truncate(HEADER.size + CHUNK * RECORD.size)
+        self.open()
+
+    def open(self):
+        self.file = open(self.filename, "rb" if self.readonly else "r+b")
+        access = mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE
+        self.map = mmap.mmap(self.file.fileno(), 0, access=access)
+        magic, _, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.filename} is not a price history")
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+    def capacity(self):
+        return (len(self.map) - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        if self.map is None:
+            if not self.readonly or not os.path.isfile(self.filename):
+                return 0
+            self.open()
+        n = HEADER.unpack_from(self.map, 0)[1]
+        # The writer made the file bigger, map it again to see the new records
+        if n > self.capacity():
+            self.close()
+            self.open()
+        return n
+
+    def updated(self):
+        if self.map is None:
+            return 0.0
+        return HEADER.unpack_from(self.map, 0)[2]
+
+    def append(self, ts, price=None):
+        n = len(self)
+        if price is not None:
+            if n == self.capacity():
+                self.map.close()
+                self.file.truncate(HEADER.size + (n + CHUNK) * RECORD.size)
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE)
+            RECORD.pack_into(self.map, HEADER.size + n * RECORD.size, ts, price)
+            n += 1
+        HEADER.pack_into(self.map, 0, MAGIC, n, ts)
+
+    def __getitem__(self, i):
+        return RECORD.unpack_from(self.map, HEADER.size + i * RECORD.size)
+
+    def timestamp(self, i):
+        return self[i][0]
+
+    # Records [start, end) as a list of (timestamp, price)
+    def records(self, start=0, end=None):
+        end = len(self) if end is None else end
+        if start >= end:
+            return []
+        view = memoryview(self.map)[HEADER.size + start * RECORD.size:HEADER.size + end * RECORD.size]
+        try:
+            return list(RECORD.iter_unpack(view))
+        finally:
+            view.release()
+
+    # Index of the first record at or after `ts` (the timestamps only grow)
+    def find(self, ts):
+        n = len(self)
+        return bisect.bisect_left(range(n), ts, key=self.timestamp)
+
+class PriceHistory:
+    def __init__(self, path=HISTORY_PATH, base_prices=None, span=20, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.alpha = 2 / (span + 1)
+        self.base_prices = base_prices or {}
+        self.series = {}
+        self.indicators = {}
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        self.refresh()
+
+    def get_series(self, res):
+        if res not in self.series:
+            self.series[res] = Series(os.path.join(self.path, f"{res}.bin"), readonly=self.readonly)
+            self.indicators[res] = Indicators(self.alpha, self.base_prices.get(res))
+        return self.series[res]
+
+    # Opens the files created since the last call, and updates the indicators with the new records
+    # Returns the number of new records
+    def refresh(self):
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                if name.endswith(".bin"):
+                    self.get_series(name[:-len(".bin")])
+
+        new = 0
+        for res, series in self.series.items():
+            ind = self.indicators[res]
+            for _, price in series.records(ind.count):
+                ind.update(price)
+                new += 1
+        return new
+
+    # Adds the prices of /market/prices, only the ones that changed since the last record
+    def append(self, prices, ts=None):
+        if self.readonly:
+            raise PermissionError("Price history opened read-only")
+        ts = time.time() if ts is None else ts
+        for res, price in prices.items():
+            series = self.get_series(res)
+            ind = self.indicators[res]
+            if ind.count > 0 and ind.price == price:
+                series.append(ts)
+                continue
+            series.append(ts, price)
+            ind.update(price)
+
+    # Time of the last poll of the writer, 0 if nothing was ever written
+    def updated(self):
+        return max([series.updated() for series in self.series.values()], default=0.0)
+
+    # Last price of every resource, None if the writer didn't poll the market for `max_age` secs
+    def prices(self, max_age=None):
+        if max_age is not None and time.time() - self.updated() > max_age:
+            return None
+        return {res: ind.price for res, ind in self.indicators.items() if ind.count > 0}
+
+    def resources(self):
+        return sorted(self.series)
+
+    # (timestamp, price) of a resource, all of them or only the ones after `since`
+    def history(self, res, since=None):
+        if res not in self.series:
+            return []
+        series = self.series[res]
+        start = 0 if since is None else series.find(since)
+        return series.records(start, self.indicators[res].count)
+
+    def last(self, res):
+        ind = self.indicators.get(res)
+        return None if ind is None else ind.price
+
+    def stats(self, res):
+        ind = self.indicators.get(res)
+        return None if ind is None else ind.to_json()
+
+    def all_stats(self):
+        return {res: self.stats(res) for res in self.resources()}
+
+    def close(self):
+        for series in self.series.values():
+            series.close()
@@ -0,0 +1,197 @@
+import re
+import json
+import threading
+import http.server
+
+# Upper bounds (in secs) of the latency histogram buckets, the last one catches everything
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float("inf"))
+
+# Turn a path into the template of its endpoint, so that all the calls to an endpoint are counted together
+TEMPLATES = [
+    (re.compile(r"^/ship/\d+/(navigate|travelcost)/\d+/\d+/\d+$"), r"/ship/{id}/\1/{x}/{y}/{z}"),
+    (re.compile(r"^/ship/\d+/unload/[^/]+/[^/]+$"), "/ship/{id}/unload/{resource}/{amount}"),
+    (re.compile(r"^/market/\d+/(buy|sell)/[^/]+/[^/]+$"), r"/market/{id}/\1/{resource}/{amount}"),
+    (re.compile(r"^/station/\d+/shop/cargo/buy/\d+$"), "/station/{id}/shop/cargo/buy/{amount}"),
+    (re.compile(r"^/player/new/[^/]+$"), "/player/new/{name}"),
+    (re.compile(r"^/tick/\d+$"), "/tick/{n}"),
+]
+NUMBER = re.compile(r"/\d+(?=/|$)")
+
+def normalize(path):
+    for rule, template in TEMPLATES:
+        if rule.match(path):
+            return rule.sub(template, path)
+    return NUMBER.sub("/{id}", path)
+
+class EndpointStats:
+    __slots__ = ("count", "total", "buckets", "bytes", "timeouts", "errors")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.bytes = 0
+        self.timeouts = 0
+        self.errors = {}
+
+    def record(self, elapsed, nbytes, error, timeout):
+        self.count += 1
+        self.total += elapsed
+        self.bytes += nbytes
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                self.buckets[i] += 1
+                break
+        if timeout:
+            self.timeouts += 1
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    # Add the counts of another EndpointStats, e.g. the one of another process
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.bytes += other.bytes
+        self.timeouts += other.timeouts
+        for code, n in other.errors.items():
+            self.errors[code] = self.errors.get(code, 0) + n
+
+    # Estimated from the histogram, interpolating inside the bucket holding the quantile
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, n in zip(BUCKETS, self.buckets):
+            if n > 0 and seen + n >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return lower
+
+    def to_json(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "bytes": self.bytes,
+            "timeouts": self.timeouts,
+            "errors": dict(self.errors),
+        }
+
+# Latency, size and errors of the requests sent by a Game, per endpoint
+#     - Game.get records every request sent to the server (the cache hits are not requests)
+#     - The exceptions caught by the loops of the bots are counted with `failure`
+#     - `serve(port)` exposes /metrics (Prometheus text) and /metrics.json on localhost
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.failures = {}
+        self.server = None
+
+    def record(self, path, elapsed, nbytes=0, error=None, timeout=False):
+        endpoint = normalize(path)
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.record(elapsed, nbytes, error, timeout)
+
+    def failure(self, where, exc):
+        key = (where, type(exc).__name__)
+        with self.lock:
+            self.failures[key] = self.failures.get(key, 0) + 1
+
+    # Copy of the counts, can be sent to another process and merged there
+    def dump(self):
+        with self.lock:
+            endpoints = {}
+            for ep, stats in self.endpoints.items():
+                endpoints[ep] = EndpointStats()
+                endpoints[ep].merge(stats)
+            return endpoints, dict(self.failures)
+
+    def merge(self, endpoints, failures):
+        with self.lock:
+            for ep, stats in endpoints.items():
+                if ep not in self.endpoints:
+                    self.endpoints[ep] = EndpointStats()
+                self.endpoints[ep].merge(stats)
+            for key, n in failures.items():
+                self.failures[key] = self.failures.get(key, 0) + n
+
+    def to_json(self):
+        with self.lock:
+            return {
+                "endpoints": {ep: stats.to_json() for ep, stats in sorted(self.endpoints.items())},
+                "failures": [
+                    {"where": where, "exception": exc, "count": n}
+                    for (where, exc), n in sorted(self.failures.items())
+                ],
+            }
+
+    def to_prometheus(self):
+        lines = [
+            "# TYPE simeis_request_duration_seconds histogram",
+        ]
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            for ep, stats in endpoints:
+                cumul = 0
+                for bound, n in zip(BUCKETS, stats.buckets):
+                    cumul += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'simeis_request_duration_seconds_bucket{{endpoint="{ep}",le="{le}"}} {cumul}')
+                lines.append(f'simeis_request_duration_seconds_sum{{endpoint="{ep}"}} {stats.total}')
+                lines.append(f'simeis_request_duration_seconds_count{{endpoint="{ep}"}} {stats.count}')
+
+            lines.append("# TYPE simeis_response_bytes_total counter")
+            for ep, stats in endpoints:
+                lines.append(f'simeis_response_bytes_total{{endpoint="{ep}"}} {stats.bytes}')
+
+            lines.append("# TYPE simeis_request_timeouts_total counter")
+            for ep, stats in endpoints:
+                lines.append(f'simeis_request_timeouts_total{{endpoint="{ep}"}} {stats.timeouts}')
+
+            lines.append("# TYPE simeis_request_errors_total counter")
+            for ep, stats in endpoints:
+                for code, n in sorted(stats.errors.items()):
+                    lines.append(f'simeis_request_errors_total{{endpoint="{ep}",code="{code}"}} {n}')
+
+            lines.append("# TYPE simeis_loop_failures_total counter")
+            for (where, exc), n in sorted(self.failures.items()):
+                lines.append(f'simeis_loop_failures_total{{where="{where}",exception="{exc}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port):
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, ctype = metrics.to_prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, ctype = json.dumps(metrics.to_json(), indent=2).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="Metrics").start()
+        print(f"[*] Metrics available on http://127.0.0.1:{port}/metrics")
+        return self.server
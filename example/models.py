@@ -0,0 +1,126 @@
+import json
+
+# Use orjson to decode the replies if it is installed, it is several times faster
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# Decoded replies of the server, built once when the reply is received
+#     - The hot paths use the attributes, the other fields are still readable as `obj["field"]`
+#     - The crew and module types are computed once, checking them doesn't rebuild any list
+
+class Cargo:
+    __slots__ = ("raw", "usage", "capacity", "resources")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.usage = raw["usage"]
+        self.capacity = raw["capacity"]
+        self.resources = raw["resources"]
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    @property
+    def free(self):
+        return self.capacity - self.usage
+
+    @property
+    def full(self):
+        return self.usage >= self.capacity
+
+class Ship:
+    __slots__ = (
+        "raw", "id", "state", "position", "cargo", "crew_types", "module_types",
+        "fuel_tank", "fuel_tank_capacity", "hull_decay", "hull_decay_capacity",
+    )
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.id = raw["id"]
+        # "Idle", or {"InFlight": {...}} / {"Extracting": {...}}
+        state = raw["state"]
+        self.state = state if isinstance(state, str) else next(iter(state))
+        self.position = raw["position"]
+        self.cargo = Cargo(raw["cargo"])
+        self.crew_types = frozenset(c["member_type"] for c in raw["crew"].values())
+        self.module_types = frozenset(m["modtype"] for m in raw["modules"].values())
+        self.fuel_tank = raw["fuel_tank"]
+        self.fuel_tank_capacity = raw["fuel_tank_capacity"]
+        self.hull_decay = raw["hull_decay"]
+        self.hull_decay_capacity = raw["hull_decay_capacity"]
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def __repr__(self):
+        return f"Ship({self.id}, {self.state}, cargo {round(self.cargo.usage, 2)}/{self.cargo.capacity})"
+
+    @property
+    def idle(self):
+        return self.state == "Idle"
+
+    def has_crew(self, *types):
+        return self.crew_types.issuperset(types)
+
+    def has_module(self, *types):
+        return self.module_types.issuperset(types)
+
+class Station:
+    __slots__ = ("raw", "id", "position", "cargo", "crew_types", "trader")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.id = raw["id"]
+        self.position = raw["position"]
+        self.cargo = Cargo(raw["cargo"])
+        self.crew_types = frozenset(c["member_type"] for c in raw["crew"].values())
+        self.trader = raw["trader"]
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def has_crew(self, *types):
+        return self.crew_types.issuperset(types)
+
+class Player:
+    __slots__ = ("raw", "id", "name", "money", "costs", "stations", "ships", "ships_by_id")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.id = raw["id"]
+        self.name = raw["name"]
+        self.money = raw["money"]
+        self.costs = raw["costs"]
+        self.stations = raw["stations"]
+        self.ships = [Ship(ship) for ship in raw["ships"]]
+        self.ships_by_id = {ship.id: ship for ship in self.ships}
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    # Secs left before the costs use all our money
+    @property
+    def lifetime(self):
+        return self.money / self.costs
+
+    def ship(self, sid):
+        return self.ships_by_id.get(sid)
+
+class PlanetInfo:
+    __slots__ = ("raw", "position", "temperature", "solid")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.position = raw["position"]
+        self.temperature = raw["temperature"]
+        self.solid = raw["solid"]
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+# For the helpers that can be given either a raw reply or a model
+def as_ship(ship):
+    return ship if isinstance(ship, Ship) else Ship(ship)
@@ -0,0 +1,192 @@
+import math
+
+try:
+    from .models import PlanetInfo, as_ship
+except ImportError:
+    from models import PlanetInfo, as_ship
+
+# Use NumPy to score all the (ship, planet) pairs at once if it is installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Same as the server (simeis-data/src/ship/module.rs & galaxy/planet.rs)
+EXRATE_DIFF_FACT = 2.5
+EXRATE_FACT = 0.6
+PLANET_DENSITY = 6.25
+SOLID = ("Stone", "Iron", "Copper", "Gold")
+GASEOUS = ("Helium", "Ozone", "Freon", "Oxygen")
+MODULE_OF = {True: "Miner", False: "GasSucker"}
+
+# Units per second extracted by the modules of the ship on a solid (or gaseous) planet
+def extraction_rates(ship, resources, solid):
+    ship = as_ship(ship)
+    crew = ship["crew"]
+    rates = {}
+    for mod in ship["modules"].values():
+        if mod["modtype"] != MODULE_OF[solid] or mod.get("operator") is None:
+            continue
+        oprank = crew[str(mod["operator"])]["rank"]
+        for res in (SOLID if solid else GASEOUS):
+            info = resources[res]
+            if oprank <= info["min-rank"]:
+                continue
+            rank = (oprank - info["min-rank"]) * mod["rank"]
+            difficulty = info["difficulty"] ** EXRATE_DIFF_FACT
+            rates[res] = rates.get(res, 0.0) + PLANET_DENSITY * (rank / difficulty) ** EXRATE_FACT
+    return rates
+
+# Where a ship should go, and what we expect from the trip
+class Trip:
+    __slots__ = ("ship", "planet", "rate", "profit", "duration", "fuel", "hull")
+
+    def __init__(self, ship, planet, rate, profit, duration, fuel, hull):
+        self.ship = ship
+        self.planet = planet
+        self.rate = rate          # Credits per second of the whole trip
+        self.profit = profit      # Credits earned, net of the fuel & hull used
+        self.duration = duration  # Secs to go to the planet, fill the cargo, and come back
+        self.fuel = fuel
+        self.hull = hull
+
+    def __repr__(self):
+        return f"Trip({self.ship.id} -> {self.planet.position}, {round(self.rate, 2)} cr/s)"
+
+# Chooses the planet of every idle ship, all the fleet at once
+#     - A trip is: ship position -> planet -> station, the cargo filled on the planet and sold there
+#     - Its score is the credits per second of the trip, net of the fuel and hull plates it uses
+#     - A trip the ship has not enough fuel or hull for is never chosen
+#     - All the planets of a kind have the same density on the server, so the best planet of a
+#       ship only depends on its distances; `max_per_planet` spreads the fleet if needed
+class FleetPlanner:
+    def __init__(self, resources, prices=None, fee_rate=0.0):
+        self.resources = resources
+        self.prices = {res: (prices or {}).get(res, info["base-price"]) for res, info in resources.items()}
+        self.fee_rate = fee_rate
+
+    # (credits, volume) per second extracted, for a solid and a gaseous planet
+    def yields(self, ship):
+        out = []
+        for solid in (True, False):
+            rates = extraction_rates(ship, self.resources, solid)
+            credits = sum(self.prices[res] * rate for res, rate in rates.items()) * (1 - self.fee_rate)
+            volume = sum(self.resources[res]["volume"] * rate for res, rate in rates.items())
+            out.append((credits, volume))
+        return out
+
+    # Returns {ship id: Trip}, ships without any possible trip are not in it
+    def plan(self, ships, planets, station_pos, max_per_planet=None):
+        ships = [as_ship(s) for s in ships]
+        planets = [p if isinstance(p, PlanetInfo) else PlanetInfo(p) for p in planets]
+        if len(ships) == 0 or len(planets) == 0:
+            return {}
+        if np is not None:
+            scores = self.scores_numpy(ships, planets, station_pos)
+        else:
+            scores = self.scores_python(ships, planets, station_pos)
+        return self.assign(ships, planets, scores, max_per_planet)
+
+    # Per ship: (speed, fuel per sec, hull per distance, fuel left, hull left, free cargo, yields)
+    def ship_params(self, ship):
+        stats = ship["stats"]
+        return (
+            stats["speed"], stats["fuel_consumption"], stats["hull_usage_rate"],
+            ship.fuel_tank, ship.hull_decay_capacity - ship.hull_decay,
+            max(ship.cargo.free, 0), self.yields(ship),
+        )
+
+    def trip(self, params, d_go, d_back, kind):
+        speed, fuel_rate, hull_rate, fuel_left, hull_left, free, yields = params
+        credits, volume = yields[kind]
+        if volume <= 0 or speed <= 0:
+            return None
+        flight = (d_go + d_back) / speed
+        fuel = fuel_rate * flight
+        hull = hull_rate * (d_go + d_back)
+        if fuel > fuel_left or hull > hull_left:
+            return None
+        fill = free / volume
+        profit = free * credits / volume - fuel * self.prices["Fuel"] - hull * self.prices["HullPlate"]
+        return profit, flight + fill, fuel, hull
+
+    # Each score is (rate, profit, duration, fuel, hull), or None
+    def scores_python(self, ships, planets, station_pos):
+        back = [math.dist(p.position, station_pos) for p in planets]
+        scores = []
+        for ship in ships:
+            params = self.ship_params(ship)
+            row = []
+            for planet, d_back in zip(planets, back):
+                res = self.trip(params, math.dist(ship.position, planet.position), d_back, 0 if planet.solid else 1)
+                row.append(None if res is None else (res[0] / res[1],) + res)
+            scores.append(row)
+        return scores
+
+    def scores_numpy(self, ships, planets, station_pos):
+        params = [self.ship_params(ship) for ship in ships]
+        speed, fuel_rate, hull_rate, fuel_left, hull_left, free = (
+            np.array([p[i] for p in params], dtype=np.float64)[:, None] for i in range(6)
+        )
+        # (credits, volume) per second of each ship on the kind of each planet
+        kind = np.array([0 if p.solid else 1 for p in planets])
+        ylds = np.array([p[6] for p in params], dtype=np.float64)
+        credits, volume = ylds[:, kind, 0], ylds[:, kind, 1]
+
+        shippos = np.array([s.position for s in ships], dtype=np.float64)
+        planetpos = np.array([p.position for p in planets], dtype=np.float64)
+        d_go = np.linalg.norm(shippos[:, None, :] - planetpos[None, :, :], axis=2)
+        d_back = np.linalg.norm(planetpos - np.asarray(station_pos, dtype=np.float64), axis=1)[None, :]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            flight = (d_go + d_back) / speed
+            fuel = fuel_rate * flight
+            hull = hull_rate * (d_go + d_back)
+            duration = flight + free / volume
+            profit = free * credits / volume - fuel * self.prices["Fuel"] - hull * self.prices["HullPlate"]
+            rate = profit / duration
+        ok = (volume > 0) & (speed > 0) & (fuel <= fuel_left) & (hull <= hull_left)
+        rate = np.where(ok, rate, -np.inf)
+        return rate, profit, duration, fuel, hull
+
+    def assign(self, ships, planets, scores, max_per_planet):
+        if np is not None:
+            rate = scores[0]
+            def score(i, j):
+                return None if rate[i, j] == -np.inf else tuple(float(m[i, j]) for m in scores)
+            if max_per_planet is None:
+                pairs = [(i, int(j)) for i, j in enumerate(np.argmax(rate, axis=1))]
+            else:
+                order = np.argsort(-rate, axis=None, kind="stable")
+                order = order[rate.flat[order] != -np.inf]
+                pairs = (divmod(int(k), len(planets)) for k in order)
+        else:
+            def score(i, j):
+                return scores[i][j]
+            valid = [(s[0], i, j) for i, row in enumerate(scores) for j, s in enumerate(row) if s is not None]
+            if max_per_planet is None:
+                best = {}
+                for r, i, j in valid:
+                    if i not in best or r > best[i][0]:
+                        best[i] = (r, j)
+                pairs = [(i, j) for i, (_, j) in best.items()]
+            else:
+                pairs = [(i, j) for _, i, j in sorted(valid, reverse=True)]
+
+        # Best pairs first, each ship once, each planet at most `max_per_planet` times
+        trips = {}
+        used = {}
+        for i, j in pairs:
+            ship = ships[i]
+            if ship.id in trips:
+                continue
+            if max_per_planet is not None and used.get(j, 0) >= max_per_planet:
+                continue
+            s = score(i, j)
+            if s is None:
+                continue
+            trips[ship.id] = Trip(ship, planets[j], *s)
+            used[j] = used.get(j, 0) + 1
+            if len(trips) == len(ships):
+                break
+        return trips
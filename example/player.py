@@ -15,20 +15,87 @@ import json
 import string
 import urllib.request
 
+try:
+    from .transport import ConnectionPool
+    from .cache import TTLCache
+    from .snapshot import Snapshot
+    from .events import SyslogDispatcher
+    from .scheduler import Scheduler
+    from .metrics import Metrics
+    from .spatial import PlanetIndex
+    from .planner import FleetPlanner
+    from .travel import travel_cost
+    from .history import PriceHistory, HISTORY_PATH, HISTORY_MAX_AGE
+    from .forecast import MarketForecaster, MARKET_CHANGE_SEC, np
+    from .models import as_ship, loads
+except ImportError:
+    from transport import ConnectionPool
+    from cache import TTLCache
+    from snapshot import Snapshot
+    from events import SyslogDispatcher
+    from scheduler import Scheduler
+    from metrics import Metrics
+    from spatial import PlanetIndex
+    from planner import FleetPlanner
+    from travel import travel_cost
+    from history import PriceHistory, HISTORY_PATH, HISTORY_MAX_AGE
+    from forecast import MarketForecaster, MARKET_CHANGE_SEC, np
+    from models import as_ship, loads
+
+# Secs before checking again a ship we don't have any deadline for
+RECHECK_DELAY = 10
+# Secs between two scans of the planets around our station (the scanner may have been upgraded)
+SCAN_INTERVAL = 300
+# A resource is kept in the station instead of sold if, in HOLD_SECS, its expected revenue is
+# HOLD_MIN_GAIN higher and it is higher in HOLD_MIN_PROBA of the simulations (needs NumPy)
+HOLD_SECS = 30
+HOLD_MIN_GAIN = 0.05
+HOLD_MIN_PROBA = 0.75
+# A sale lowering the price by more than SLICE_MIN_IMPACT (as much as an update of the market)
+# may be split over up to MAX_SLICES unloads, if the forecast says it pays more (needs NumPy)
+SLICE_MIN_IMPACT = 0.05
+MAX_SLICES = 4
+
 class SimeisError(Exception):
     pass
 
+# A path of a batch failed, `results` are the ones of the paths run before it
+class BatchError(SimeisError):
+    def __init__(self, msg, index, results):
+        super().__init__(msg)
+        self.index = index
+        self.results = results
+
 # Théorème de Pythagore pour récupérer la distance entre 2 points dans l'espace 3D
 def get_dist(a, b):
     return math.sqrt(((a[0] - b[0]) ** 2) + ((a[1] - b[1]) ** 2) + ((a[2] - b[2]) ** 2))
 
 # Check if types are present in the list
 def check_has(alld, key, *req):
-    alltypes = [c[key] for c in alld.values()]
-    return all([k in alltypes for k in req])
+    return {c[key] for c in alld.values()}.issuperset(req)
 
 class Game:
-    def __init__(self, username):
+    def __init__(self, username, pool_size=4, cache_ttls=None, snapshot_interval=0.5, metrics_port=None, pool=None):
+        # Keep-alive connections shared by all the threads using this game
+        # (or anything with the same `request`, like simulator.SimPool to play offline)
+        self.pool = ConnectionPool(URL, size=pool_size) if pool is None else pool
+        # Latency & errors of our requests, per endpoint
+        self.metrics = Metrics()
+        if metrics_port is not None:
+            self.metrics.serve(metrics_port)
+        # Catalog data (resources, shipyard, shop, scan), see cache.CACHED_ENDPOINTS for the TTLs
+        self.cache = TTLCache(ttls=cache_ttls)
+        # Our player & station, fetched at most once every `snapshot_interval` secs
+        self.snapshot = Snapshot(self, interval=snapshot_interval)
+        # All the planets seen in our scans
+        self.planets = PlanetIndex()
+        self.scanned_at = None
+        # Market prices recorded by watch_game.py, opened when first needed
+        self.history = None
+        # Simulations of the market prices, created when first needed
+        self.forecaster = None
+        # Time of our last unload, the interval between the parts of a sliced sale
+        self.last_unload = None
         # Init connection & setup player
         assert self.get("/ping")["ping"] == "pong"
         print("[*] Connection to server OK")
@@ -37,8 +104,19 @@ class Game:
         # Useful for our game loops
         self.pid = self.player["playerId"] # ID of our player
         self.sta = None    # ID of our station
+        # Expected end of the actions of our ships
+        self.scheduler = Scheduler()
+        # Ship events from the syslogs, wakes up wait_idle
+        self.events = SyslogDispatcher(self).start()
 
     def get(self, path, **qry):
+        # Catalog endpoints are served from the cache while they are fresh
+        reply = self.cache.get(path) if len(qry) == 0 else None
+        if reply is not None:
+            data = loads(reply)
+            data.pop("error")
+            return data
+
         if hasattr(self, "player"):
             qry["key"] = self.player["key"]
 
@@ -49,20 +127,55 @@ class Game:
                 "{}={}".format(k, urllib.parse.quote(v)) for k, v in qry.items()
             ])
 
-        qry = f"{URL}{path}{tail}"
-        reply = urllib.request.urlopen(qry, timeout=1)
-
-        data = json.loads(reply.read().decode())
-        err = data.pop("error")
+        reply, data, err = self.send(path, tail)
         if err != "ok":
             raise SimeisError(err)
 
+        self.cache.update(path, reply)
+        self.snapshot.notify(path)
         return data
 
+    # Send the request, its latency, size and error are recorded in self.metrics
+    def send(self, path, tail=""):
+        tstart = time.perf_counter()
+        try:
+            reply = self.pool.request(f"{path}{tail}")
+        except TimeoutError:
+            self.metrics.record(path, time.perf_counter() - tstart, timeout=True)
+            raise
+        except Exception as e:
+            self.metrics.record(path, time.perf_counter() - tstart, error=type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - tstart
+
+        data = loads(reply)
+        err = data.pop("error")
+        # The type of the error is like "ShipNotFound(42)", only keep its name
+        code = None if err == "ok" else data.get("type", err).split("(")[0]
+        self.metrics.record(path, elapsed, len(reply), error=code)
+        return reply, data, err
+
+    # Runs the paths in order, in a single request to the server
+    # A part "{N.field}" of a path is replaced by the field of the result of the Nth path
+    def batch(self, paths):
+        if len(paths) == 0:
+            return []
+        key = urllib.parse.quote(self.player["key"])
+        qry = urllib.parse.quote(json.dumps(paths, separators=(",", ":")))
+        _, data, err = self.send("/batch", f"?key={key}&paths={qry}")
+
+        results = data.get("results", [])
+        for path in paths[:len(results)]:
+            self.cache.notify(path)
+            self.snapshot.notify(path)
+        if err != "ok":
+            raise BatchError(err, data.get("index"), results)
+        return results
+
     def disp_status(self):
-        status = self.get("/player/" + str(self.pid))
+        status = self.snapshot.get_player()
         print("[*] Current status: {} credits, costs: {}, time left before lost: {} secs".format(
-            round(status["money"], 2), round(status["costs"], 2), int(status["money"] / status["costs"]),
+            round(status.money, 2), round(status.costs, 2), int(status.lifetime),
         ))
 
     # If we have a file containing the player ID and key, use it
@@ -117,23 +230,28 @@ class Game:
     def buyMiningModule(self, modtype, vaisseau):
         # Buy the mining module
         all = self.get(f"/station/{self.sta}/shop/modules")
-        mod_id = self.get(f"/station/{self.sta}/shop/modules/{vaisseau['id']}/buy/{modtype}")["id"]
+        paths = [f"/station/{self.sta}/shop/modules/{vaisseau['id']}/buy/{modtype}"]
 
         # Check if we have the crew assigned on this module
         # If not, hire an operator, and assign it to the mining module of our ship
-        if not check_has(vaisseau["crew"], "member_type", "Operator"):
-            op = self.get(f"/station/{self.sta}/crew/hire/operator")["id"]
-            self.get(f"/station/{self.sta}/crew/assign/{op}/{vaisseau['id']}/{mod_id}")
+        if not as_ship(vaisseau).has_crew("Operator"):
+            paths.append(f"/station/{self.sta}/crew/hire/operator")
+            paths.append(f"/station/{self.sta}/crew/assign/{{1.id}}/{vaisseau['id']}/{{0.id}}")
+        self.batch(paths)
 
     def hire_pilot(self, ship):
         # Hire a pilot, and assign it to our ship
-        pilot = self.get(f"/station/{self.sta}/crew/hire/pilot")["id"]
-        self.get(f"/station/{self.sta}/crew/assign/{pilot}/{ship['id']}/pilot")
+        self.batch([
+            f"/station/{self.sta}/crew/hire/pilot",
+            f"/station/{self.sta}/crew/assign/{{0.id}}/{ship['id']}/pilot",
+        ])
 
     def hire_trader(self):
         # Hire a trader, assign it on our station
-        trader = self.get(f"/station/{self.sta}/crew/hire/trader")["id"]
-        self.get(f"/station/{self.sta}/crew/assign/{trader}/trading")
+        self.batch([
+            f"/station/{self.sta}/crew/hire/trader",
+            f"/station/{self.sta}/crew/assign/{{0.id}}/trading",
+        ])
 
     def travel(self, sid, pos):
         try:
@@ -141,12 +259,22 @@ class Game:
         except SimeisError:
             print(SimeisError)
         print("[*] Traveling to {}, will take {}".format(pos, costs["duration"]))
+        self.scheduler.expect(sid, costs["duration"])
+        return costs
 
-    def wait_idle(self, sid, ts=2):
-        ship = self.get(f"/ship/{sid}")
-        while ship["state"] != "Idle":
-            time.sleep(ts)
+    # Sleeps until the expected end of the action of the ship, then a single request confirms it
+    # The syslog events can wake us up earlier, `ts` is only used when the deadline was missed
+    def wait_idle(self, sid, ts=10):
+        while True:
+            marker = self.events.marker(sid)
+            remaining = self.scheduler.remaining(sid)
+            if remaining is not None and remaining > 0:
+                self.events.wait(sid, marker, remaining)
             ship = self.get(f"/ship/{sid}")
+            if ship["state"] == "Idle":
+                self.scheduler.cancel(sid)
+                return
+            self.events.wait(sid, marker, ts)
 
     # Repair the ship:     Buy the plates, then ask for reparation
     def ship_repair(self, vaisseauid):
@@ -240,12 +368,9 @@ class Game:
         ship = self.checkStatusVaisseau()[0]["id"]
         station = self.get(f"/station/{self.sta}")
 
-        # Scan the galaxy sector, detect which planet is the nearest
-        station = self.get(f"/station/{self.sta}")
-        planets = self.get(f"/station/{self.sta}/scan")["planets"]
-        nearest = sorted(planets,
-            key=lambda pla: get_dist(station["position"], pla["position"])
-        )[0]
+        # Detect which of the planets we know is the nearest
+        self.scan_planets()
+        nearest = self.planets.nearest(station["position"])[0]
 
         # If the planet is solid, we need a Miner to mine it
         # If it's gaseous, we need a GasSucker to mine it
@@ -276,18 +401,18 @@ class Game:
         print("[*] Starting extraction:")
         for res, amnt in info.items():
             print(f"\t- Extraction of {res}: {amnt}/sec")
+        self.scheduler.expect_extraction(ship['id'], info, ship["cargo"], self.get("/resources"))
 
         self.wait_idle(ship['id'])
         print("[*] The cargo is full, stopping mining process")
 
 
     def goPlanet(self, vaisseau, planet=None):
-        station = self.get(f"/station/{self.sta}")
         vaisseau = self.infoVaisseaux(vaisseau['id'])[0]
 
         # Vérifie les modules installés
-        has_miner = check_has(vaisseau["modules"], "modtype", "Miner")
-        has_gas = check_has(vaisseau["modules"], "modtype", "GasSucker")
+        has_miner = vaisseau.has_module("Miner")
+        has_gas = vaisseau.has_module("GasSucker")
 
         # Aucun module → vérifier si on peut acheter
         if not has_miner and not has_gas:
@@ -296,50 +421,77 @@ class Game:
                 print("[!] Aucun module installé et pas assez d'argent pour en acheter.")
                 return False
 
-        # Scan des planètes si aucune n’est donnée
+        # Planète la plus proche compatible avec les modules, si aucune n'est donnée
         if planet is None:
-            planets = self.get(f"/station/{self.sta}/scan")["planets"]
-
-            # Si un seul module → filtrer les planètes compatibles
-            if has_miner and not has_gas:
-                planets = [p for p in planets if p["solid"]]
-            elif has_gas and not has_miner:
-                planets = [p for p in planets if not p["solid"]]
-
-            # Si aucun module → choisir planète et acheter module adapté
-            if not has_miner and not has_gas:
-                planet = sorted(planets, key=lambda p: get_dist(station["position"], p["position"]))[0]
-                modtype = "Miner" if planet["solid"] else "GasSucker"
-                self.buyMiningModule(modtype, vaisseau)
-            elif has_miner or has_gas:
-                if not planets:
-                    print("[!] Aucune planète disponible pour miner.")
-                    return False
-                if has_miner:
-                    compatible_planets = [p for p in planets if p["solid"]]
-                else: 
-                    compatible_planets = [p for p in planets if not p["solid"]]
-
-                if not compatible_planets:
-                    print("[!] Aucune planète compatible avec le module installé.")
-                    return False
-                planet = sorted(compatible_planets, key=lambda p: get_dist(station["position"], p["position"]))[0]
-            else:
-                if not planets:
-                    print("[!] Aucune planète compatible avec les modules du vaisseau.")
-                    return False
-                planet = sorted(planets, key=lambda p: get_dist(station["position"], p["position"]))[0]
-
+            planet = self.planet_targets([vaisseau]).get(vaisseau.id)
+            if planet is None:
+                print("[!] Aucune planète compatible avec les modules du vaisseau.")
+                return False
             print("[*] Planète ciblée :", planet["position"])
 
-        self.travel(vaisseau["id"], planet["position"])
+        # Aucun module → acheter celui adapté à la planète
+        if not has_miner and not has_gas:
+            self.buyMiningModule("Miner" if planet.solid else "GasSucker", vaisseau)
+
+        self.travel(vaisseau.id, planet["position"])
         return True
 
+    # Add the planets around our station to self.planets, at most once every SCAN_INTERVAL secs
+    def scan_planets(self, force=False):
+        now = time.monotonic()
+        if force or self.scanned_at is None or now - self.scanned_at > SCAN_INTERVAL:
+            self.planets.add(self.get(f"/station/{self.sta}/scan")["planets"])
+            self.scanned_at = now
+
+    # Planet of each ship, all the ships at once
+    #     - The ships with a module go where they earn the most credits per second (see planner.py)
+    #     - The others go to the nearest planet, and will buy the module it needs
+    def planet_targets(self, ships):
+        self.scan_planets()
+        station = self.getStation()
+        planner = FleetPlanner(
+            self.get("/resources"),
+            self.market_prices(),
+            self.get(f"/market/{self.sta}/fee_rate")["fee_rate"],
+        )
+        equipped = [ship for ship in ships if len(ship.module_types) > 0]
+        targets = {
+            sid: trip.planet
+            for sid, trip in planner.plan(equipped, self.planets.all(), station.position).items()
+        }
+
+        groups = {}
+        for ship in ships:
+            if ship.id in targets:
+                continue
+            has_miner, has_gas = ship.has_module("Miner"), ship.has_module("GasSucker")
+            solid = None if has_miner == has_gas else has_miner
+            groups.setdefault(solid, []).append(ship)
+
+        for solid, group in groups.items():
+            nearest = self.planets.nearest_many([ship.position for ship in group], 1, solid)
+            for ship, planets in zip(group, nearest):
+                if len(planets) > 0:
+                    targets[ship.id] = planets[0]
+        return targets
+
+    # Prices from the history of watch_game.py when it is running, no request needed
+    def market_prices(self):
+        if self.history is None and os.path.isdir(HISTORY_PATH):
+            self.history = PriceHistory(HISTORY_PATH, readonly=True)
+        if self.history is not None:
+            self.history.refresh()
+            prices = self.history.prices(max_age=HISTORY_MAX_AGE)
+            if prices is not None:
+                return prices
+        return self.get("/market/prices")["prices"]
+
     def startMinage(self, vaisseau):
-        info = self.get(f"/ship/{vaisseau['id']}/extraction/start")
+        info = self.get(f"/ship/{vaisseau.id}/extraction/start")
         print("[*] Starting extraction:")
         for res, amnt in info.items():
             print(f"\t- Extraction of {res}: {amnt}/sec")
+        self.scheduler.expect_extraction(vaisseau.id, info, vaisseau.cargo, self.get("/resources"))
 
     def scan(self):
         print("[*] Scan operations")
@@ -350,31 +502,37 @@ class Game:
         print(self.coutTrajet(12221239808692135915, station))
 
     def getStation(self):
-        return self.get(f"/station/{self.sta}")
+        return self.snapshot.get_station()
     
     def costPerSecond(self):
-        return self.get(f"/player/{self.pid}")["costs"]
+        return self.snapshot.get_player().costs
     
     def moneyPlayer(self):
-        return self.get(f"/player/{self.pid}")["money"]
+        return self.snapshot.get_player().money
     
     def lifeTime(self):
-        player =  self.get(f"/player/{self.pid}")
-        return player["money"] / player["costs"]
+        return self.snapshot.get_player().lifetime
     
     def getPriceVaisseaux(self):
         return self.get(f"/station/{self.sta}/shipyard/list")
 
     def infoVaisseaux(self, idVaisseaux):
-        vaisseaux = self.get(f"/player/{self.pid}")["ships"]
-        return list(filter(lambda id: id['id'] == idVaisseaux, vaisseaux))
+        ship = self.snapshot.get_ship(idVaisseaux)
+        return [] if ship is None else [ship]
 
-    def trajet(self, idVaisseaux, destination=None):
+    # Computed locally from the stats of the ship (see travel.py), `local=False` asks the server
+    def trajet(self, idVaisseaux, destination=None, local=True):
         if destination == None:
-            destination = self.get(f"/station/{self.sta}")
+            destination = self.getStation()
         x,y,z = destination["position"]
 
-        return self.get(f"/ship/{idVaisseaux}/travelcost/{x}/{y}/{z}")
+        ship = self.snapshot.get_ship(idVaisseaux) if local else None
+        if ship is None:
+            return self.get(f"/ship/{idVaisseaux}/travelcost/{x}/{y}/{z}")
+        try:
+            return travel_cost(ship, (x, y, z))
+        except ValueError as e:
+            raise SimeisError(str(e))
     
     def coutTrajet(self, idVaisseaux, destination=None):
         return self.trajet(idVaisseaux, destination)["duration"]
@@ -401,107 +559,187 @@ class Game:
         return(f"Affichage Joueur : Player id : {self.pid} \ Player name : {self.username} \n\nBalance : {int(self.moneyPlayer())}\nCoût par seconde : {round(self.costPerSecond(), 2)} \nTemps de vie restant : {int(self.lifeTime())} secondes\n")
     
     def getShipsInfo(self):
-        stationPos = self.get(f"/station/{self.sta}")['position']
-        ships = list(self.get(f"/player/{self.pid}")["ships"])
+        stationPos = self.getStation().position
+        ships = self.snapshot.get_player().ships
         
         return f"Nombre de vaisseaux : {len(ships)} \n" + "\n".join([
-            (list(vaisseau["state"].keys())[0] if isinstance(vaisseau["state"], dict) 
-            else vaisseau["state"]) + (f" - Station - {vaisseau['cargo']['usage']}/{vaisseau['cargo']['capacity']}" if stationPos == vaisseau['position'] else f" - Espace - {vaisseau['cargo']['usage']}/{vaisseau['cargo']['capacity']}")
+            vaisseau.state + (" - Station - " if stationPos == vaisseau.position else " - Espace - ")
+            + f"{vaisseau.cargo.usage}/{vaisseau.cargo.capacity}"
             for vaisseau in ships
         ])
         
+    # The ships of the snapshot, already decoded (see models.Ship)
     def checkStatusVaisseau(self):
-        vaisseaux = self.get(f"/player/{self.pid}")["ships"]
-        state = []
-        for vaisseau in vaisseaux:
-            etat = vaisseau['state']
-            if type(etat) == dict:
-                etat = list(etat.keys())[0]
-            state.append({'id' : vaisseau['id'], 'state': etat, "position" : vaisseau['position'], 'vaisseauStockage': vaisseau})
-        return state
+        return self.snapshot.get_player().ships
     
     def ActionToDo(self):
         vaisseaux = self.checkStatusVaisseau()
         station = self.getStation()
 
+        # Targets of the ships leaving the station with an empty cargo, computed together
+        leaving = [
+            v for v in vaisseaux
+            if v.idle and v.position == station.position and v.cargo.usage < 10
+        ]
+        targets = self.planet_targets(leaving) if len(leaving) > 0 else {}
+
         for vaisseau in vaisseaux:
-            if vaisseau['state'] == 'Idle':
-                self.buy_module_upgrade(vaisseau['id'])
-                self.buy_ship_upgrade(vaisseau['id'])
-                self.buy_human_upgrade(vaisseau['id'])
-                if vaisseau["position"] != station["position"]:
-                    if vaisseau['vaisseauStockage']['cargo']['capacity'] == vaisseau['vaisseauStockage']['cargo']['usage']:
-                        self.travel(vaisseau["id"], station["position"])
+            # A busy ship we know nothing about (e.g. when starting the bot), check it later
+            if not vaisseau.idle and not self.scheduler.pending(vaisseau.id):
+                self.scheduler.expect(vaisseau.id, RECHECK_DELAY)
+
+            if vaisseau.idle:
+                self.buy_module_upgrade(vaisseau.id)
+                self.buy_ship_upgrade(vaisseau.id)
+                self.buy_human_upgrade(vaisseau.id)
+                if vaisseau.position != station.position:
+                    if vaisseau.cargo.full:
+                        self.travel(vaisseau.id, station.position)
                     else:
                         self.startMinage(vaisseau)
                 else:
-                    if vaisseau['vaisseauStockage']['cargo']['usage'] < 10:
-                        self.goPlanet(vaisseau)
+                    if vaisseau.cargo.usage < 10:
+                        if not self.goPlanet(vaisseau, targets.get(vaisseau.id)):
+                            self.scheduler.expect(vaisseau.id, RECHECK_DELAY)
                     else:
                         self.unloadAndSell(vaisseau)
 
+                # Still idle (e.g. just unloaded), handle it again right away
+                if not self.scheduler.pending(vaisseau.id):
+                    self.scheduler.expect(vaisseau.id, 0)
+
+    # Sleeps until the earliest deadline of our ships, the next snapshot confirms their state
+    def wait_next_ship(self, timeout=RECHECK_DELAY):
+        due = self.scheduler.wait_next(timeout)
+        self.snapshot.invalidate()
+        return due
+
     def go_sell(self):
         self.wait_idle(self.sid) # If we are currently occupied, wait
         ship = self.get(f"/ship/{self.sid}")
         station = self.get(f"/station/{self.sta}")
-        status = self.get("/player/" + str(self.pid))
+        status = self.snapshot.get_player()
 
         # If we aren't at the station, got there
         if ship["position"] != station["position"]:
             self.travel(ship["id"], station["position"])
 
-        # Unload the cargo and sell it directly on the market
-        for res, amnt in ship["cargo"]["resources"].items():
-            if amnt == 0.0:
-                continue
-
-            unloaded = self.get(f"/ship/{self.sid}/unload/{res}/{amnt}")
-            sold = self.get(f"/market/{self.sta}/sell/{res}/{amnt}")
-
-            print("[*] Unloaded and sold {} of {}, for {} credits".format(
-                unloaded["unloaded"], res, sold["added_money"]
-            ))
-
-        self.ship_repair(self.sid)
-        self.ship_refuel(self.sid)
+        self.unloadAndSell(as_ship(ship))
+
+    # Amount of `res` to sell now: 0 if the forecast says its price will be high enough in
+    # HOLD_SECS to wait for it, a part of it if selling it over the next unloads (one every
+    # `interval` secs) should pay more than selling it all at once
+    def to_sell(self, res, amount, prices, interval):
+        if np is None:
+            return amount
+        if self.forecaster is None:
+            base = {r: info["base-price"] for r, info in self.get("/resources").items()}
+            self.forecaster = MarketForecaster(base, n_paths=2000)
+        hold = self.forecaster.hold(res, prices[res], amount, [HOLD_SECS])[0]
+        if hold["gain"] >= HOLD_MIN_GAIN and hold["proba"] >= HOLD_MIN_PROBA:
+            return 0.0
+        if self.forecaster.max_impact(prices[res], amount) < SLICE_MIN_IMPACT:
+            return amount
+        slices, _ = self.forecaster.best_slicing(res, prices[res], amount, MAX_SLICES, interval)
+        return amount / slices
 
     def unloadAndSell(self, vaisseau):
-        station = self.get(f"/station/{self.sta}")
-
-        if vaisseau["position"] != station["position"]:
-            print("Erreur de position :" + vaisseau['id'])
+        station = self.getStation()
 
-        # Unload the cargo and sell it directly on the market
-        for res, amnt in vaisseau["vaisseauStockage"]["cargo"]["resources"].items():
-            if amnt == 0.0:
+        if vaisseau.position != station.position:
+            print("Erreur de position :", vaisseau.id)
+
+        # What we mined, and what we kept in the station at the previous unloads
+        resources = self.get("/resources")
+        volume = {res: info["volume"] for res, info in resources.items()}
+        cargo = {res: amnt for res, amnt in vaisseau.cargo.resources.items() if amnt != 0.0}
+        held = {
+            res: amnt for res, amnt in station.cargo.resources.items()
+            if amnt != 0.0 and "min-rank" in resources[res]
+        }
+        stock = dict(held)
+        for res, amnt in cargo.items():
+            stock[res] = stock.get(res, 0.0) + amnt
+
+        # The time between two unloads, the parts of a sliced sale are sold at the next ones. At
+        # most HOLD_SECS, the cost of the forecast grows with it
+        now = time.monotonic()
+        elapsed = HOLD_SECS if self.last_unload is None else now - self.last_unload
+        interval = min(max(elapsed, MARKET_CHANGE_SEC), HOLD_SECS)
+        self.last_unload = now
+
+        prices = self.market_prices()
+        sales = {res: self.to_sell(res, amnt, prices, interval) for res, amnt in stock.items()}
+
+        # What we keep must leave room in the station for the next unload, else we sell it anyway
+        kept = {res: stock[res] - sales[res] for res in stock}
+        room = station.cargo.capacity - vaisseau.cargo.capacity
+        for res in sorted(kept, key=lambda r: kept[r] * volume[r], reverse=True):
+            if sum(amnt * volume[r] for r, amnt in kept.items()) <= room:
+                break
+            sales[res], kept[res] = stock[res], 0.0
+
+        # Sell first what we kept in the station to make room, then unload each resource and sell
+        # it right away, all in a single request. A resource only goes in the request if the
+        # station has room for it, else the sale would have nothing to sell and fail the batch
+        free = station.cargo.capacity - station.cargo.usage
+        paths, plan = [], []
+        for res in held:
+            if res not in cargo and sales[res] > 0.0:
+                paths.append(f"/market/{self.sta}/sell/{res}/{sales[res]}")
+                plan.append(("sell", res))
+                free += sales[res] * volume[res]
+        for res, amnt in sorted(cargo.items(), key=lambda c: sales[c[0]] == 0.0):
+            unloaded = min(amnt, free / volume[res])
+            if unloaded < 0.01:
+                print(f"[!] No room left in the station for {res}, it stays in the ship")
+                kept[res] -= amnt
                 continue
+            paths.append(f"/ship/{vaisseau.id}/unload/{res}/{amnt}")
+            plan.append(("unload", res))
+            free -= unloaded * volume[res]
+            sold = min(sales[res], held.get(res, 0.0) + unloaded)
+            if sold > 0.0:
+                paths.append(f"/market/{self.sta}/sell/{res}/{sold}")
+                plan.append(("sell", res))
+                free += sold * volume[res]
+
+        # The station changed since the snapshot (e.g. another of our ships unloaded), this ship
+        # will be unloaded again at its next action
+        try:
+            results = self.batch(paths) if paths else []
+        except BatchError as e:
+            print(f"[!] Unload of {vaisseau.id} stopped: {e}")
+            results = e.results
+        for (action, res), result in zip(plan, results):
+            if action == "unload":
+                print("[*] Unloaded {} of {}".format(result["unloaded"], res))
+            else:
+                sold = result["removed_cargo"][1]
+                print("[*] Sold {} of {}, for {} credits".format(round(sold, 2), res, round(result["added_money"], 2)))
+        for res, amnt in kept.items():
+            if amnt > 0.0:
+                print(f"[*] Keeping {round(amnt, 2)} of {res} in the station, its price should rise")
 
-            unloaded = self.get(f"/ship/{vaisseau['id']}/unload/{res}/{amnt}")
-            sold = self.get(f"/market/{self.sta}/sell/{res}/{amnt}")
-
-            print("[*] Unloaded and sold {} of {}, for {} credits".format(
-                unloaded["unloaded"], res, sold["added_money"]
-            ))
-
-        self.ship_repair(vaisseau['id'])
-        self.ship_refuel(vaisseau['id'])
+        self.ship_repair(vaisseau.id)
+        self.ship_refuel(vaisseau.id)
 
 
     def buy_module_upgrade(self, sid):
-        ship = self.get(f"/ship/{sid}")
-        station = self.get(f"/station/{self.sta}")
+        ship = self.snapshot.get_ship(sid)
+        station = self.getStation()
 
-        if (ship["position"] == station["position"]):
+        if ship is not None and ship.position == station.position:
 
             print("[*] Verification de la possibilité d'achat d'une upgrade de module")
-            status = self.get("/player/" + str(self.pid))
+            status = self.snapshot.get_player()
             print("[*] Money : {} , Temps avant defaite: {}".format(
-                round(status["money"], 2), int(status["money"] / status["costs"])
+                round(status.money, 2), int(status.lifetime)
             ))
 
             listUpgrade = self.get(f"/station/{self.sta}/shop/modules/{sid}/upgrade")
             for module_id, module_info in listUpgrade.items():
-                if (module_info['price'] < status['money'] and (int((status["money"] - module_info['price']) / status["costs"]) > 500)):
+                if (module_info['price'] < status.money and (int((status.money - module_info['price']) / status.costs) > 500)):
                     upgrade = self.get(f"/station/{self.sta}/shop/modules/{sid}/upgrade/1")
                     print("[*] Fonds suffisants, module {} upgrade".format(
                         module_info['module-type']
@@ -511,19 +749,19 @@ class Game:
 
     
     def buy_ship_upgrade(self, sid):
-        ship = self.get(f"/ship/{sid}")
-        station = self.get(f"/station/{self.sta}")
+        ship = self.snapshot.get_ship(sid)
+        station = self.getStation()
 
-        if (ship["position"] == station["position"]):
+        if ship is not None and ship.position == station.position:
             print("[*] Verification de la possibilité d'achat d'une upgrade vaisseau")
             listInterestedUpgrade = ['ReactorUpgrade', 'CargoExpansion'] # HullUpgrade
             listUpgrade = self.get(f"/station/{self.sta}/shipyard/upgrade")
 
             for upgrade in listInterestedUpgrade:
                 tryUpgrade = listUpgrade[upgrade]
-                status = self.get("/player/" + str(self.pid))
+                status = self.snapshot.get_player()
 
-                if (tryUpgrade['price'] < status['money'] and (int((status["money"] - tryUpgrade['price']) / status["costs"]) > 500)):
+                if (tryUpgrade['price'] < status.money and (int((status.money - tryUpgrade['price']) / status.costs) > 500)):
 
                     buyUpgrade = self.get(f"/station/{self.sta}/shipyard/upgrade/{sid}/{upgrade}")
                     print("[*] Fonds suffisants, {} upgrade".format(
@@ -535,10 +773,10 @@ class Game:
                     ))
 
     def buy_human_upgrade(self, sid):
-        ship = self.get(f"/ship/{sid}")
-        station = self.get(f"/station/{self.sta}")
+        ship = self.snapshot.get_ship(sid)
+        station = self.getStation()
 
-        if (ship["position"] == station["position"]):
+        if ship is not None and ship.position == station.position:
             print("[*] Verification de la possibilité d'achat d'une upgrade equipage")
             upgradeListEquipage = self.get(f"/station/{self.sta}/crew/upgrade/ship/{sid}")
             operator_id = None
@@ -547,8 +785,8 @@ class Game:
                     operator_id = crew_id
                     operator_price = info["price"]
                     
-                    status = self.get("/player/" + str(self.pid))
-                    if operator_price < status["money"] and int((status["money"] - operator_price) / status["costs"]) > 500:
+                    status = self.snapshot.get_player()
+                    if operator_price < status.money and int((status.money - operator_price) / status.costs) > 500:
                         upgradeEquipage = self.get(f"/station/{self.sta}/crew/upgrade/ship/{sid}/{operator_id}")
                         print("[*] Operator upgrade")
                     else:
@@ -567,11 +805,12 @@ if __name__ == "__main__":
     print("In module products __package__, __name__ ==", __package__, __name__)
 
     if len(sys.argv) < 2:
-        print("Usage: player.py <playername>")
+        print("Usage: player.py <playername> [metrics_port]")
         sys.exit(1)
 
     name = sys.argv[1]
-    game = Game(name)
+    metrics_port = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    game = Game(name, metrics_port=metrics_port)
     game.init_game()
 
     stop_event = threading.Event()
@@ -580,7 +819,12 @@ if __name__ == "__main__":
 
     try:
         while True:
-            game.ActionToDo()
+            # A failed request (e.g. a ship moved meanwhile) only skips this turn
+            try:
+                game.ActionToDo()
+            except SimeisError as e:
+                print(f"\n[!] {e}")
+            game.wait_next_ship()
     except KeyboardInterrupt:
         stop_event.set()
         t.join(timeout=1)
@@ -0,0 +1,41 @@
+from array import array
+from collections import deque
+
+# Last `size` values of a series, with their max in O(1)
+#     - The values are kept in a fixed-size array used as a ring, the oldest one is overwritten
+#     - The max comes from a monotonic deque of (index, value): a value is dropped as soon as a
+#       newer one is bigger, so the front is always the max of the window
+#     - Each append costs O(1) amortized, whatever the size of the window
+class RollingMax:
+    __slots__ = ("size", "values", "count", "maxq")
+
+    def __init__(self, size=30):
+        self.size = size
+        self.values = array("d", bytes(8 * size))
+        self.count = 0
+        self.maxq = deque()
+
+    def append(self, value):
+        index = self.count
+        self.values[index % self.size] = value
+        self.count += 1
+        while len(self.maxq) > 0 and self.maxq[-1][1] <= value:
+            self.maxq.pop()
+        self.maxq.append((index, value))
+        if self.maxq[0][0] <= index - self.size:
+            self.maxq.popleft()
+
+    def max(self):
+        return self.maxq[0][1] if len(self.maxq) > 0 else None
+
+    def last(self):
+        return self.values[(self.count - 1) % self.size] if self.count > 0 else None
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    # The values of the window, oldest first
+    def window(self):
+        n = len(self)
+        start = self.count - n
+        return [self.values[i % self.size] for i in range(start, self.count)]
@@ -0,0 +1,99 @@
+import heapq
+import time
+import threading
+
+# Time (in secs) for an extraction to fill the free space of the cargo
+#     - `rates` is the reply of /ship/{sid}/extraction/start (units per second)
+#     - `resources` is the reply of /resources, for the volume of each unit
+def time_before_full(rates, cargo, resources):
+    vol_per_sec = sum(resources[res]["volume"] * rate for res, rate in rates.items())
+    if vol_per_sec <= 0:
+        return None
+    return max(cargo["capacity"] - cargo["usage"], 0) / vol_per_sec
+
+# Expected end of the actions of our ships, the earliest one on top of a heap
+#     - A ship has at most one deadline, a new action replaces the previous one
+#     - Replaced deadlines stay in the heap and are skipped when they reach the top
+#     - `margin` is added to every deadline, the server updates the ships every 20ms
+class Scheduler:
+    def __init__(self, margin=0.05):
+        self.margin = margin
+        self.heap = []
+        self.deadlines = {}
+        self.cond = threading.Condition()
+
+    # The ship will be done in `duration` secs
+    def expect(self, sid, duration):
+        deadline = time.monotonic() + duration + self.margin
+        with self.cond:
+            self.deadlines[sid] = deadline
+            heapq.heappush(self.heap, (deadline, sid))
+            self.cond.notify_all()
+        return deadline
+
+    def expect_extraction(self, sid, rates, cargo, resources):
+        duration = time_before_full(rates, cargo, resources)
+        if duration is None:
+            return None
+        return self.expect(sid, duration)
+
+    def cancel(self, sid):
+        with self.cond:
+            self.deadlines.pop(sid, None)
+
+    def pending(self, sid):
+        with self.cond:
+            return sid in self.deadlines
+
+    # Secs left before the deadline of this ship, None if we don't know it
+    def remaining(self, sid):
+        with self.cond:
+            deadline = self.deadlines.get(sid)
+        if deadline is None:
+            return None
+        return max(deadline - time.monotonic(), 0)
+
+    def drop_replaced(self):
+        while len(self.heap) > 0:
+            deadline, sid = self.heap[0]
+            if self.deadlines.get(sid) == deadline:
+                return
+            heapq.heappop(self.heap)
+
+    # Secs before the earliest deadline, None if no ship is busy
+    def next_delay(self):
+        with self.cond:
+            self.drop_replaced()
+            if len(self.heap) == 0:
+                return None
+            return max(self.heap[0][0] - time.monotonic(), 0)
+
+    # Remove and return the ships whose deadline has passed
+    def pop_due(self):
+        now = time.monotonic()
+        due = []
+        with self.cond:
+            self.drop_replaced()
+            while len(self.heap) > 0 and self.heap[0][0] <= now:
+                _, sid = heapq.heappop(self.heap)
+                del self.deadlines[sid]
+                due.append(sid)
+                self.drop_replaced()
+        return due
+
+    # Sleep until the earliest deadline (at most `timeout` secs), returns the ships due
+    # A new earlier deadline wakes us up, so it is never overslept
+    def wait_next(self, timeout=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                due = self.pop_due()
+                if len(due) > 0:
+                    return due
+                delay = self.next_delay()
+                if end is not None:
+                    left = end - time.monotonic()
+                    if left <= 0:
+                        return []
+                    delay = left if delay is None else min(delay, left)
+                self.cond.wait(delay)
@@ -0,0 +1,57 @@
+import os
+import json
+import time
+
+# Append-only log of the scores of /gamestats, one JSON object per line (NDJSON)
+#     - A line is written for a player only when its data changed since its last line:
+#       {"ts": <time of the poll>, "id": <player id>, ...the fields of /gamestats}
+#     - When the file gets bigger than `max_bytes`, it's renamed to <path>.1 (the older ones are
+#       shifted to .2, .3... and the last one deleted) and a new file is started
+#     - The last data of each player is written again at the start of each file, so any file
+#       can be read on its own
+
+SCORES_PATH = "scores.ndjson"
+
+class ScoreLog:
+    def __init__(self, path=SCORES_PATH, max_bytes=10 * 1024 * 1024, backups=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.last = {}
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, lines):
+        self.file.write("".join(lines))
+        self.file.flush()
+
+    # Logs the players that changed, returns the number of lines written
+    def append(self, info, ts=None):
+        ts = time.time() if ts is None else ts
+        lines = []
+        for pid, data in info.items():
+            prev = self.last.get(pid)
+            if prev == data:
+                continue
+            # A copy, the caller may change its dicts after this call
+            self.last[pid] = dict(data)
+            lines.append(json.dumps(dict(data, ts=ts, id=pid)) + "\n")
+        if len(lines) > 0:
+            self.write(lines)
+            if self.file.tell() >= self.max_bytes:
+                self.rotate(ts)
+        return len(lines)
+
+    def rotate(self, ts):
+        self.file.close()
+        if self.backups > 0:
+            for n in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{n}"):
+                    os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.write([json.dumps(dict(data, ts=ts, id=pid)) + "\n" for pid, data in self.last.items()])
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,1648 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import zlib
+import base64
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+import urllib.parse
+from collections import deque
+
+try:
+    from .forecast import (
+        MAX_AVG_AMPL, STD_DIV, UPD_PRICE_PROBA, MARKET_CHANGE_SEC, ITER_PERIOD,
+        PRICE_INC_DIV, PRICE_INC_RANGE_MAX, PRICE_INC_MIN_RATIO,
+    )
+    from .planner import EXRATE_DIFF_FACT, EXRATE_FACT, PLANET_DENSITY, SOLID, GASEOUS
+    from .spatial import SECTOR_SIZE
+except ImportError:
+    from forecast import (
+        MAX_AVG_AMPL, STD_DIV, UPD_PRICE_PROBA, MARKET_CHANGE_SEC, ITER_PERIOD,
+        PRICE_INC_DIV, PRICE_INC_RANGE_MAX, PRICE_INC_MIN_RATIO,
+    )
+    from planner import EXRATE_DIFF_FACT, EXRATE_FACT, PLANET_DENSITY, SOLID, GASEOUS
+    from spatial import SECTOR_SIZE
+
+# Offline game engine, a pure Python copy of simeis-server & simeis-data
+#     - `tick()` is Game::threadloop: wages, flights, extractions, destroyed ships, market
+#     - `request(path)` answers like the HTTP API (same routes, same JSON, same errors),
+#       `get(path, **qry)` decodes it like Game.get
+#     - Without `start`, the game only moves with `tick` / `advance`: a script can play hours of
+#       game in seconds, and with a seed the whole game is reproducible
+#     - With `start(speed)`, a thread runs the ticks `speed` times faster than real time, and
+#       `warp` makes the time of the bots (time.sleep, time.monotonic, the waits of the threading
+#       module) run at the same speed, so the bots of client.py / player.py play unchanged
+#       through a SimPool in place of their ConnectionPool
+
+VERSION = "0.1.2"
+U16, U32, U64 = (1 << 16) - 1, (1 << 32) - 1, (1 << 64) - 1
+
+# Same as the server (simeis-data/src/...), in the order of the Resource enum
+# Name: (base price, volume, extraction difficulty, min rank)
+RESOURCES = {
+    "Stone": (8.0, 0.75, 0.25, 0),
+    "Iron": (32.0, 2.5, 0.7, 2),
+    "Copper": (92.0, 3.0, 1.9, 5),
+    "Gold": (160.0, 0.25, 2.95, 9),
+    "Helium": (8.0, 0.75, 0.25, 0),
+    "Ozone": (32.0, 2.5, 0.7, 2),
+    "Freon": (92.0, 3.0, 1.9, 5),
+    "Oxygen": (160.0, 0.25, 2.95, 9),
+    "Fuel": (1.9, 2.0, None, 0),
+    "HullPlate": (0.75, 0.05, None, 0),
+}
+VOLUME = {res: info[1] for res, info in RESOURCES.items()}
+MIN_RANK = {res: info[3] for res, info in RESOURCES.items()}
+
+INIT_MONEY = 72000.0
+SYSLOG_DEFAULT_SIZE = 1000
+PLANETS_PER_SECTOR = 3
+STATION_FPLANET_DIST = 500.0
+STATION_INIT_CARGO = 1000.0
+CARGO_BASE_PRICE = 2.0
+CARGO_PRICE_INCDIV = 1000.0
+BASE_FEE_RATE = 26.0 / 100.0
+FEE_RATE_DEC_POWF = 1.15
+WAGE_INC_RANK_POWF = 0.85
+RANK_PRICE_WAGE_MULT = 1900.0
+WAGES = {"Pilot": 5.5, "Operator": 0.9, "Trader": 2.6, "Soldier": 1.5}
+MODULE_PRICE = 4500.0
+MOD_UPG_POWF_DIV = 75.0
+PILOT_FUEL_SHARE = 5
+HULL_USAGE_BASE = 5.0 / 100.0
+REACTOR_SPEED_PER_POWER = 50.0
+FUEL_TANK_CAP_PRICE = 30.0
+CARGO_CAP_PRICE = 20.0
+HULL_DECAY_CAP_PRICE = 9.0
+REACTOR_POWER_PRICE = 4000.0
+SHIELD_PRICE = 2500.0
+BATCH_MAX_SIZE = 64
+
+# Name: (price, description), in the order of the ShipUpgrade enum
+UPGRADES = {
+    "CargoExpansion": (150.0 * CARGO_CAP_PRICE, "Adds 150 of cargo capacity"),
+    "ReactorUpgrade": (REACTOR_POWER_PRICE, "Increase the reactor power by 1, improves the ship's speed"),
+    "HullUpgrade": (100.0 * HULL_DECAY_CAP_PRICE, "Increase the hull decay capacity by 100"),
+    "Shield": (SHIELD_PRICE, "Reduce the damage and usure of the hull"),
+}
+
+ERRMSG = {
+    "NoPlayerKey": "No player key provided with the request",
+    "PlayerNotFound": "No player was found with this ID: {0}",
+    "PlayerAlreadyExists": "Player {1} already exists under the id {0}",
+    "NoPlayerWithKey": "No player with this key exists in this game",
+    "ShipNotFound": "Ship of id {0} not found",
+    "NotEnoughMoney": "Not enough money, need {1}, got {0}",
+    "InvalidArgument": "Argument {0} has an invalid value",
+    "ShipNotExtracting": "This ship is not extracting",
+    "ShipNotIdle": "The ship is already occupied with a task",
+    "CrewMemberNotIdle": "Crew member {0} is already occupied",
+    "CrewNotNeeded": "This crew member is not needed aboard this ship",
+    "CannotPerformTravel": "This travel cannot be done with the current state of the ship",
+    "NullDistance": "You already are on this coordinates",
+    "NoSuchStation": "You don't own any station of id {0}",
+    "NoSuchModule": "Ship module of id {0} doesn't exist",
+    "CannotExtractWithoutPlanet": "Cannot extract resources, this ship is not on a planet",
+    "ShipNotInStation": "This ship is not docked on station",
+    "WrongCrewType": "This module requires a crew member of type {0}",
+    "CargoFull": "The cargo is full",
+    "NoTraderAssigned": "This station doesn't have a trader assigned",
+    "NoPilotAssigned": "No pilot is assigned on this ship",
+    "BuyNothing": "Either you attempted to BUY 0 units, or you don't have enough space in cargo to hold the resources",
+    "SellNothing": "Either you attempted to SELL 0 units, or you don't have any unit of this resource in your cargo",
+    "NoFuelInCargo": "You don't have any fuel in the station cargo",
+    "NoHullPlateInCargo": "You don't have any hull plate in the station cargo",
+    "CrewMemberNotFound": "Crew member of id {0} not found",
+    "PlayerLost": "This player lost the game and cannot play anymore",
+    "GameSignalSend": "Error while sending a game signal to state",
+}
+
+# Real time, the engine thread never uses the time of the bots (see warp)
+_sleep = time.sleep
+_perf = time.perf_counter
+_time = time.time
+_monotonic = time.monotonic
+_cond_wait = threading.Condition.wait
+_threading_time = threading._time
+
+class SimeisError(Exception):
+    pass
+
+# Raised in a bot waiting for the game once the simulation is stopped, the time won't come
+# Not an Exception, the bots catching their errors must not retry on it
+class SimulationStopped(BaseException):
+    pass
+
+# Set in the threads of the bots (see play), the threads they start are left alone
+_bot = threading.local()
+
+# A variant of a Rust enum, printed without quotes in the errors
+class Variant(str):
+    pass
+
+# Formats a float like Rust, "{}" drops the ".0" of the integers, "{:?}" keeps it
+def rust_float(x, debug=False):
+    if math.isfinite(x) and x == int(x) and abs(x) < 1e16:
+        return f"{int(x)}.0" if debug else str(int(x))
+    return repr(x)
+
+# Errcode of the server, `type` is its Debug form: "ShipNotFound(42)"
+class ApiError(Exception):
+    def __init__(self, code, *args):
+        super().__init__(code)
+        self.code = code
+        self.args_ = args
+
+    def message(self):
+        return ERRMSG[self.code].format(*[
+            rust_float(a) if isinstance(a, float) else a for a in self.args_
+        ])
+
+    def type(self):
+        if len(self.args_) == 0:
+            return self.code
+        args = []
+        for a in self.args_:
+            if isinstance(a, float):
+                args.append(rust_float(a, debug=True))
+            elif isinstance(a, str) and not isinstance(a, Variant):
+                args.append(json.dumps(a))
+            else:
+                args.append(str(a))
+        return f"{self.code}({', '.join(args)})"
+
+    def to_json(self):
+        return {"error": self.message(), "type": self.type()}
+
+class NotFound(Exception):
+    pass
+
+# Cast of a f64 to a u32 in Rust: truncated, and saturated in [0, u32::MAX]
+def as_u32(x):
+    if x != x:
+        return 0
+    return max(0, min(int(x), U32))
+
+# Variant of an enum from its name, case insensitive like strum
+def parse_variant(name, variants, arg):
+    for variant in variants:
+        if variant.lower() == name.lower():
+            return variant
+    raise ApiError("InvalidArgument", arg)
+
+def fee_rate(rank):
+    return BASE_FEE_RATE / (rank ** FEE_RATE_DEC_POWF)
+
+class CrewMember:
+    __slots__ = ("member_type", "rank")
+
+    def __init__(self, member_type, rank=1):
+        self.member_type = member_type
+        self.rank = rank
+
+    def wage(self):
+        return WAGES[self.member_type] * (self.rank ** WAGE_INC_RANK_POWF)
+
+    def price_next_rank(self):
+        return self.wage() * RANK_PRICE_WAGE_MULT
+
+    def to_json(self):
+        return {"member_type": self.member_type, "rank": self.rank}
+
+def sum_wages(crew):
+    return sum(crew[cid].wage() for cid in sorted(crew))
+
+def crew_json(crew):
+    return {str(cid): cm.to_json() for cid, cm in crew.items()}
+
+class Cargo:
+    __slots__ = ("capacity", "usage", "resources")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.usage = 0.0
+        self.resources = {}
+
+    # Returns the amount actually added, the overflow is dropped
+    def add_resource(self, res, amnt):
+        volume = VOLUME[res]
+        added = volume * amnt
+        if self.usage == self.capacity:
+            return 0.0
+        elif self.usage + added > self.capacity:
+            overflow = self.usage + added - self.capacity
+            amnt -= overflow / volume
+            self.usage = self.capacity
+        else:
+            self.usage += added
+        self.resources[res] = self.resources.get(res, 0.0) + amnt
+        return amnt
+
+    def is_full(self):
+        return self.usage == self.capacity
+
+    def unload(self, res, amnt):
+        got = self.resources.get(res)
+        if got is None:
+            return 0.0
+        unload = min(got, amnt)
+        self.resources[res] = got - unload
+        self.usage = max(self.usage - VOLUME[res] * unload, 0.0)
+        self.usage = math.floor(self.usage * 1000.0 + 0.5) / 1000.0
+        return unload
+
+    def space_for(self, res):
+        return (self.capacity - self.usage) / VOLUME[res]
+
+    def to_json(self):
+        return {"capacity": self.capacity, "usage": self.usage, "resources": dict(self.resources)}
+
+class Module:
+    __slots__ = ("operator", "modtype", "rank", "totalcost")
+
+    def __init__(self, modtype):
+        self.operator = None
+        self.modtype = modtype
+        self.rank = 1
+        self.totalcost = 0.0
+
+    def price_next_rank(self):
+        return MODULE_PRICE ** ((MOD_UPG_POWF_DIV - 1.0 + self.rank) / MOD_UPG_POWF_DIV)
+
+    # Units per second of each resource of the planet this module can extract
+    def can_extract(self, crew, planet):
+        if self.operator is None:
+            return []
+        oprank = crew[self.operator].rank
+        kind = SOLID if self.modtype == "Miner" else GASEOUS
+        if planet.solid != (self.modtype == "Miner"):
+            return []
+        rates = []
+        for res in kind:
+            _, _, difficulty, min_rank = RESOURCES[res]
+            if oprank <= min_rank:
+                continue
+            rank = (oprank - min_rank) * self.rank
+            rates.append((res, PLANET_DENSITY * (rank / difficulty ** EXRATE_DIFF_FACT) ** EXRATE_FACT))
+        return rates
+
+    def to_json(self):
+        return {"operator": self.operator, "modtype": self.modtype, "rank": self.rank, "totalcost": self.totalcost}
+
+class Flight:
+    __slots__ = ("start", "destination", "delta", "direction", "dist_done", "dist_tot")
+
+    def __init__(self, start, destination, cost):
+        self.start = start
+        self.destination = destination
+        self.delta = tuple(float(b) - float(a) for a, b in zip(start, destination))
+        self.direction = cost["direction"]
+        self.dist_done = 0.0
+        self.dist_tot = cost["distance"]
+
+    def to_json(self):
+        return {
+            "start": list(self.start), "destination": list(self.destination),
+            "delta": list(self.delta), "direction": list(self.direction),
+            "dist_done": self.dist_done, "dist_tot": self.dist_tot,
+        }
+
+class Ship:
+    __slots__ = (
+        "id", "reactor_power", "fuel_tank_capacity", "hull_decay_capacity", "modules",
+        "shield_power", "position", "crew", "cargo", "fuel_tank", "hull_decay", "pilot",
+        "state", "task", "speed", "fuel_consumption", "hull_usage_rate",
+    )
+
+    def __init__(self, sid, position, reactor_power, fuel_tank_capacity, cargo, hull_decay_capacity, shield_power=0):
+        self.id = sid
+        self.reactor_power = reactor_power
+        self.fuel_tank_capacity = fuel_tank_capacity
+        self.hull_decay_capacity = hull_decay_capacity
+        self.modules = {}
+        self.shield_power = shield_power
+        self.position = position
+        self.crew = {}
+        self.cargo = Cargo(cargo)
+        self.fuel_tank = 0.0
+        self.hull_decay = 0.0
+        self.pilot = None
+        # "Idle", "InFlight" (task: Flight) or "Extracting" (task: [(resource, rate)])
+        self.state = "Idle"
+        self.task = None
+        self.speed = 0.0
+        self.fuel_consumption = 0.0
+        self.hull_usage_rate = 0.0
+
+    @staticmethod
+    def shipyard(rng, position):
+        return [
+            Ship(rng.getrandbits(64), position, 1, 1000.0, 200.0, 3000.0, 0),
+            Ship(rng.getrandbits(64), position, 3, 2000.0, 400.0, 6000.0, 1),
+            Ship(rng.getrandbits(64), position, 10, 4000.0, 1200.0, 20000.0, 3),
+        ]
+
+    @staticmethod
+    def random(rng, position):
+        cargo = rng.uniform(10.0, 1000.0)
+        return Ship(
+            rng.getrandbits(64), position, rng.randrange(1, 10),
+            float(rng.randrange(1, 10000)), cargo, float(rng.randrange(1000, 50000)),
+        )
+
+    def compute_price(self):
+        return (
+            self.reactor_power * REACTOR_POWER_PRICE
+            + self.fuel_tank_capacity * FUEL_TANK_CAP_PRICE
+            + self.cargo.capacity * CARGO_CAP_PRICE
+            + self.hull_decay_capacity * HULL_DECAY_CAP_PRICE
+            + sum(m.totalcost for m in self.modules.values())
+        )
+
+    def update_perf_stats(self):
+        self.hull_usage_rate = HULL_USAGE_BASE / (1.0 + math.log(1.0 + self.shield_power, 3.5))
+        self.fuel_consumption = float(self.reactor_power)
+        if self.pilot is not None:
+            rank = self.crew[self.pilot].rank
+            totshare = PILOT_FUEL_SHARE * 10.0
+            self.fuel_consumption *= (totshare - rank) / totshare
+            self.speed = self.reactor_power * REACTOR_SPEED_PER_POWER * rank
+        else:
+            self.speed = 0.0
+
+    def compute_travel_costs(self, destination):
+        if self.pilot is None:
+            raise ApiError("NoPilotAssigned")
+        delta = [float(b) - float(a) for a, b in zip(self.position, destination)]
+        distance = math.sqrt(delta[0] ** 2 + delta[1] ** 2 + delta[2] ** 2)
+        if distance == 0.0:
+            raise ApiError("NullDistance")
+        duration = distance / self.speed
+        return {
+            "direction": [d / distance for d in delta],
+            "distance": distance,
+            "duration": duration,
+            "fuel_consumption": self.fuel_consumption * duration,
+            "hull_usage": self.hull_usage_rate * distance,
+        }
+
+    def set_travel(self, destination):
+        if self.state != "Idle":
+            raise ApiError("ShipNotIdle")
+        cost = self.compute_travel_costs(destination)
+        if not (self.fuel_tank >= cost["fuel_consumption"]
+                and self.hull_decay_capacity - self.hull_decay >= cost["hull_usage"]):
+            raise ApiError("CannotPerformTravel")
+        self.state = "InFlight"
+        self.task = Flight(self.position, destination, cost)
+        return cost
+
+    # Returns True when the flight is over: arrived, out of fuel, or worn out hull
+    def update_flight(self, tdelta):
+        data = self.task
+        finished = False
+        dist_delta = self.speed * tdelta
+        data.dist_done += dist_delta
+        if data.dist_done > data.dist_tot:
+            finished = True
+            doverflow = data.dist_done - data.dist_tot
+            data.dist_done -= doverflow
+            dist_delta -= doverflow
+            tdelta -= doverflow / self.speed
+
+        start, direction, dist = data.start, data.direction, data.dist_done
+        self.position = (
+            as_u32(start[0] + dist * direction[0]),
+            as_u32(start[1] + dist * direction[1]),
+            as_u32(start[2] + dist * direction[2]),
+        )
+
+        self.fuel_tank -= self.fuel_consumption * tdelta
+        if self.fuel_tank <= 0.0:
+            self.fuel_tank = 0.0
+            return True
+
+        self.hull_decay += self.hull_usage_rate * dist_delta
+        if self.hull_decay >= self.hull_decay_capacity:
+            return True
+        return finished
+
+    # Returns True when the cargo is full
+    def update_extract(self, tdelta):
+        cargo = self.cargo
+        for res, rate in self.task:
+            cargo.add_resource(res, rate * tdelta)
+        return cargo.usage == cargo.capacity
+
+    def state_json(self):
+        if self.state == "Idle":
+            return "Idle"
+        if self.state == "InFlight":
+            return {"InFlight": self.task.to_json()}
+        return {"Extracting": dict(self.task)}
+
+    def to_json(self):
+        return {
+            "id": self.id,
+            "reactor_power": self.reactor_power,
+            "fuel_tank_capacity": self.fuel_tank_capacity,
+            "hull_decay_capacity": self.hull_decay_capacity,
+            "modules": {str(mid): m.to_json() for mid, m in self.modules.items()},
+            "shield_power": self.shield_power,
+            "position": list(self.position),
+            "crew": crew_json(self.crew),
+            "cargo": self.cargo.to_json(),
+            "fuel_tank": self.fuel_tank,
+            "hull_decay": self.hull_decay,
+            "pilot": self.pilot,
+            "state": self.state_json(),
+            "stats": {
+                "speed": self.speed,
+                "fuel_consumption": self.fuel_consumption,
+                "hull_usage_rate": self.hull_usage_rate,
+            },
+        }
+
+class Planet:
+    __slots__ = ("position", "temperature", "solid")
+
+    def __init__(self, position, rng):
+        self.solid = rng.random() < 0.4
+        self.temperature = rng.getrandbits(16)
+        self.position = position
+
+    def to_json(self):
+        return {"position": list(self.position), "temperature": self.temperature, "solid": self.solid}
+
+class Station:
+    __slots__ = ("id", "position", "idle_crew", "crew", "shipyard", "cargo", "trader")
+
+    def __init__(self, sid, position, rng):
+        self.id = sid
+        self.position = position
+        self.idle_crew = {}
+        self.crew = {}
+        self.shipyard = Ship.shipyard(rng, position)
+        self.cargo = Cargo(STATION_INIT_CARGO)
+        self.trader = None
+
+    def cargo_price(self):
+        return CARGO_BASE_PRICE ** ((self.cargo.capacity - STATION_INIT_CARGO) / CARGO_PRICE_INCDIV)
+
+    def trader_member(self):
+        if self.trader is None:
+            raise ApiError("NoTraderAssigned")
+        return self.crew[self.trader]
+
+    def to_json(self):
+        return {
+            "id": self.id,
+            "position": list(self.position),
+            "crew": crew_json(self.crew),
+            "cargo": self.cargo.to_json(),
+            "idle_crew": crew_json(self.idle_crew),
+            "trader": self.trader,
+        }
+
+class Player:
+    __slots__ = ("created", "id", "key", "score", "lost", "name", "money", "costs", "stations", "ships")
+
+    def __init__(self, name, station, created, rng):
+        self.created = created
+        # Derived from the name like on the server, with another hash function
+        self.id = zlib.crc32(name.encode()) % U16
+        self.key = base64.b64encode(rng.randbytes(128)).decode()
+        self.score = 0.0
+        self.lost = False
+        self.name = name
+        self.money = INIT_MONEY
+        self.costs = 0.0
+        self.stations = {station.id: station.position}
+        self.ships = {}
+
+# Sector of the galaxy, as the (start, end) of each axis
+def compute_sector(pos):
+    return tuple((c - c % SECTOR_SIZE, min(c - c % SECTOR_SIZE + SECTOR_SIZE, U32)) for c in pos)
+
+def in_sector(pos, sector, inclusive=True):
+    if inclusive:
+        return all(s <= c <= e for c, (s, e) in zip(pos, sector))
+    return all(s <= c < e for c, (s, e) in zip(pos, sector))
+
+class Galaxy:
+    def __init__(self, rng):
+        self.rng = rng
+        self.objects = {}     # Position -> Planet or Station
+        self.cells = {}       # Start of a sector -> positions of its objects
+        self.discovered = set()
+
+    def starts(self, sector):
+        return tuple(s for s, _ in sector)
+
+    def insert(self, pos, obj):
+        if pos in self.objects:
+            return False
+        self.objects[pos] = obj
+        self.cells.setdefault(self.starts(compute_sector(pos)), []).append(pos)
+        return True
+
+    # The bounds of the sectors are inclusive on the server, an object on the upper bound of a
+    # sector also belongs to it: look in the sector, and in the next one on each axis
+    def list_objects_in_sector(self, sector):
+        start = self.starts(sector)
+        found = []
+        for dx in (0, SECTOR_SIZE):
+            for dy in (0, SECTOR_SIZE):
+                for dz in (0, SECTOR_SIZE):
+                    for pos in self.cells.get((start[0] + dx, start[1] + dy, start[2] + dz), ()):
+                        if in_sector(pos, sector):
+                            found.append(pos)
+        return [self.objects[pos] for pos in sorted(found)]
+
+    def is_discovered(self, pos):
+        candidates = [
+            {c - c % SECTOR_SIZE} | ({c - SECTOR_SIZE} if c % SECTOR_SIZE == 0 and c > 0 else set())
+            for c in pos
+        ]
+        return any((x, y, z) in self.discovered for x in candidates[0] for y in candidates[1] for z in candidates[2])
+
+    def generate_sector(self, pos):
+        sector = compute_sector(pos)
+        self.discovered.add(self.starts(sector))
+        rng = self.rng
+        for _ in range(PLANETS_PER_SECTOR):
+            coord = tuple(rng.randrange(s, e) for s, e in sector)
+            self.insert(coord, Planet(coord, rng))
+        return sector
+
+    def near(self, pos, dist):
+        theta = self.rng.uniform(0.0, 2.0 * math.pi)
+        phi = self.rng.uniform(0.0, math.pi)
+        return (
+            as_u32(pos[0] + dist * math.sin(phi) * math.cos(theta)),
+            as_u32(pos[1] + dist * math.sin(phi) * math.sin(theta)),
+            as_u32(pos[2] + dist * math.cos(phi)),
+        )
+
+    # A new sector, with the station STATION_FPLANET_DIST away from its nearest planet
+    def init_new_station(self):
+        rng = self.rng
+        coord = (rng.getrandbits(32), rng.getrandbits(32), rng.getrandbits(32))
+        while self.is_discovered(coord):
+            coord = (rng.getrandbits(32), rng.getrandbits(32), rng.getrandbits(32))
+        sid = rng.getrandbits(16)
+        sector = self.generate_sector(coord)
+        planets = [obj for obj in self.list_objects_in_sector(sector) if isinstance(obj, Planet)]
+        first = planets[0]
+
+        for _ in range(10000):
+            pos = self.near(first.position, STATION_FPLANET_DIST)
+            while not in_sector(pos, sector, inclusive=False) or pos in self.objects:
+                pos = self.near(first.position, STATION_FPLANET_DIST)
+            mindist = min(math.dist(p.position, pos) for p in planets)
+            if abs(mindist - STATION_FPLANET_DIST) < 1.0:
+                break
+        else:
+            raise RuntimeError("Too many retries")
+
+        station = Station(sid, pos, rng)
+        self.insert(pos, station)
+        return station
+
+    # Station::scan always uses the rank 1, it only sees the sector of the station
+    def scan(self, center):
+        planets, stations = [], []
+        for obj in self.list_objects_in_sector(compute_sector(center)):
+            if isinstance(obj, Planet):
+                planets.append(obj.to_json())
+            else:
+                stations.append({"id": obj.id, "position": list(obj.position)})
+        return {"planets": planets, "stations": stations}
+
+class Market:
+    def __init__(self, rng):
+        self.rng = rng
+        self.prices = {res: info[0] for res, info in RESOURCES.items()}
+
+    def update_prices(self):
+        rng = self.rng
+        new_prices = []
+        for res, price in self.prices.items():
+            if rng.random() >= UPD_PRICE_PROBA:
+                continue
+            avg = (1.0 - price / RESOURCES[res][0]) * MAX_AVG_AMPL
+            std = abs(avg) + MAX_AVG_AMPL / STD_DIV
+            new_prices.append((res, price * (1.0 + rng.gauss(avg, std))))
+        for res, price in new_prices:
+            self.prices[res] = price
+
+    # A buy raises the price, a sale lowers it, by a random part of (value / PRICE_INC_DIV)
+    def trade(self, rank, res, amnt, buy):
+        rate = fee_rate(rank)
+        cost = amnt * self.prices[res]
+        fees = cost * rate
+        change_max = (cost / PRICE_INC_DIV) * PRICE_INC_RANGE_MAX
+        change = self.rng.uniform(change_max * PRICE_INC_MIN_RATIO, change_max)
+        self.prices[res] *= (1.0 + change) if buy else (1.0 - change)
+        return cost, fees
+
+# Route of the API, its arguments are parsed with the types of the server
+# A path not matching, or with an argument of the wrong type, is a 404 like on ntex
+ARG_TYPES = {
+    "u16": U16, "u32": U32, "u64": U64, "usize": U64, "f64": float, "str": str,
+}
+INTEGER = re.compile(r"^\+?\d+$")
+
+def parse_arg(value, kind, name):
+    bound = ARG_TYPES[kind]
+    if bound is str:
+        return urllib.parse.unquote(value)
+    if bound is float:
+        try:
+            return float(value)
+        except ValueError:
+            raise ApiError("InvalidArgument", name)
+    if not INTEGER.match(value) or int(value) > bound:
+        raise ApiError("InvalidArgument", name)
+    return int(value)
+
+class Route:
+    def __init__(self, pattern, handler, player=True):
+        self.handler = handler
+        self.player = player
+        self.parts = []
+        for part in pattern.strip("/").split("/"):
+            if part.startswith("{"):
+                name, kind = part[1:-1].split(":")
+                self.parts.append((name, kind))
+            else:
+                self.parts.append((part, None))
+
+    # The arguments of the handler, None if the path is not this route
+    def match(self, parts):
+        if len(parts) != len(self.parts):
+            return None
+        args = []
+        for value, (name, kind) in zip(parts, self.parts):
+            if kind is None:
+                if value != name:
+                    return None
+            else:
+                args.append((value, kind, name))
+        return args
+
+    def parse(self, args):
+        return [parse_arg(value, kind, name) for value, kind, name in args]
+
+# Same order as api::configure, the first matching route wins
+ROUTES = [Route(pattern, handler, player) for pattern, handler, player in [
+    ("/tick", "tick_server", False),
+    ("/tick/{n:usize}", "tick_server_n", False),
+    ("/ping", "ping", False),
+    ("/version", "get_version", False),
+    ("/gamestats", "gamestats", False),
+    ("/tickstats", "tickstats", False),
+    ("/resources", "resources_info", False),
+    ("/syslogs", "get_syslogs", True),
+    ("/batch", "batch", True),
+    ("/station/{station_id:u16}/crew/hire/{crewtype:str}", "hire_crew_member", True),
+    ("/station/{station_id:u16}/crew/upgrade/ship/{ship_id:u64}", "get_crew_upgrades", True),
+    ("/station/{station_id:u16}/crew/upgrade/ship/{ship_id:u64}/{crew_id:u32}", "buy_crew_upgrade", True),
+    ("/station/{station_id:u16}/crew/upgrade/trader", "upgrade_station_trader", True),
+    ("/station/{station_id:u16}/crew/assign/{crewid:u32}/{shipid:u64}/pilot", "assign_pilot_on", True),
+    ("/station/{station_id:u16}/crew/assign/{crewid:u32}/{shipid:u64}/{modid:u16}", "assign_operator_on", True),
+    ("/station/{station_id:u16}/crew/assign/{crewid:u32}/trading", "assign_trader_on", True),
+    ("/station/{station_id:u16}/scan", "scan", True),
+    ("/ship/{ship_id:u64}/travelcost/{x:u32}/{y:u32}/{z:u32}", "compute_travel_costs", True),
+    ("/ship/{ship_id:u64}", "ship_status", True),
+    ("/ship/{ship_id:u64}/navigate/{x:u32}/{y:u32}/{z:u32}", "navigate", True),
+    ("/ship/{ship_id:u64}/navigation/stop", "stop_navigation", True),
+    ("/station/{station_id:u16}/shipyard/buy/{id:u64}", "shipyard_buy_ship", True),
+    ("/station/{station_id:u16}/shipyard/list", "list_shipyard_ships", True),
+    ("/station/{station_id:u16}/shipyard/upgrade/{ship_id:u64}/{upgrade_type:str}", "shipyard_buy_upgrade", True),
+    ("/station/{station_id:u16}/shipyard/upgrade", "shipyard_list_upgrades", True),
+    ("/station/{station_id:u16}/shop/modules/{ship_id:u64}/buy/{modtype:str}", "buy_module", True),
+    ("/station/{station_id:u16}/shop/modules/{ship_id:u64}/upgrade", "get_ship_module_upgrade_prices", True),
+    ("/station/{station_id:u16}/shop/modules/{ship_id:u64}/upgrade/{modid:u16}", "buy_ship_module_upgrade", True),
+    ("/station/{station_id:u16}/shop/modules", "get_prices_ship_module", True),
+    ("/ship/{ship_id:u64}/extraction/start", "extract", True),
+    ("/ship/{ship_id:u64}/extraction/stop", "stop_extraction", True),
+    ("/ship/{ship_id:u64}/unload/{resource:str}/{amount:f64}", "unload", True),
+    ("/station/{station_id:u16}", "station_status", True),
+    ("/station/{station_id:u16}/upgrades", "get_station_upgrades", True),
+    ("/station/{station_id:u16}/shop/cargo/buy/{amount:usize}", "buy_station_cargo", True),
+    ("/station/{station_id:u16}/refuel/{ship_id:u64}", "refuel", True),
+    ("/station/{station_id:u16}/repair/{ship_id:u64}", "repair", True),
+    ("/market/{station_id:u16}/fee_rate", "get_fee_rate", True),
+    ("/market/prices", "get_market_prices", False),
+    ("/market/{station_id:u16}/buy/{resource:str}/{amnt:f64}", "market_buy", True),
+    ("/market/{station_id:u16}/sell/{resource:str}/{amnt:f64}", "market_sell", True),
+    ("/player/{id:u16}", "get_player", False),
+    ("/player/new/{name:str}", "new_player", False),
+]]
+
+# The actions that can be chained in a /batch (see run_batch_path in api.rs)
+BATCH_ROUTES = [Route(pattern, handler) for pattern, handler in [
+    ("/ship/{ship_id:u64}", "ship_status"),
+    ("/ship/{ship_id:u64}/navigate/{x:u32}/{y:u32}/{z:u32}", "navigate"),
+    ("/ship/{ship_id:u64}/extraction/start", "extract"),
+    ("/ship/{ship_id:u64}/unload/{resource:str}/{amount:f64}", "unload"),
+    ("/station/{station_id:u16}", "station_status"),
+    ("/station/{station_id:u16}/crew/hire/{crewtype:str}", "hire_crew_member"),
+    ("/station/{station_id:u16}/crew/assign/{crewid:u32}/trading", "assign_trader_on"),
+    ("/station/{station_id:u16}/crew/assign/{crewid:u32}/{shipid:u64}/pilot", "assign_pilot_on"),
+    ("/station/{station_id:u16}/crew/assign/{crewid:u32}/{shipid:u64}/{modid:u16}", "assign_operator_on"),
+    ("/station/{station_id:u16}/shop/modules/{ship_id:u64}/buy/{modtype:str}", "buy_module"),
+    ("/station/{station_id:u16}/refuel/{ship_id:u64}", "refuel"),
+    ("/station/{station_id:u16}/repair/{ship_id:u64}", "repair"),
+    ("/market/{station_id:u16}/buy/{resource:str}/{amnt:f64}", "market_buy"),
+    ("/market/{station_id:u16}/sell/{resource:str}/{amnt:f64}", "market_sell"),
+]]
+
+# syslog::EventLog, the last events of a player with their sequence number
+class Syslog:
+    def __init__(self, size):
+        self.events = deque(maxlen=max(size, 1))
+        self.next = 0
+        self.drained = 0
+
+    def push(self, event):
+        self.events.append(event)
+        self.next += 1
+
+    # Events from `since`, or the ones not read yet by the calls without `since`
+    def read(self, since=None):
+        first = self.next - len(self.events)
+        if since is None:
+            since, self.drained = self.drained, self.next
+        start = min(max(since - first, 0), len(self.events))
+        return first, [(first + n, self.events[n]) for n in range(start, len(self.events))]
+
+def query_param(query, name):
+    for q in query.split("&"):
+        if q.startswith(name + "="):
+            return urllib.parse.unquote(q[len(name) + 1:])
+    return None
+
+class Simulation:
+    def __init__(self, seed=None, tstart=None):
+        self.rng = random.Random(seed)
+        self.lock = threading.RLock()
+        self.tstart = _time() if tstart is None else tstart
+        self.galaxy = Galaxy(self.rng)
+        self.market = Market(self.rng)
+        self.players = {}
+        self.index = {}      # Key -> player ID
+        self.syslogs = {}    # Player ID -> Syslog
+        self.syslog_size = int(os.environ.get("SIMEIS_SYSLOG_SIZE", SYSLOG_DEFAULT_SIZE))
+        self.ticks = 0
+        self.market_tick = 0
+        # Real-time mode, see start()
+        self.speed = None
+        self.mark = (0, 0.0)   # (ticks, real time of the last tick)
+        self.thread = None
+        self.stopped = False
+        self.tick_time = 0.0   # Real secs spent in the ticks
+        self.tick_last = 0.0
+        self.tick_max = 0.0
+        self.tick_slow = 0     # Ticks longer than ITER_PERIOD
+
+    # Secs of game since the start, between two ticks the clock runs at `speed` times real time
+    def elapsed(self):
+        ticks, real = self.mark
+        secs = ticks * ITER_PERIOD
+        if self.speed is not None:
+            secs += min((_perf() - real) * self.speed, ITER_PERIOD)
+        return secs
+
+    def time(self):
+        return self.tstart + self.elapsed()
+
+    def event(self, pid, evtype, data=None):
+        log = self.syslogs.get(pid)
+        if log is None:
+            log = self.syslogs[pid] = Syslog(self.syslog_size)
+        log.push((self.elapsed(), evtype, evtype if data is None else {evtype: data}))
+
+    # Game::threadloop
+    def tick(self, n=1):
+        for _ in range(n):
+            with self.lock:
+                tstart = _perf()
+                self.tick_once()
+                self.ticks += 1
+                now = _perf()
+                self.mark = (self.ticks, now)
+                self.tick_time += now - tstart
+                self.tick_last = now - tstart
+                self.tick_max = max(self.tick_max, self.tick_last)
+                self.tick_slow += self.tick_last > ITER_PERIOD
+
+    def tick_once(self):
+        market_change_proba = min((self.ticks - self.market_tick) * ITER_PERIOD / MARKET_CHANGE_SEC, 1.0)
+        for pid in sorted(self.players):
+            player = self.players[pid]
+            self.update_money(player, ITER_PERIOD)
+
+            deadships = []
+            for sid in sorted(player.ships):
+                ship = player.ships[sid]
+                if ship.state == "InFlight":
+                    if ship.update_flight(ITER_PERIOD):
+                        ship.state, ship.task = "Idle", None
+                        if ship.hull_decay >= ship.hull_decay_capacity:
+                            deadships.append(sid)
+                        else:
+                            self.event(pid, "ShipFlightFinished", sid)
+                elif ship.state == "Extracting":
+                    if ship.update_extract(ITER_PERIOD):
+                        ship.state, ship.task = "Idle", None
+                        self.event(pid, "ExtractionStopped", sid)
+            for sid in deadships:
+                self.event(pid, "ShipDestroyed", sid)
+                del player.ships[sid]
+
+        if self.rng.random() < market_change_proba:
+            self.market.update_prices()
+            self.market_tick = self.ticks
+
+    def update_money(self, player, tdelta):
+        before = player.money < player.costs * 60.0
+        player.money -= player.costs * tdelta
+        after = player.money < player.costs * 60.0
+        if after and not before:
+            tleft = player.money / player.costs
+            secs = int(tleft)
+            self.event(player.id, "LowFunds", {"secs": secs, "nanos": int((tleft - secs) * 1e9)})
+        if player.money < 0.0 and not player.lost:
+            player.lost = True
+            self.event(player.id, "GameLost")
+
+    def update_wages(self, player):
+        costs = 0.0
+        for coord in player.stations.values():
+            station = self.galaxy.objects[coord]
+            costs += sum_wages(station.crew)
+            costs += sum_wages(station.idle_crew)
+        for sid in sorted(player.ships):
+            costs += sum_wages(player.ships[sid].crew)
+        player.costs = costs
+
+    # Runs the ticks of `secs` of game, as fast as possible
+    def advance(self, secs):
+        self.tick(int(round(secs / ITER_PERIOD)))
+
+    # Runs the ticks in a thread, `speed` times faster than real time
+    # If the ticks are too slow to keep up, the clock of the game slows down instead of skipping
+    def start(self, speed):
+        self.speed = float(speed)
+        self.mark = (self.ticks, _perf())
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True, name="Simulation")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.speed = None
+
+    def run(self):
+        period = ITER_PERIOD / self.speed
+        rstart, done = _perf(), 0
+        while not self.stopped:
+            due = int((_perf() - rstart) / period) - done
+            if due <= 0:
+                _sleep(max(rstart + (done + 1) * period - _perf(), 0))
+                continue
+            # Too late (a sec of game, or a tenth of a real sec), give up catching up
+            late = due - max(int(1.0 / ITER_PERIOD), int(0.1 / period))
+            if late > 0:
+                rstart += late * period
+                due -= late
+            batch = min(due, 50)
+            self.tick(batch)
+            done += batch
+
+    # HTTP API, returns the JSON reply of the server as bytes
+    def request(self, path):
+        path, _, query = path.partition("?")
+        with self.lock:
+            try:
+                data = self.dispatch(path, query)
+            except ApiError as e:
+                data = e.to_json()
+            except NotFound:
+                data = {"error": "Not Found", "type": "NotFound"}
+        return json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+
+    # Same as Game.get, without the cache, `key` given like the other query parameters
+    def get(self, path, **qry):
+        tail = ""
+        if len(qry) > 0:
+            tail = "?" + "&".join(f"{k}={urllib.parse.quote(str(v))}" for k, v in qry.items())
+        data = json.loads(self.request(path + tail))
+        err = data.pop("error")
+        if err != "ok":
+            raise SimeisError(err)
+        return data
+
+    def dispatch(self, path, query):
+        parts = path.strip("/").split("/")
+        for route in ROUTES:
+            args = route.match(parts)
+            if args is None:
+                continue
+            try:
+                args = route.parse(args)
+            except ApiError:
+                raise NotFound(path)
+            handler = getattr(self, route.handler)
+            if route.handler in ("get_player", "batch", "gamestats"):
+                res = handler(query, *args)
+            elif route.handler == "get_syslogs":
+                res = handler(self.get_player_by_key(query), query)
+            elif route.player:
+                res = handler(self.get_player_by_key(query), *args)
+            else:
+                res = handler(*args)
+            if res is None:
+                return {"error": "ok"}
+            if "error" not in res:
+                res["error"] = "ok"
+            return res
+        raise NotFound(path)
+
+    def get_player_by_key(self, query):
+        key = query_param(query, "key")
+        if key is None:
+            raise ApiError("NoPlayerKey")
+        pid = self.index.get(key)
+        if pid is None:
+            raise ApiError("NoPlayerWithKey")
+        player = self.players[pid]
+        if player.lost:
+            raise ApiError("PlayerLost")
+        return player
+
+    def owned_station(self, player, station_id):
+        coord = player.stations.get(station_id)
+        if coord is None:
+            raise ApiError("NoSuchStation", station_id)
+        return self.galaxy.objects[coord]
+
+    def owned_ship(self, player, ship_id):
+        ship = player.ships.get(ship_id)
+        if ship is None:
+            raise ApiError("ShipNotFound", ship_id)
+        return ship
+
+    # Handlers of the routes, named like in api.rs
+
+    def tick_server(self):
+        self.tick()
+        return {}
+
+    def tick_server_n(self, n):
+        self.tick(n)
+        return {}
+
+    def ping(self):
+        return {"ping": "pong"}
+
+    def get_version(self):
+        return {"version": VERSION}
+
+    # The simulation doesn't run while a request is handled, `wait` is ignored
+    def get_syslogs(self, player, query=""):
+        log = self.syslogs.get(player.id)
+        if log is None:
+            log = self.syslogs[player.id] = Syslog(self.syslog_size)
+        since = query_param(query, "since")
+        if since is not None:
+            since = parse_arg(since, "u64", "since")
+            parse_arg(query_param(query, "wait") or "0", "u64", "wait")
+        first, events = log.read(since)
+        events = [
+            {"seq": seq, "timestamp": self.tstart + t, "type": evtype, "event": event}
+            for seq, (t, evtype, event) in events
+        ]
+        return {"nb": len(events), "events": events, "first": first, "next": log.next}
+
+    def new_player(self, name):
+        for pid, player in self.players.items():
+            if player.name == name:
+                raise ApiError("PlayerAlreadyExists", pid, name)
+        station = self.galaxy.init_new_station()
+        player = Player(name, station, self.elapsed(), self.rng)
+        self.index[player.key] = player.id
+        self.players[player.id] = player
+        self.event(player.id, "GameStarted")
+        return {"playerId": player.id, "key": player.key}
+
+    def get_player(self, query, pid):
+        key = query_param(query, "key")
+        if key is None:
+            raise ApiError("NoPlayerKey")
+        player = self.players.get(pid)
+        if player is None:
+            raise ApiError("PlayerNotFound", pid)
+        stations = {str(sid): list(pos) for sid, pos in player.stations.items()}
+        if player.key != key:
+            return {"id": pid, "name": player.name, "stations": stations}
+        return {
+            "id": pid,
+            "name": player.name,
+            "stations": stations,
+            "money": player.money,
+            "ships": [player.ships[sid].to_json() for sid in sorted(player.ships)],
+            "costs": player.costs,
+        }
+
+    def station_status(self, player, station_id):
+        return self.owned_station(player, station_id).to_json()
+
+    def list_shipyard_ships(self, player, station_id):
+        station = self.owned_station(player, station_id)
+        return {"ships": [{
+            "id": ship.id,
+            "modules": {str(mid): m.to_json() for mid, m in ship.modules.items()},
+            "reactor_power": ship.reactor_power,
+            "cargo_capacity": ship.cargo.capacity,
+            "fuel_tank_capacity": ship.fuel_tank_capacity,
+            "hull_decay_capacity": ship.hull_decay_capacity,
+            "price": ship.compute_price(),
+        } for ship in station.shipyard]}
+
+    def shipyard_buy_ship(self, player, station_id, ship_id):
+        station = self.owned_station(player, station_id)
+        index = None
+        for n, ship in enumerate(station.shipyard):
+            if ship.id == ship_id:
+                index, price = n, ship.compute_price()
+        if index is None:
+            raise ApiError("ShipNotFound", ship_id)
+        if price > player.money:
+            raise ApiError("NotEnoughMoney", player.money, price)
+        ship = station.shipyard.pop(index)
+        ship.update_perf_stats()
+        ship.fuel_tank = ship.fuel_tank_capacity
+        player.money -= price
+        player.ships[ship_id] = ship
+        station.shipyard.append(Ship.random(self.rng, station.position))
+        return {"shipId": ship.id}
+
+    def shipyard_list_upgrades(self, player, station_id):
+        self.owned_station(player, station_id)
+        return {name: {"price": price, "description": desc} for name, (price, desc) in UPGRADES.items()}
+
+    def shipyard_buy_upgrade(self, player, station_id, ship_id, upgrade_type):
+        upgrade = parse_variant(upgrade_type, UPGRADES, "upgrade type")
+        self.owned_station(player, station_id)
+        ship = self.owned_ship(player, ship_id)
+        price = UPGRADES[upgrade][0]
+        if price > player.money:
+            raise ApiError("NotEnoughMoney", player.money, price)
+        player.money -= price
+        if upgrade == "CargoExpansion":
+            ship.cargo.capacity += 150.0
+        elif upgrade == "ReactorUpgrade":
+            ship.reactor_power += 1
+        elif upgrade == "HullUpgrade":
+            ship.hull_decay_capacity += 100.0
+        else:
+            ship.shield_power += 1
+        ship.update_perf_stats()
+        return {"cost": price}
+
+    def hire_crew_member(self, player, station_id, crewtype):
+        crewtype = parse_variant(crewtype, WAGES, "crewtype")
+        station = self.owned_station(player, station_id)
+        cid = self.rng.getrandbits(32)
+        station.idle_crew[cid] = CrewMember(crewtype)
+        self.update_wages(player)
+        return {"id": cid}
+
+    def get_crew_upgrades(self, player, station_id, ship_id):
+        ship = self.owned_ship(player, ship_id)
+        station = self.owned_station(player, station_id)
+        if ship.position != station.position:
+            raise ApiError("ShipNotInStation")
+        return {str(cid): {
+            "member-type": cm.member_type,
+            "rank": cm.rank + 1,
+            "price": cm.price_next_rank(),
+        } for cid, cm in ship.crew.items()}
+
+    def buy_crew_upgrade(self, player, station_id, ship_id, crew_id):
+        station = self.owned_station(player, station_id)
+        ship = self.owned_ship(player, ship_id)
+        if ship.position != station.position:
+            raise ApiError("ShipNotInStation")
+        cm = ship.crew.get(crew_id)
+        if cm is None:
+            raise ApiError("CrewMemberNotFound", crew_id)
+        price = cm.price_next_rank()
+        if price > player.money:
+            raise ApiError("NotEnoughMoney", player.money, price)
+        player.money -= price
+        cm.rank += 1
+        ship.update_perf_stats()
+        self.update_wages(player)
+        return {"new-rank": cm.rank, "cost": price}
+
+    def upgrade_station_trader(self, player, station_id):
+        cm = self.owned_station(player, station_id).trader_member()
+        price = cm.price_next_rank()
+        if price > player.money:
+            raise ApiError("NotEnoughMoney", player.money, price)
+        player.money -= price
+        cm.rank += 1
+        self.update_wages(player)
+        return {"new-rank": cm.rank, "cost": price}
+
+    def assign_trader_on(self, player, station_id, crewid):
+        station = self.owned_station(player, station_id)
+        cm = station.idle_crew.pop(crewid, None)
+        if cm is None:
+            raise ApiError("CrewMemberNotIdle", crewid)
+        station.crew[crewid] = cm
+        station.trader = crewid
+        return {}
+
+    def assign_pilot_on(self, player, station_id, crewid, shipid):
+        station = self.owned_station(player, station_id)
+        ship = self.owned_ship(player, shipid)
+        cm = station.idle_crew.get(crewid)
+        if cm is None:
+            raise ApiError("CrewMemberNotIdle", crewid)
+        if cm.member_type != "Pilot":
+            raise ApiError("WrongCrewType", Variant("Pilot"))
+        if ship.pilot is not None:
+            raise ApiError("CrewNotNeeded")
+        ship.pilot = crewid
+        ship.crew[crewid] = station.idle_crew.pop(crewid)
+        ship.update_perf_stats()
+        return {}
+
+    def assign_operator_on(self, player, station_id, crewid, shipid, modid):
+        station = self.owned_station(player, station_id)
+        ship = self.owned_ship(player, shipid)
+        cm = station.idle_crew.get(crewid)
+        if cm is None:
+            raise ApiError("CrewMemberNotIdle", crewid)
+        # Same as the server, which names the wrong type in this error
+        if cm.member_type != "Operator":
+            raise ApiError("WrongCrewType", Variant("Pilot"))
+        module = ship.modules.get(modid)
+        if module is None:
+            raise ApiError("NoSuchModule", modid)
+        if module.operator is not None:
+            raise ApiError("CrewNotNeeded")
+        module.operator = crewid
+        ship.crew[crewid] = station.idle_crew.pop(crewid)
+        return {}
+
+    def scan(self, player, station_id):
+        station = self.owned_station(player, station_id)
+        return self.galaxy.scan(station.position)
+
+    def get_prices_ship_module(self, player, station_id):
+        self.owned_station(player, station_id)
+        return {"Miner": MODULE_PRICE, "GasSucker": MODULE_PRICE}
+
+    def buy_module(self, player, station_id, ship_id, modtype):
+        modtype = parse_variant(modtype, ("Miner", "GasSucker"), "modtype")
+        coord = player.stations.get(station_id)
+        if coord is None:
+            raise ApiError("NoSuchStation", station_id)
+        ship = self.owned_ship(player, ship_id)
+        if coord != ship.position:
+            raise ApiError("ShipNotInStation")
+        if player.money < MODULE_PRICE:
+            raise ApiError("NotEnoughMoney", player.money, MODULE_PRICE)
+        player.money -= MODULE_PRICE
+        mid = len(ship.modules) + 1
+        ship.modules[mid] = Module(modtype)
+        return {"id": mid}
+
+    def get_ship_module_upgrade_prices(self, player, station_id, ship_id):
+        ship = self.owned_ship(player, ship_id)
+        station = self.owned_station(player, station_id)
+        if ship.position != station.position:
+            raise ApiError("ShipNotInStation")
+        return {str(mid): {
+            "module-type": m.modtype,
+            "price": m.price_next_rank(),
+        } for mid, m in ship.modules.items()}
+
+    def buy_ship_module_upgrade(self, player, station_id, ship_id, modid):
+        station = self.owned_station(player, station_id)
+        ship = self.owned_ship(player, ship_id)
+        if ship.position != station.position:
+            raise ApiError("ShipNotInStation")
+        module = ship.modules.get(modid)
+        if module is None:
+            raise ApiError("NoSuchModule", modid)
+        price = module.price_next_rank()
+        if price > player.money:
+            raise ApiError("NotEnoughMoney", player.money, price)
+        player.money -= price
+        module.rank += 1
+        return {"new-rank": module.rank, "cost": price}
+
+    def buy_station_cargo(self, player, station_id, amount):
+        station = self.owned_station(player, station_id)
+        cost = amount * station.cargo_price()
+        if cost > player.money:
+            raise ApiError("NotEnoughMoney", player.money, cost)
+        player.money -= cost
+        station.cargo.capacity += amount
+        return station.cargo.to_json()
+
+    def get_station_upgrades(self, player, station_id):
+        station = self.owned_station(player, station_id)
+        trader = None if station.trader is None else station.crew[station.trader].price_next_rank()
+        return {"cargo-expansion": station.cargo_price(), "trader-upgrade": trader}
+
+    def refuel(self, player, station_id, ship_id):
+        station = self.owned_station(player, station_id)
+        ship = self.owned_ship(player, ship_id)
+        if station.position != ship.position:
+            raise ApiError("ShipNotInStation")
+        qty = station.cargo.resources.get("Fuel")
+        if not qty:
+            raise ApiError("NoFuelInCargo")
+        needed = ship.fuel_tank_capacity - ship.fuel_tank
+        unloaded = station.cargo.unload("Fuel", min(needed, qty))
+        ship.fuel_tank += unloaded
+        return {"added-fuel": unloaded}
+
+    def repair(self, player, station_id, ship_id):
+        station = self.owned_station(player, station_id)
+        ship = self.owned_ship(player, ship_id)
+        if station.position != ship.position:
+            raise ApiError("ShipNotInStation")
+        qty = station.cargo.resources.get("HullPlate")
+        if not qty:
+            raise ApiError("NoHullPlateInCargo")
+        amnt = min(ship.hull_decay, qty)
+        if amnt == 0.0:
+            return {"added-hull": 0.0}
+        unloaded = station.cargo.unload("HullPlate", amnt)
+        ship.hull_decay -= unloaded
+        return {"added-hull": unloaded}
+
+    def ship_status(self, player, ship_id):
+        return self.owned_ship(player, ship_id).to_json()
+
+    def compute_travel_costs(self, player, ship_id, x, y, z):
+        return self.owned_ship(player, ship_id).compute_travel_costs((x, y, z))
+
+    def navigate(self, player, ship_id, x, y, z):
+        return self.owned_ship(player, ship_id).set_travel((x, y, z))
+
+    def stop_navigation(self, player, ship_id):
+        ship = self.owned_ship(player, ship_id)
+        ship.state, ship.task = "Idle", None
+        return {"position": list(ship.position)}
+
+    def extract(self, player, ship_id):
+        ship = self.owned_ship(player, ship_id)
+        if ship.state != "Idle":
+            raise ApiError("ShipNotIdle")
+        planet = self.galaxy.objects.get(ship.position)
+        if not isinstance(planet, Planet):
+            raise ApiError("CannotExtractWithoutPlanet")
+        rates = {}
+        for mid in sorted(ship.modules):
+            for res, rate in ship.modules[mid].can_extract(ship.crew, planet):
+                rates[res] = rates.get(res, 0.0) + rate
+        rates = [(res, rates[res]) for res in RESOURCES if res in rates]
+        if len(rates) > 0:
+            ship.state, ship.task = "Extracting", rates
+        return dict(rates)
+
+    def stop_extraction(self, player, ship_id):
+        ship = self.owned_ship(player, ship_id)
+        if ship.state != "Extracting":
+            raise ApiError("ShipNotExtracting")
+        ship.state, ship.task = "Idle", None
+        return None
+
+    def unload(self, player, ship_id, resource, amount):
+        res = parse_variant(resource, RESOURCES, "resource")
+        ship = self.owned_ship(player, ship_id)
+        station_id = next((sid for sid, pos in player.stations.items() if pos == ship.position), None)
+        if station_id is None:
+            raise ApiError("ShipNotInStation")
+        station = self.owned_station(player, station_id)
+
+        unloaded = ship.cargo.unload(res, amount)
+        if unloaded != 0.0:
+            added = station.cargo.add_resource(res, unloaded)
+            if added < unloaded:
+                ship.cargo.add_resource(res, unloaded - added)
+                unloaded = added
+        if unloaded == 0.0:
+            self.event(player.id, "UnloadedNothing", {
+                "station_cargo": station.cargo.to_json(),
+                "ship_cargo": ship.cargo.to_json(),
+            })
+        return {"unloaded": unloaded}
+
+    def get_market_prices(self):
+        return {"prices": dict(self.market.prices)}
+
+    def market_buy(self, player, station_id, resource, amnt):
+        res = parse_variant(resource, RESOURCES, "resource")
+        station = self.owned_station(player, station_id)
+        trader = station.trader_member()
+        amnt = min(amnt, station.cargo.space_for(res))
+        if amnt == 0.0:
+            raise ApiError("BuyNothing")
+        cost, fees = self.market.trade(trader.rank, res, amnt, buy=True)
+        player.money -= cost + fees
+        player.score -= cost + fees
+        station.cargo.add_resource(res, amnt)
+        return {
+            "added_cargo": [res, amnt], "removed_cargo": None,
+            "added_money": None, "removed_money": cost + fees, "fees": fees,
+        }
+
+    def market_sell(self, player, station_id, resource, amnt):
+        res = parse_variant(resource, RESOURCES, "resource")
+        station = self.owned_station(player, station_id)
+        trader = station.trader_member()
+        stock = station.cargo.resources.get(res)
+        if stock is None:
+            raise ApiError("SellNothing")
+        amnt = min(amnt, stock)
+        if amnt <= 0.0:
+            raise ApiError("SellNothing")
+        cost, fees = self.market.trade(trader.rank, res, amnt, buy=False)
+        player.money += cost - fees
+        player.score += cost - fees
+        station.cargo.unload(res, amnt)
+        return {
+            "added_cargo": None, "removed_cargo": [res, amnt],
+            "added_money": cost - fees, "removed_money": None, "fees": fees,
+        }
+
+    def get_fee_rate(self, player, station_id):
+        trader = self.owned_station(player, station_id).trader_member()
+        return {"fee_rate": fee_rate(trader.rank)}
+
+    def resources_info(self):
+        data = {}
+        for res, (price, volume, difficulty, min_rank) in RESOURCES.items():
+            if difficulty is not None:
+                data[res] = {"base-price": price, "volume": volume, "difficulty": difficulty, "min-rank": min_rank}
+            else:
+                data[res] = {"base-price": price, "volume": volume, "solid": False}
+        return data
+
+    # Computed on each request, with the `top` parameter of the server (no ETag, no headers here)
+    def gamestats(self, query=""):
+        data = {}
+        for pid in sorted(self.players):
+            p = self.players[pid]
+            potential = 0.0
+            for coord in p.stations.values():
+                cargo = self.galaxy.objects[coord].cargo
+                potential += sum(RESOURCES[res][0] * amnt for res, amnt in cargo.resources.items())
+            data[str(pid)] = {
+                "name": p.name,
+                "score": p.score,
+                "potential": potential,
+                "created": self.tstart + p.created,
+                "lost": p.lost,
+                "money": p.money,
+                "stations": {str(sid): list(pos) for sid, pos in p.stations.items()},
+            }
+        top = query_param(query, "top")
+        if top is None:
+            return data
+        top = parse_arg(top, "usize", "top")
+        ranking = sorted(data, key=lambda pid: (data[pid]["lost"], -(data[pid]["score"] + data[pid]["potential"]), int(pid)))
+        return {pid: data[pid] for pid in ranking[:top]}
+
+    # A single shard, the simulation runs on one thread
+    def tickstats(self):
+        ms = 1000.0
+        return {
+            "ticks": self.ticks,
+            "slow": self.tick_slow,
+            "avg": self.tick_time / max(self.ticks, 1) * ms,
+            "last": self.tick_last * ms,
+            "max": self.tick_max * ms,
+            "shard_last": self.tick_last * ms,
+            "shard_max": self.tick_max * ms,
+            "shards": 1,
+            "players": len(self.players),
+        }
+
+    def batch(self, query):
+        player = self.get_player_by_key(query)
+        paths = query_param(query, "paths")
+        if paths is None:
+            raise ApiError("InvalidArgument", "paths")
+        try:
+            paths = json.loads(paths)
+        except ValueError:
+            raise ApiError("InvalidArgument", "paths")
+        if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths) \
+                or len(paths) > BATCH_MAX_SIZE:
+            raise ApiError("InvalidArgument", "paths")
+
+        results = []
+        for index, path in enumerate(paths):
+            try:
+                results.append(self.run_batch_path(player, self.resolve_batch_path(path, results)))
+            except ApiError as e:
+                return dict(e.to_json(), index=index, results=results)
+        return {"results": results}
+
+    def resolve_batch_path(self, path, results):
+        parts = []
+        for part in path.lstrip("/").split("/"):
+            if not (part.startswith("{") and part.endswith("}")):
+                parts.append(part)
+                continue
+            n, sep, field = part[1:-1].partition(".")
+            if sep == "" or not n.isdigit() or int(n) >= len(results) \
+                    or not isinstance(results[int(n)], dict) or field not in results[int(n)]:
+                raise ApiError("InvalidArgument", "batch reference")
+            val = results[int(n)][field]
+            parts.append(val if isinstance(val, str) else json.dumps(val))
+        return parts
+
+    def run_batch_path(self, player, parts):
+        for route in BATCH_ROUTES:
+            args = route.match(parts)
+            if args is not None:
+                res = getattr(self, route.handler)(player, *route.parse(args))
+                return {} if res is None else res
+        raise ApiError("InvalidArgument", "batch path")
+
+# Drop-in for transport.ConnectionPool, the requests are answered by the simulation
+class SimPool:
+    def __init__(self, sim):
+        self.sim = sim
+        self.size = 1
+
+    def request(self, path):
+        return self.sim.request(path)
+
+    def close(self):
+        pass
+
+# Runs the time of the bots at the speed of the simulation (see Simulation.start)
+#     - time.time & time.monotonic are the clock of the game, time.sleep waits for it
+#     - The timeouts of threading (Condition, Event, the helpers of events.py & scheduler.py)
+#       are shortened by `speed`, the callers looping on the clock wait the right amount of game
+#     - time.perf_counter is untouched, the metrics still measure real latencies
+#     - Once the simulation is stopped, a bot waiting for the game gets SimulationStopped
+@contextlib.contextmanager
+def warp(sim):
+    if sim.speed is None:
+        raise RuntimeError("Start the simulation before warping the time")
+    speed = sim.speed
+
+    def check_stopped():
+        if sim.stopped and getattr(_bot, "name", None) is not None:
+            raise SimulationStopped(_bot.name)
+
+    def sleep(secs):
+        end = sim.elapsed() + max(secs, 0)
+        while not sim.stopped:
+            left = end - sim.elapsed()
+            if left <= 0:
+                return
+            _sleep(min(left / speed, 0.05))
+        check_stopped()
+
+    def wait(cond, timeout=None):
+        check_stopped()
+        if timeout is not None:
+            timeout = max(timeout, 0) / speed
+        return _cond_wait(cond, timeout)
+
+    time.time, time.monotonic, time.sleep = sim.time, sim.elapsed, sleep
+    threading._time = sim.elapsed
+    threading.Condition.wait = wait
+    try:
+        yield sim
+    finally:
+        time.time, time.monotonic, time.sleep = _time, _monotonic, _sleep
+        threading._time = _threading_time
+        threading.Condition.wait = _cond_wait
+
+# A bot of player.py (the default) or client.py, plays until `duration` secs of game
+def play(strategy, name, sim, duration, results):
+    _bot.name = name
+    try:
+        if strategy == "client":
+            try:
+                from .client import Game
+            except ImportError:
+                from client import Game
+        else:
+            try:
+                from .player import Game, RECHECK_DELAY
+            except ImportError:
+                from player import Game, RECHECK_DELAY
+        game = Game(name, pool=SimPool(sim))
+        game.init_game()
+    except (Exception, SimulationStopped) as e:
+        results[name] = {"setup_error": repr(e)}
+        return
+
+    # Stopped in the middle of an action (a bot of client.py waits for its ships)
+    interrupted = False
+    try:
+        while not sim.stopped and sim.elapsed() < duration:
+            try:
+                if strategy == "client":
+                    game.disp_status()
+                    game.buy_module_upgrade()
+                    game.buy_ship_upgrade()
+                    game.buy_human_upgrade()
+                    game.go_mine()
+                    game.go_sell()
+                else:
+                    game.ActionToDo()
+                    game.wait_next_ship(min(RECHECK_DELAY, max(duration - sim.elapsed(), 0)))
+            except Exception as e:
+                game.metrics.failure("play", e)
+                if os.environ.get("SIM_DEBUG"):
+                    print(f"[{name}] {e!r}", file=sys.__stderr__)
+                time.sleep(1)
+    except SimulationStopped:
+        interrupted = True
+    if getattr(game, "events", None) is not None:
+        game.events.stop()
+    results[name] = {"pid": game.pid, "failures": game.metrics.dump()[1], "interrupted": interrupted}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plays the bots on an offline copy of the game")
+    parser.add_argument("-s", "--strategy", choices=("player", "client"), default="player")
+    parser.add_argument("-n", "--players", type=int, default=1, help="Number of bots")
+    parser.add_argument("-d", "--duration", type=float, default=600, help="Secs of game")
+    parser.add_argument("-x", "--speed", type=float, default=1000, help="Speed vs real time")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the output of the bots")
+    args = parser.parse_args()
+
+    sim = Simulation(seed=args.seed)
+    results = {}
+    # The bots write their credentials in the current folder, don't touch the real ones
+    workdir = tempfile.mkdtemp(prefix="simeis-sim-")
+    os.chdir(workdir)
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+
+    rstart = _perf()
+    sim.start(args.speed)
+    with warp(sim):
+        threads = [
+            threading.Thread(target=play, args=(args.strategy, f"sim{i}", sim, args.duration, results), daemon=True)
+            for i in range(args.players)
+        ]
+        for t in threads:
+            t.start()
+        while sim.elapsed() < args.duration:
+            _sleep(min((args.duration - sim.elapsed()) / args.speed, 0.05))
+        sim.stop()
+        for t in threads:
+            t.join(timeout=5)
+    real = _perf() - rstart
+    for i, t in enumerate(threads):
+        if t.is_alive():
+            results[f"sim{i}"] = {"unfinished": True}
+
+    sys.stdout = stdout
+    stats = sim.get("/gamestats")
+    print(f"[*] {sim.elapsed():.0f} secs of game in {real:.1f} secs ({sim.elapsed() / real:.0f}x real time)")
+    print(f"[*] {sim.ticks} ticks, {sim.tick_time / max(sim.ticks, 1) * 1e6:.0f} µs per tick")
+    for name in sorted(results):
+        res = results[name]
+        if "setup_error" in res:
+            print(f"\t- {name}: setup failed, {res['setup_error']}")
+            continue
+        if "unfinished" in res:
+            print(f"\t- {name}: did not finish, still running after the end of the game")
+            continue
+        p = stats[str(res["pid"])]
+        lost = " (lost)" if p["lost"] else ""
+        stopped = ", stopped during an action" if res["interrupted"] else ""
+        print(f"\t- {name}: money {p['money']:.0f}, score {p['score']:.0f}{lost}, {sum(res['failures'].values())} failures{stopped}")
@@ -0,0 +1,58 @@
+import re
+import time
+import threading
+
+try:
+    from .cache import MUTATING
+    from .models import Player, Station
+except ImportError:
+    from cache import MUTATING
+    from models import Player, Station
+
+# Actions changing the state of a ship, on top of the ones changing a station
+SHIP_ACTION = re.compile(r"^/ship/\d+/(navigate|navigation|extraction|unload)/")
+
+# State of our player and of our station, shared by all the helpers of a Game
+#     - Fetched again only if older than `interval` seconds
+#     - Any action of our own that changes the state makes it stale right away
+#     - Decoded once in models.Player / models.Station, shared by all the readers
+class Snapshot:
+    def __init__(self, game, interval=0.5):
+        self.game = game
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.player = None
+        self.station = None
+        self.updated = None
+        self.generation = 0
+
+    def refresh(self, force=False):
+        with self.lock:
+            if force or self.updated is None or (time.monotonic() - self.updated) > self.interval:
+                generation = self.generation
+                tstart = time.monotonic()
+                self.player = Player(self.game.get(f"/player/{self.game.pid}"))
+                if self.game.sta is not None:
+                    self.station = Station(self.game.get(f"/station/{self.game.sta}"))
+                # If we did something in the meantime, the data may already be outdated
+                if generation == self.generation:
+                    self.updated = tstart
+        return self
+
+    def invalidate(self):
+        self.generation += 1
+        self.updated = None
+
+    # Called by Game.get after each successful request
+    def notify(self, path):
+        if MUTATING.search(path) or SHIP_ACTION.match(path):
+            self.invalidate()
+
+    def get_player(self):
+        return self.refresh().player
+
+    def get_station(self):
+        return self.refresh().station
+
+    def get_ship(self, sid):
+        return self.get_player().ship(sid)
@@ -0,0 +1,125 @@
+import heapq
+import threading
+
+try:
+    from .models import PlanetInfo
+except ImportError:
+    from models import PlanetInfo
+
+# Use NumPy to compute the distances if it is installed, all the planets at once
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Same as the server (simeis-data/src/galaxy.rs), the planets of a scan are grouped by sector
+SECTOR_SIZE = 5000
+
+def sector_of(pos, size=SECTOR_SIZE):
+    return (int(pos[0]) // size, int(pos[1]) // size, int(pos[2]) // size)
+
+def sq_dist(a, b):
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+# All the planets we have seen in our scans, a planet never moves so they are never removed
+#     - `nearest_many` answers the k nearest planets of several points (e.g. all our ships) at once
+#     - `solid=True` only keeps the solid planets (Miner), `solid=False` the gaseous ones (GasSucker)
+#     - With NumPy the distances are computed in a single vectorized operation,
+#       without it we look at the sectors from the nearest to the farthest and stop as soon as
+#       the remaining sectors are too far to hold a nearer planet
+class PlanetIndex:
+    def __init__(self, sector_size=SECTOR_SIZE):
+        self.sector_size = sector_size
+        self.lock = threading.Lock()
+        self.planets = {}   # Position -> PlanetInfo
+        self.sectors = {}   # Sector -> [PlanetInfo]
+        self.arrays = None  # (planets, positions, solid) for NumPy, rebuilt after an add
+
+    def __len__(self):
+        return len(self.planets)
+
+    def all(self):
+        with self.lock:
+            return list(self.planets.values())
+
+    # Accepts the planets of a /station/{id}/scan reply, or PlanetInfo, returns how many were new
+    def add(self, planets):
+        added = 0
+        with self.lock:
+            for planet in planets:
+                if not isinstance(planet, PlanetInfo):
+                    planet = PlanetInfo(planet)
+                pos = tuple(planet.position)
+                if pos in self.planets:
+                    continue
+                self.planets[pos] = planet
+                self.sectors.setdefault(sector_of(pos, self.sector_size), []).append(planet)
+                added += 1
+            if added > 0:
+                self.arrays = None
+        return added
+
+    def nearest(self, point, k=1, solid=None):
+        return self.nearest_many([point], k, solid)[0]
+
+    # For each point, its k nearest planets sorted by distance (less if we don't know enough of them)
+    def nearest_many(self, points, k=1, solid=None):
+        if len(points) == 0 or k <= 0:
+            return [[] for _ in points]
+        with self.lock:
+            if np is not None:
+                return self.nearest_numpy(points, k, solid)
+            return [self.nearest_grid(point, k, solid) for point in points]
+
+    def nearest_numpy(self, points, k, solid):
+        if self.arrays is None:
+            planets = list(self.planets.values())
+            self.arrays = (
+                planets,
+                np.array([p.position for p in planets], dtype=np.float64).reshape(-1, 3),
+                np.array([p.solid for p in planets], dtype=bool),
+            )
+        planets, positions, solids = self.arrays
+
+        idx = np.arange(len(planets)) if solid is None else np.flatnonzero(solids == solid)
+        if len(idx) == 0:
+            return [[] for _ in points]
+
+        # Squared distances, one row per point and one column per planet
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        diff = pts[:, None, :] - positions[idx][None, :, :]
+        dists = np.einsum("ijk,ijk->ij", diff, diff)
+
+        k = min(k, len(idx))
+        if k < len(idx):
+            best = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        else:
+            best = np.broadcast_to(np.arange(k), (len(pts), k))
+        order = np.argsort(np.take_along_axis(dists, best, axis=1), axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        return [[planets[idx[j]] for j in row] for row in best]
+
+    def nearest_grid(self, point, k, solid):
+        center = sector_of(point, self.sector_size)
+        def rank(sector):
+            return max(abs(sector[0] - center[0]), abs(sector[1] - center[1]), abs(sector[2] - center[2]))
+
+        # Max heap of the k nearest found yet, as (-distance, n, planet)
+        best = []
+        n = 0
+        for sector in sorted(self.sectors, key=rank):
+            # A point of a sector `r` sectors away from ours is at least (r - 1) sectors far
+            if len(best) == k:
+                bound = max(rank(sector) - 1, 0) * self.sector_size
+                if -best[0][0] <= bound * bound:
+                    break
+            for planet in self.sectors[sector]:
+                if solid is not None and planet.solid != solid:
+                    continue
+                item = (-sq_dist(point, planet.position), n, planet)
+                n += 1
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+        return [planet for _, _, planet in sorted(best, reverse=True)]
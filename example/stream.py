@@ -0,0 +1,134 @@
+import json
+import socket
+import threading
+import http.client
+import urllib.parse
+
+# The server sends a ping after 15 secs without anything else, no line for longer means it's gone
+STREAM_TIMEOUT = 40
+# Wait before connecting again after an error, doubled after each failure
+RECONNECT_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10
+
+# Client of /stream, the server pushes the market prices & the events of our player (NDJSON)
+#     - A line per message: {"stream": "market", "prices": {...}} with the prices that changed
+#       (all of them in the first line), {"stream": "syslog", "seq": ..., ...} for each event
+#       of /syslogs, {"stream": "ping"} when nothing happened for a while
+#     - Without `key`, only the prices are sent
+#     - A background thread reads the stream and connects again if it's cut, the syslog
+#       continues after the last event received
+#     - `prices` is always the last price of each resource, `version` counts its changes
+#     - The functions of `listeners[<stream>]` are given every message of this stream
+class EventStream:
+    def __init__(self, url, key=None, since=0, timeout=STREAM_TIMEOUT, verbose=True):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.key = key
+        self.since = since
+        self.timeout = timeout
+        self.verbose = verbose
+        self.prices = {}
+        self.version = 0
+        self.connected = False
+        # Set when the server doesn't have /stream, the callers go back to polling
+        self.unsupported = False
+        self.listeners = {"market": [], "syslog": []}
+        self.cond = threading.Condition()
+        self.conn = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True, name="EventStream")
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        conn = self.conn
+        if conn is not None and conn.sock is not None:
+            # Wakes up the thread blocked on the socket
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.thread.join(timeout=5)
+
+    # True once the prices come from the stream
+    @property
+    def ok(self):
+        return self.connected and self.version > 0
+
+    def path(self):
+        qry = {"since": str(self.since)}
+        if self.key is not None:
+            qry["key"] = self.key
+        return "/stream?" + urllib.parse.urlencode(qry)
+
+    def run(self):
+        delay = RECONNECT_DELAY
+        while not self.stopped.is_set():
+            try:
+                self.read_stream()
+                delay = RECONNECT_DELAY
+            except Exception as e:
+                if self.verbose and not self.stopped.is_set():
+                    print(f"[STREAM] Erreur: {e}")
+            self.set_connected(False)
+            if self.unsupported:
+                return
+            self.stopped.wait(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def read_stream(self):
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.conn.request("GET", self.path())
+            reply = self.conn.getresponse()
+            if reply.status == 404:
+                self.unsupported = True
+                return
+            if reply.status != 200:
+                raise ConnectionError(f"HTTP {reply.status}")
+            # An error (bad key, player lost...) is a single JSON reply, not a stream
+            if not reply.getheader("Content-Type", "").startswith("application/x-ndjson"):
+                data = json.loads(reply.read())
+                raise ConnectionError(data.get("error"))
+
+            self.set_connected(True)
+            while not self.stopped.is_set():
+                line = reply.readline()
+                if len(line) == 0:
+                    return
+                self.handle(json.loads(line))
+        finally:
+            self.conn.close()
+            self.conn = None
+
+    def handle(self, msg):
+        stream = msg.get("stream")
+        if stream == "market":
+            with self.cond:
+                self.prices.update(msg["prices"])
+                self.version += 1
+                self.cond.notify_all()
+        elif stream == "syslog":
+            self.since = msg["seq"] + 1
+        for listener in self.listeners.get(stream, []):
+            listener(msg)
+
+    def set_connected(self, connected):
+        with self.cond:
+            self.connected = connected
+            self.cond.notify_all()
+
+    # Waits for prices newer than `version`, returns the new version (the same one on timeout)
+    def wait(self, version, timeout=None):
+        with self.cond:
+            self.cond.wait_for(lambda: self.version != version or self.stopped.is_set(), timeout)
+            return self.version
+
+    # Copy of the last prices, None if the stream doesn't have them
+    def last_prices(self):
+        with self.cond:
+            return dict(self.prices) if self.ok else None
@@ -0,0 +1,73 @@
+import os
+import sys
+import shutil
+
+# Terminal renderer only redrawing the rows that changed since the previous frame
+#     - A frame is a list of lines, row N of the screen shows line N
+#     - Each frame is sent in a single write: move to each changed row, write it, clear the end
+#       of the row. The rows below the last line are cleared when the frame gets shorter
+#     - Everything is redrawn when the terminal is resized
+#     - Uses the alternate screen, so the terminal gets its content back on close()
+
+ESC = "\x1b["
+
+class Screen:
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.lines = []
+        self.size = None
+        self.opened = False
+
+    def open(self):
+        # Windows 10+ consoles only understand ANSI sequences once this was called
+        if os.name == "nt":
+            os.system("")
+        self.out.write(f"{ESC}?1049h{ESC}?25l{ESC}2J")
+        self.out.flush()
+        self.opened = True
+        return self
+
+    def close(self):
+        if self.opened:
+            self.out.write(f"{ESC}?25h{ESC}?1049l")
+            self.out.flush()
+            self.opened = False
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Forgets the previous frame, the next one is drawn in full
+    def invalidate(self):
+        self.lines = []
+        self.size = None
+
+    # Draws the frame (a list of lines, or a string), returns the number of rows written
+    def render(self, frame):
+        if isinstance(frame, str):
+            frame = frame.split("\n")
+        size = shutil.get_terminal_size()
+        frame = [line[:size.columns] for line in frame[:size.lines]]
+
+        buffer = []
+        if size != self.size:
+            buffer.append(f"{ESC}2J")
+            self.lines = []
+            self.size = size
+
+        changed = 0
+        for row, line in enumerate(frame):
+            if row < len(self.lines) and self.lines[row] == line:
+                continue
+            buffer.append(f"{ESC}{row + 1};1H{line}{ESC}K")
+            changed += 1
+        if len(frame) < len(self.lines):
+            buffer.append(f"{ESC}{len(frame) + 1};1H{ESC}J")
+        self.lines = frame
+
+        if len(buffer) > 0:
+            self.out.write("".join(buffer))
+            self.out.flush()
+        return changed
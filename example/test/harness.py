@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import random
+import string
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from ..transport import ConnectionPool
+from ..forecast import ITER_PERIOD
+
+# Tick-driven harness for the client tests
+#     - TestServer starts the `testing` build of the server (port 9345), where the game only moves
+#       when we call /tick/{n}: no sleep, the tests wait exactly the ticks they need
+#     - A scenario is a generator playing with its own player: it yields the number of ticks it
+#       needs before its next step (the end of a flight, of an extraction...)
+#     - run_scenarios runs the steps of all the scenarios at once, then ticks the game up to the
+#       nearest wait. Nothing ticks while a step runs, so each run gives the same result
+
+TEST_PORT = 9345
+TEST_URL = f"http://127.0.0.1:{TEST_PORT}"
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SERVER_COMMAND = ["cargo", "run", "--package", "simeis-server", "--features", "testing"]
+
+# Number of ticks after which `secs` of game have passed
+# A flight ends on the first tick where the distance done goes over the distance to do
+def ticks_for(secs):
+    return max(int(secs / ITER_PERIOD) + 1, 1)
+
+# Ticks left before the end of the flight of a ship, from its /ship/{id} status
+def flight_ticks(ship):
+    state = ship["state"]
+    if not isinstance(state, dict) or "InFlight" not in state:
+        return 0
+    flight = state["InFlight"]
+    return ticks_for((flight["dist_tot"] - flight["dist_done"]) / ship["stats"]["speed"])
+
+def random_username(prefix="test", length=24):
+    return prefix + "".join(random.choices(string.ascii_lowercase + string.digits, k=length))
+
+class TestServer:
+    # `command` defaults to SIMEIS_TEST_SERVER (a built server), or `cargo run` with the feature
+    def __init__(self, url=TEST_URL, command=None, startup_timeout=600):
+        self.url = url
+        if command is None and os.environ.get("SIMEIS_TEST_SERVER"):
+            command = [os.environ["SIMEIS_TEST_SERVER"]]
+        self.command = command or SERVER_COMMAND
+        self.startup_timeout = startup_timeout
+        self.proc = None
+        self.pool = None
+        self.ticks = 0
+
+    def ping(self):
+        try:
+            with urllib.request.urlopen(f"{self.url}/ping", timeout=1) as resp:
+                return json.loads(resp.read()).get("ping") == "pong"
+        except OSError:
+            return False
+
+    # Uses the server already running on the port, or starts one and waits until it answers
+    def start(self):
+        if not self.ping():
+            self.proc = subprocess.Popen(
+                self.command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            deadline = time.monotonic() + self.startup_timeout
+            while not self.ping():
+                if self.proc.poll() is not None:
+                    raise RuntimeError(f"Test server exited with code {self.proc.returncode}")
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise TimeoutError("Test server didn't start")
+                time.sleep(0.2)
+
+        self.pool = ConnectionPool(self.url, size=1, timeout=60)
+        # Only the testing build has /tick, don't play the tests on a real game
+        try:
+            reply = json.loads(self.pool.request("/tick/0"))
+        except ValueError:
+            reply = {}
+        if reply.get("error") != "ok":
+            self.stop()
+            raise RuntimeError(f"The server on {self.url} wasn't built with the testing feature")
+        return self
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        if self.proc is not None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            self.proc = None
+
+    # Returns once the game ran the `n` ticks
+    def tick(self, n=1):
+        reply = json.loads(self.pool.request(f"/tick/{n}"))
+        if reply["error"] != "ok":
+            raise RuntimeError(reply["error"])
+        self.ticks += n
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def run_step(scenario):
+    try:
+        return max(int(next(scenario)), 0), None
+    except StopIteration:
+        return None, None
+    except Exception as e:
+        return None, e
+
+# Runs the scenarios {name: generator} until they all end
+# Returns {name: None if it succeeded, else the exception it raised}
+def run_scenarios(server, scenarios, workers=8):
+    waits = {name: 0 for name in scenarios}
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while len(waits) > 0:
+            ready = [name for name, left in waits.items() if left == 0]
+            steps = {name: pool.submit(run_step, scenarios[name]) for name in ready}
+            for name, fut in steps.items():
+                wait, err = fut.result()
+                if wait is None:
+                    results[name] = err
+                    del waits[name]
+                else:
+                    waits[name] = wait
+            if len(waits) == 0:
+                break
+
+            n = min(waits.values())
+            if n > 0:
+                server.tick(n)
+                waits = {name: left - n for name, left in waits.items()}
+    return results
+
+def report(results, out=sys.stdout):
+    failed = {name: err for name, err in results.items() if err is not None}
+    for name in sorted(results):
+        if results[name] is None:
+            print(f"[✓] {name}", file=out)
+        else:
+            print(f"[✗] {name}: {results[name]!r}", file=out)
+    print(f"=== {len(results) - len(failed)} réussis, {len(failed)} échoués ===", file=out)
+    return len(failed) == 0
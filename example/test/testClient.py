@@ -1,22 +1,27 @@
 import os
-import random
-import string
-import time
-from ..player import Game, SimeisError
 import sys
+import threading
+from ..player import Game, SimeisError
+from ..transport import ConnectionPool
+from ..stream import EventStream
+from .harness import TestServer, TEST_URL, run_scenarios, report, random_username, flight_ticks
+
+# Scénarios joués sur le serveur de test (feature `testing`, voir harness.py)
+# Chaque scénario a son propre joueur, et attend la fin d'un vol avec `yield <nombre de ticks>`
+# au lieu de dormir : ils tournent tous en même temps, et donnent le même résultat à chaque fois
 
-def generate_random_username(length=70):
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
+NB_PLAYERS = 10
 
 class TestGame:
     def setUp(self, username):
         for _ in range(10):
             self.username = username
             try:
-                self.game = Game(self.username)
+                self.game = Game(self.username, pool=ConnectionPool(TEST_URL), snapshot_interval=0)
                 break
             except SimeisError as e:
                 if "already exists" in str(e).lower():
+                    username = random_username()
                     continue
                 else:
                     raise e
@@ -28,6 +33,9 @@ class TestGame:
         self.initial_money = self.initial_status["money"]
         self.station_id = list(self.initial_status["stations"].keys())[0]
 
+    def ship(self):
+        return self.game.get(f"/player/{self.game.pid}")["ships"][0]
+
     def test_buy_ship_and_module(self):
         ships = self.initial_status["ships"]
         assert len(ships) == 1, "Le joueur devrait avoir un seul vaisseau"
@@ -42,116 +50,107 @@ class TestGame:
         ship = status_after_module['ships'][0]
         assert len(ship["modules"]) == 1, "Le module n'a pas été correctement ajouté"
 
-        print("[✓] test_buy_ship_and_module réussi")
-
     def voyage(self):
-        shipAvant = self.game.get(f"/player/{self.game.pid}")["ships"][0]
+        shipAvant = self.ship()
         assert shipAvant['state'] == 'Idle', "Vous n'êtes pas à l'arrêt"
 
-        if(self.game.goPlanet(shipAvant)):
-            time.sleep(0.5)
-            ship = self.game.infoVaisseaux(shipAvant['id'])[0]
-
+        if self.game.goPlanet(shipAvant):
+            yield 1
+            ship = self.ship()
             assert list(ship["state"].keys())[0] == 'InFlight', "Vous n'êtes pas en vol"
-            
+
+            yield flight_ticks(ship)
+            ship = self.ship()
+            assert ship['state'] == 'Idle', "Le vol n'est pas terminé"
+            assert ship['position'] != shipAvant['position'], "Le vaisseau n'a pas bougé"
         else:
-            ship = self.game.infoVaisseaux(shipAvant['id'])[0]
+            ship = self.ship()
             assert ship['state'] == 'Idle', "Vous êtes parti au minage"
-        print("[✓] voyage réussi")
-
 
     def testAction(self):
-        shipAvant = self.game.get(f"/player/{self.game.pid}")["ships"][0]
+        shipAvant = self.ship()
         assert shipAvant['state'] == 'Idle', "Votre initialisation à un problème"
         station = self.game.get(f"/station/{self.game.sta}")
-        x,y,z = station['position']
-        self.game.travel(shipAvant['id'],[x + 100, y + 100, z + 100])
-        time.sleep(0.5)
-        ship = self.game.get(f"/player/{self.game.pid}")["ships"][0]
-        assert list(ship["state"].keys())[0] == 'InFlight', "Votre navire ne bouge pas"
-        time.sleep(3.5)
-        assert shipAvant['state'] == 'Idle', "Vous n'êtes pas à l'arrêt"
-
-        print("[✓] testAction réussi")
+        x, y, z = station['position']
+        dest = [x + 100, y + 100, z + 100]
+        self.game.travel(shipAvant['id'], dest)
 
+        yield 1
+        ship = self.ship()
+        assert list(ship["state"].keys())[0] == 'InFlight', "Votre navire ne bouge pas"
 
-def tearDown(name):
-    print("[*] Test terminé pour l'utilisateur", name)
-    fichier = f"{name}.json"
-    if os.path.exists(fichier):
-        os.remove(fichier)
-        print(f"[*] Fichier {fichier} supprimé.")
-    else:
-        print(f"[!] Le fichier {fichier} n'existe pas.")
+        yield flight_ticks(ship)
+        ship = self.ship()
+        assert ship['state'] == 'Idle', "Vous n'êtes pas à l'arrêt"
+        assert all(abs(p - d) <= 1 for p, d in zip(ship['position'], dest)), "Vous n'êtes pas arrivé"
 
-def scenario1():
-    print("\n--- Scénario 1 : Achat de module ---")
-    success, fail = 0, 0
-    for i in range(10):
-        username = generate_random_username()
-        try:
-            test = TestGame()
-            test.setUp(username)
-            test.test_buy_ship_and_module()
-            success += 1
-        except Exception as e:
-            print(f"[✗] Échec du test {i+1} : {e}")
-            fail += 1
-        tearDown(username)
-    print(f"Fin du scénario 1 : {success} réussis, {fail} échoués\n")
-    return success, fail
-
-def scenario2():
-    print("\n--- Scénario 2 : Achat de module voyage dans l'espace puis retour ---")
-    success, fail = 0, 0
-    for i in range(10):
-        username = generate_random_username()
+    # Les prix et les événements arrivent sur /stream sans les demander
+    def testStream(self):
+        stream = EventStream(TEST_URL, key=self.game.player["key"], verbose=False).start()
         try:
-            test = TestGame()
-            test.setUp(username)
-            test.test_buy_ship_and_module()
-            test.voyage()
-            success += 1
-        except Exception as e:
-            print(f"[✗] Échec du test {i+1} : {e}")
-            fail += 1
-        tearDown(username)
-    print(f"Fin du scénario 2 : {success} réussis, {fail} échoués\n")
-    return success, fail
-
-def scenario3():
-    print("\n--- Scénario 3 : Réparation fictive ---")
-    success, fail = 0, 0
-    for i in range(10):
-        username = generate_random_username()
-        try:
-            test = TestGame()
-            test.setUp(username)
-            test.test_buy_ship_and_module()
-            test.testAction()
-            success += 1
-        except Exception as e:
-            print(f"[✗] Échec du test {i+1} : {e}")
-            fail += 1
-        tearDown(username)
-    print(f"Fin du scénario 3 : {success} réussis, {fail} échoués\n")
-    return success, fail
-
-
+            arrived = threading.Event()
+            stream.listeners["syslog"].append(
+                lambda ev: arrived.set() if ev["type"] == "ShipFlightFinished" else None)
+            version = stream.wait(0, timeout=5)
+            assert stream.ok, "Le flux n'a pas envoyé les prix"
+            self.game.get(f"/market/{self.game.sta}/buy/Fuel/1")
+            assert stream.wait(version, timeout=5) != version, "L'achat n'a pas changé les prix"
+
+            ship = self.ship()
+            x, y, z = self.game.get(f"/station/{self.game.sta}")['position']
+            self.game.travel(ship['id'], [x + 100, y + 100, z + 100])
+            yield 1
+            yield flight_ticks(self.ship())
+            assert arrived.wait(5), "La fin du vol n'est pas arrivée sur le flux"
+        finally:
+            stream.stop()
+
+    def tearDown(self):
+        self.game.events.stop()
+        self.game.pool.close()
+        fichier = f"{self.username}.json"
+        if os.path.exists(fichier):
+            os.remove(fichier)
+
+# Scénario 1 : Achat de module
+def scenario1(test):
+    test.test_buy_ship_and_module()
+    yield 0
+
+# Scénario 2 : Achat de module, voyage dans l'espace
+def scenario2(test):
+    test.test_buy_ship_and_module()
+    yield from test.voyage()
+
+# Scénario 3 : Voyage à côté de la station
+def scenario3(test):
+    test.test_buy_ship_and_module()
+    yield from test.testAction()
+
+# Scénario 4 : Prix et fin du vol reçus sur le flux
+def scenario4(test):
+    test.test_buy_ship_and_module()
+    yield from test.testStream()
+
+def with_player(scenario):
+    test = TestGame()
+    try:
+        test.setUp(random_username())
+        yield 0
+        yield from scenario(test)
+    finally:
+        if hasattr(test, "game"):
+            test.tearDown()
 
 if __name__ == "__main__":
-    total_success, total_fail = 0, 0
-
-    for scenario in [scenario1, scenario2, scenario3]:
-        s, f = scenario()
-        if f == 0:
-            total_success+=1
-        else:
-            total_fail+=1
-
-    print("=== Résumé final ===")
-    print(f"✅ Tests réussis : {total_success}")
-    print(f"❌ Tests échoués : {total_fail}")
-    print("====================")
-    if total_fail > 0:
+    with TestServer() as server:
+        scenarios = {
+            f"{scenario.__name__}-{i + 1}": with_player(scenario)
+            for scenario in [scenario1, scenario2, scenario3, scenario4]
+            for i in range(NB_PLAYERS)
+        }
+        results = run_scenarios(server, scenarios)
+        print(f"[*] {server.ticks} ticks joués")
+
+    if not report(results):
         sys.exit(1)
@@ -0,0 +1,85 @@
+import queue
+import socket
+import threading
+import http.client
+import urllib.parse
+
+# Errors meaning the server closed an idle keep-alive socket on its side
+STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+# Pool of HTTP/1.1 keep-alive connections to the game server
+#     - At most `size` sockets are opened at the same time, each thread takes its own
+#     - Idle sockets are reused (the most recently used first, it is the least likely to be stale)
+#     - A reused socket closed by the server is replaced by a new one, and the request is sent again
+class ConnectionPool:
+    def __init__(self, url, size=4, timeout=1):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.size = size
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def connect(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        conn.connect()
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            pass
+        try:
+            return self.connect(), False
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, conn, reuse=True):
+        if reuse:
+            self.idle.put(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    # Send a GET request, returns the raw body of the reply
+    def request(self, path):
+        conn, reused = self.acquire()
+        try:
+            try:
+                reply = self.send(conn, path)
+            except STALE_ERRORS:
+                # A fresh socket failing is a real error, only retry on a reused one
+                if not reused:
+                    raise
+                conn.close()
+                conn = self.connect()
+                reply = self.send(conn, path)
+            body = reply.read()
+        except BaseException:
+            self.release(conn, reuse=False)
+            raise
+
+        self.release(conn, reuse=not reply.will_close)
+        return body
+
+    def send(self, conn, path):
+        conn.request("GET", path, headers={"Connection": "keep-alive"})
+        return conn.getresponse()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,141 @@
+import sys
+import math
+import random
+
+try:
+    from .models import as_ship
+except ImportError:
+    from models import as_ship
+
+# Use NumPy to compute the costs of many travels at once if it is installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FIELDS = ("distance", "duration", "fuel_consumption", "hull_usage")
+
+# Same as Travel::compute_costs (simeis-data/src/ship/navigation.rs), no request needed
+#     - The reply has the same fields as /ship/{id}/travelcost/{x}/{y}/{z}
+#     - Raises ValueError with the error code of the server when it would refuse the travel
+def travel_cost(ship, destination):
+    ship = as_ship(ship)
+    if ship["pilot"] is None:
+        raise ValueError("NoPilotAssigned")
+    delta = [float(b) - float(a) for a, b in zip(ship.position, destination)]
+    distance = math.sqrt(delta[0] * delta[0] + delta[1] * delta[1] + delta[2] * delta[2])
+    if distance == 0.0:
+        raise ValueError("NullDistance")
+
+    stats = ship["stats"]
+    duration = distance / stats["speed"]
+    return {
+        "direction": [d / distance for d in delta],
+        "distance": distance,
+        "duration": duration,
+        "fuel_consumption": stats["fuel_consumption"] * duration,
+        "hull_usage": stats["hull_usage_rate"] * distance,
+    }
+
+# Same as TravelCost::have_enough
+def have_enough(ship, cost):
+    ship = as_ship(ship)
+    return ship.fuel_tank >= cost["fuel_consumption"] \
+        and (ship.hull_decay_capacity - ship.hull_decay) >= cost["hull_usage"]
+
+# Costs of every ship to every destination, one row per ship and one column per destination
+#     - Returns {field: matrix} for the FIELDS, and "possible" (the ship has enough fuel & hull)
+#     - The matrices are NumPy arrays if NumPy is installed, lists of lists otherwise
+#     - A ship without pilot, or a destination on the ship itself, is never possible
+def travel_costs(ships, destinations):
+    ships = [as_ship(s) for s in ships]
+    if np is not None:
+        return travel_costs_numpy(ships, destinations)
+
+    res = {field: [] for field in FIELDS + ("possible",)}
+    for ship in ships:
+        rows = {field: [] for field in res}
+        for dest in destinations:
+            try:
+                cost = travel_cost(ship, dest)
+            except ValueError:
+                cost = None
+            for field in FIELDS:
+                rows[field].append(math.nan if cost is None else cost[field])
+            rows["possible"].append(cost is not None and have_enough(ship, cost))
+        for field, row in rows.items():
+            res[field].append(row)
+    return res
+
+def travel_costs_numpy(ships, destinations):
+    pos = np.array([s.position for s in ships], dtype=np.float64).reshape(-1, 3)
+    dest = np.array(destinations, dtype=np.float64).reshape(-1, 3)
+    speed, fuel_rate, hull_rate = (
+        np.array([s["stats"][k] for s in ships], dtype=np.float64)[:, None]
+        for k in ("speed", "fuel_consumption", "hull_usage_rate")
+    )
+    fuel_tank = np.array([s.fuel_tank for s in ships], dtype=np.float64)[:, None]
+    hull_left = np.array([s.hull_decay_capacity - s.hull_decay for s in ships], dtype=np.float64)[:, None]
+    pilot = np.array([s["pilot"] is not None for s in ships], dtype=bool)[:, None]
+
+    delta = dest[None, :, :] - pos[:, None, :]
+    distance = np.sqrt(np.einsum("ijk,ijk->ij", delta, delta))
+    duration = distance / speed
+    fuel = fuel_rate * duration
+    hull = hull_rate * distance
+    valid = pilot & (distance != 0.0)
+    return {
+        "distance": distance,
+        "duration": duration,
+        "fuel_consumption": fuel,
+        "hull_usage": hull,
+        "possible": valid & (fuel_tank >= fuel) & (hull_left >= hull),
+    }
+
+# Compares the local model with /ship/{id}/travelcost for each destination
+# Returns the mismatches as (destination, field, local, server), empty when they all agree
+def verify(game, ship, destinations, rel_tol=1e-9):
+    ship = as_ship(ship)
+    mismatches = []
+    for dest in destinations:
+        x, y, z = dest
+        try:
+            server = game.get(f"/ship/{ship.id}/travelcost/{x}/{y}/{z}")
+        except Exception as e:
+            server = {"error": str(e)}
+        try:
+            local = travel_cost(ship, dest)
+        except ValueError as e:
+            local = {"error": str(e)}
+
+        if "error" in server or "error" in local:
+            if ("error" in server) != ("error" in local):
+                mismatches.append((dest, "error", local.get("error"), server.get("error")))
+            continue
+        for field in FIELDS:
+            if not math.isclose(local[field], server[field], rel_tol=rel_tol):
+                mismatches.append((dest, field, local[field], server[field]))
+    return mismatches
+
+if __name__ == "__main__":
+    try:
+        from .player import Game
+    except ImportError:
+        from player import Game
+
+    if len(sys.argv) < 2:
+        print("Usage: travel.py <playername> [nb_destinations]")
+        sys.exit(1)
+
+    game = Game(sys.argv[1])
+    game.init_game()
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    station = game.getStation()
+    for ship in game.checkStatusVaisseau():
+        dests = [[max(c + random.randint(-5000, 5000), 0) for c in station.position] for _ in range(n)]
+        mismatches = verify(game, ship, dests)
+        wrong = {tuple(dest) for dest, _, _, _ in mismatches}
+        print(f"[*] Ship {ship.id}: {n - len(wrong)}/{n} destinations match the server")
+        for dest, field, local, server in mismatches[:10]:
+            print(f"\t- {dest} {field}: local {local}, server {server}")
+    game.events.stop()
@@ -5,13 +5,30 @@ URL=f"http://127.0.0.1:{PORT}"
 import os
 import json
 import time
+import urllib.error
 import urllib.request
 
+try:
+    from .history import PriceHistory
+    from .terminal import Screen
+    from .scorelog import ScoreLog
+    from .rolling import RollingMax
+    from .stream import EventStream
+except ImportError:
+    from history import PriceHistory
+    from terminal import Screen
+    from scorelog import ScoreLog
+    from rolling import RollingMax
+    from stream import EventStream
+
 # TODO Put names to track in sys.argv
 #      If a player name starts with one of the names in sys.argv, add it even if it's not in the top NMAX players
 
 INIT = False
+# Credits per second of the players shown, over their last AVG_WINDOW refreshes
+# Only the players of the top NMAX still in the game are kept
 HIST = {}
+AVG_WINDOW = 30
 
 class SimeisError(Exception):
     pass
@@ -22,8 +39,16 @@ SCORE="█"
 POTENTIAL="▒"
 VOID=" "
 
-MIN = {}
-MAX = {}
+# Every price seen, kept on disk for the next runs and for the bots (see history.py)
+HISTORY = None
+# Only the rows that changed are redrawn (see terminal.py)
+SCREEN = Screen()
+# Market prices pushed by the server (see stream.py), polled if it can't
+STREAM = EventStream(URL, verbose=False)
+# The screen is redrawn when the prices change, at most every REFRESH_MIN secs,
+# and at least every REFRESH_PERIOD secs for the scores
+REFRESH_PERIOD = 2
+REFRESH_MIN = 0.5
 
 def mkbar(score, pot, maxs):
     if maxs == 0.0:
@@ -37,22 +62,28 @@ def mkbar(score, pot, maxs):
     nvoid = WIDTH - nbs - nbp
     return (SCORE * nbs) + (POTENTIAL * nbp) + (VOID * nvoid)
 
-def get(path):
+# `headers` are added to the request, the headers of the reply are put in `reply_headers` (lowercase)
+# Returns None if the server answered 304 Not Modified
+def get(path, headers=None, reply_headers=None):
     qry = f"{URL}/{path}"
     while True:
         try:
-            reply = urllib.request.urlopen(qry, timeout=5)
+            reply = urllib.request.urlopen(urllib.request.Request(qry, headers=headers or {}), timeout=5)
             break
-        except:
-            os.system("cls")
-            os.system("cls")
-            HIST = {}
+        except Exception as e:
+            if isinstance(e, urllib.error.HTTPError) and e.code == 304:
+                if reply_headers is not None:
+                    reply_headers.update((k.lower(), v) for k, v in e.headers.items())
+                return None
+            HIST.clear()
             INIT=False
             # breakpoint()
-            print("DEAD SERVER")
+            SCREEN.render(["DEAD SERVER"])
             time.sleep(1)
             continue
 
+    if reply_headers is not None:
+        reply_headers.update((k.lower(), v) for k, v in reply.headers.items())
     data = json.loads(reply.read().decode())
     err = data.pop("error")
     if err != "ok":
@@ -60,30 +91,49 @@ def get(path):
 
     return data
 
+# Only the NMAX best players, and only if they changed since the last call (ETag)
+# The server gives the number of players in the X-Players headers
+GAMESTATS = {"etag": None, "info": {}, "active": 0}
+
 def get_info():
-    return get("gamestats")
+    headers = {} if GAMESTATS["etag"] is None else {"If-None-Match": GAMESTATS["etag"]}
+    reply_headers = {}
+    info = get(f"gamestats?top={NMAX}", headers=headers, reply_headers=reply_headers)
+    if info is not None:
+        GAMESTATS["etag"] = reply_headers.get("etag")
+        GAMESTATS["info"] = info
+        GAMESTATS["active"] = int(reply_headers.get("x-players-active", len(info)))
+    # The server gives the creation time of the players, the age isn't part of the data
+    now = time.time()
+    return {pid: dict(p, age=max(int(now - p["created"]), 0)) for pid, p in GAMESTATS["info"].items()}
 
 def get_resources():
     return get("resources")
 
 def get_market():
+    prices = STREAM.last_prices()
+    if prices is not None:
+        return prices
     return get("market/prices")["prices"]
 
 def disp_market(resources):
     market = get_market()
-    max_res_len = max([len(k) for k in market.keys()])
+    HISTORY.append(market)
     disp = {}
     for (res, price) in market.items():
-        MIN[res] = round(min(MIN[res], price), 2)
-        MAX[res] = round(max(MAX[res], price), 2)
-        relp = round((price / resources[res]["base-price"]) * 100, 2)
+        stats = HISTORY.stats(res)
+        base = resources[res]["base-price"]
+        relp = round((price / base) * 100, 2)
         price = round(price, 3)
-        space = " "*(1 + max_res_len - len(res))
 
         disp[res] = {
             "head": f"{price}",
             "mid": f"({relp} %)",
-            "tail": "({} < {} < {})".format(MIN[res], resources[res]["base-price"], MAX[res]),
+            "tail": "({} < {} < {}) ema {} vol {}% p{}".format(
+                round(min(stats["min"], base), 2), base, round(max(stats["max"], base), 2),
+                round(stats["ema"], 3), round(stats["volatility"] * 100, 2),
+                int(stats["percentile"] * 100),
+            ),
         }
 
     max_res = max([len(r) for r in disp.keys()])
@@ -91,63 +141,82 @@ def disp_market(resources):
     max_mid = max([len(d["mid"]) for _, d in disp.items()])
     max_tail = max([len(d["tail"]) for _, d in disp.items()])
 
-    buffer = ""
+    lines = []
     for res, d in disp.items():
-        buffer += "{}{}{}{}{}{}{}".format(
+        lines.append("{}{}{}{}{}{}{}".format(
             res, " " * (max_res + 1 - len(res)),
             d["head"], " " * (max_head + 1 - len(d["head"])),
             d["mid"], " " * (max_mid + 1 - len(d["mid"])),
             d["tail"], " " * (max_tail + 1 - len(d["tail"])),
-        ) + "\n"
+        ))
 
-    return buffer
+    return lines
 
 resources = get_resources()
-for (res, data) in resources.items():
-    MIN[res] = data["base-price"]
-    MAX[res] = data["base-price"]
-
-while True:
-    time.sleep(2)
-    buffer = disp_market(resources)
-    buffer += "\n"
-    info = get_info()
-    with open("scores.json", "w") as f:
-        json.dump(info, f)
-    if len(info) == 0:
-        print("No players on the server")
-        continue
-
-    for (_, p) in info.items():
-        if p["lost"]:
-            p["score"] = -1.0
-
-    buffer += "{} Players still in the game\n".format(len([True for p in info.values() if not p["lost"]]))
-    players = sorted(info.items(), key=lambda p: p[1]["score"] + p[1]["potential"], reverse=True)[:NMAX]
-    max_score = max([max(v["score"], 0) + v["potential"] for v in info.values()])
-    maxn = max([len(data["name"]) for (_, data) in players])
-    for (player, data) in players:
-        if player not in HIST:
-            HIST[player] = []
-
-        spaces = maxn - len(data["name"]) + 1
-        if data["lost"]:
-            buffer += "Player {} LOST".format(data["name"] + " " * spaces) + "\n"
+HISTORY = PriceHistory(base_prices={res: data["base-price"] for (res, data) in resources.items()})
+# The scores of the NMAX best players, a line each time they change (see scorelog.py)
+SCORES = ScoreLog()
+
+STREAM.start()
+SCREEN.open()
+try:
+    version = 0
+    last = 0.0
+    while True:
+        time.sleep(max(REFRESH_MIN - (time.monotonic() - last), 0))
+        if STREAM.ok:
+            version = STREAM.wait(version, timeout=REFRESH_PERIOD)
+        else:
+            time.sleep(REFRESH_PERIOD)
+        last = time.monotonic()
+        lines = disp_market(resources)
+        lines.append("")
+        info = get_info()
+        SCORES.append(GAMESTATS["info"])
+        if len(info) == 0:
+            SCREEN.render(["No players on the server"])
             continue
 
-        s = max(0, data["score"]) + data["potential"]
-        if data["age"] == 0:
-            avg = 0.0
-        else:
-            avg = s / data["age"]
-        HIST[player].append((s, avg))
-        avg_lasts = max([n[1] for n in HIST[player][-30:]])
-
-        bar = mkbar(data["score"], data["potential"], max_score)
-        buffer += "Player {} {} {} (~{}/sec)\tpotential: {}".format(
-            data["name"] + " " * spaces, bar, round(data["score"], 2),
-            round(avg_lasts, 2),
-            round(data["potential"], 2)
-        ) + "\n"
-    os.system("cls")
-    print(buffer)
+        # The players that lost are ranked with a score of -1
+        score = {pid: -1.0 if p["lost"] else p["score"] for (pid, p) in info.items()}
+
+        lines.append("{} Players still in the game".format(GAMESTATS["active"]))
+        players = sorted(info.items(), key=lambda p: score[p[0]] + p[1]["potential"], reverse=True)[:NMAX]
+        max_score = max([max(score[pid], 0) + v["potential"] for (pid, v) in info.items()])
+        maxn = max([len(data["name"]) for (_, data) in players])
+        # Forget the players that lost, or aren't in the top anymore
+        shown = {player for (player, data) in players if not data["lost"]}
+        for player in [player for player in HIST if player not in shown]:
+            del HIST[player]
+
+        for (player, data) in players:
+            if player not in HIST and not data["lost"]:
+                HIST[player] = RollingMax(AVG_WINDOW)
+
+            spaces = maxn - len(data["name"]) + 1
+            if data["lost"]:
+                lines.append("Player {} LOST".format(data["name"] + " " * spaces))
+                continue
+
+            s = max(0, data["score"]) + data["potential"]
+            if data["age"] == 0:
+                avg = 0.0
+            else:
+                avg = s / data["age"]
+            HIST[player].append(avg)
+            avg_lasts = HIST[player].max()
+
+            bar = mkbar(data["score"], data["potential"], max_score)
+            lines.append("Player {} {} {} (~{}/sec)    potential: {}".format(
+                data["name"] + " " * spaces, bar, round(data["score"], 2),
+                round(avg_lasts, 2),
+                round(data["potential"], 2)
+            ))
+        SCREEN.render(lines)
+except KeyboardInterrupt:
+    pass
+finally:
+    STREAM.stop()
+    SCREEN.close()
+    SCORES.close()
+    HISTORY.close()
@@ -3,7 +3,7 @@ use rand::rngs::ThreadRng;
 use rand::Rng;
 use scan::ScanResult;
 use station::StationId;
-use std::collections::BTreeMap;
+use std::collections::{BTreeMap, HashMap, HashSet};
 use std::sync::Arc;
 use tokio::sync::RwLock;
 
@@ -30,22 +30,27 @@ pub enum SpaceObject {
     Planet(Arc<planet::Planet>),
 }
 
+// Sector containing a coordinate, as its position in the grid of sectors
+type SectorKey = (SpaceUnit, SpaceUnit, SpaceUnit);
+
+// The objects are indexed by sector, a scan or a lookup only looks at the sectors it needs,
+// whatever the size of the galaxy
 pub struct Galaxy {
-    objects: BTreeMap<SpaceCoord, SpaceObject>,
-    discovered: Vec<GalaxySector>, // TODO BTreeMap instead ?
+    objects: HashMap<SectorKey, BTreeMap<SpaceCoord, SpaceObject>>,
+    discovered: HashSet<SectorKey>,
 }
 
 impl Galaxy {
     pub fn init() -> Galaxy {
         Galaxy {
-            objects: BTreeMap::new(),
-            discovered: vec![],
+            objects: HashMap::new(),
+            discovered: HashSet::new(),
         }
     }
 
     // X, Y and Z can be any point from the given sector
-    // Returns the index in the "discovered" vector
-    pub fn generate_sector(&mut self, coord: &SpaceCoord) -> usize {
+    // Returns the sector generated
+    pub fn generate_sector(&mut self, coord: &SpaceCoord) -> GalaxySector {
         let (x, y, z) = coord;
         let (secx, secy, secz) = compute_sector(*x, *y, *z);
         log::debug!(
@@ -57,8 +62,7 @@ impl Galaxy {
             secz.0,
             secz.1,
         );
-        let ind = self.discovered.len();
-        self.discovered.push((secx, secy, secz));
+        self.discovered.insert(sector_key(coord));
         let mut rng = rand::rng();
         for _ in 0..PLANETS_PER_SECTOR {
             let x = rng.random_range(secx.0..secx.1);
@@ -72,48 +76,30 @@ impl Galaxy {
                 continue;
             }
         }
-        ind
+        (secx, secy, secz)
     }
 
     pub fn is_discovered(&self, coord: &SpaceCoord) -> bool {
-        let (x, y, z) = coord;
-        for ((sx, ex), (sy, ey), (sz, ez)) in self.discovered.iter() {
-            if (x < sx) || (x > ex) || (y < sy) || (y > ey) || (z < sz) || (z > ez) {
-                continue;
-            }
-            return true;
-        }
-        false
+        self.discovered.contains(&sector_key(coord))
     }
 
     pub fn get<'a>(&'a self, coord: &SpaceCoord) -> Option<&'a SpaceObject> {
-        self.objects.get(coord)
+        self.objects.get(&sector_key(coord))?.get(coord)
     }
 
     pub fn insert(&mut self, coord: &SpaceCoord, obj: SpaceObject) -> Option<()> {
-        if self.objects.contains_key(coord) {
+        let sector = self.objects.entry(sector_key(coord)).or_default();
+        if sector.contains_key(coord) {
             return None;
         }
-        self.objects.insert(*coord, obj);
+        sector.insert(*coord, obj);
         Some(())
     }
 
-    fn list_objects_in_sector(&self, sector: &GalaxySector) -> Vec<&SpaceObject> {
-        let mut objects = vec![];
-        for (coord, obj) in self.objects.iter() {
-            let (x, y, z) = coord;
-            if (x < &sector.0 .0) || (x > &sector.0 .1) {
-                continue;
-            }
-            if (y < &sector.1 .0) || (y > &sector.1 .1) {
-                continue;
-            }
-            if (z < &sector.2 .0) || (z > &sector.2 .1) {
-                continue;
-            }
-            objects.push(obj);
-        }
-        objects
+    // Sorted by coordinates
+    fn list_objects_in_sector(&self, sector: &GalaxySector) -> impl Iterator<Item = &SpaceObject> {
+        let key = sector_key(&(sector.0 .0, sector.1 .0, sector.2 .0));
+        self.objects.get(&key).into_iter().flat_map(|o| o.values())
     }
 
     pub async fn get_station(&self, coord: &SpaceCoord) -> Option<Arc<RwLock<station::Station>>> {
@@ -141,14 +127,11 @@ impl Galaxy {
             seccoord = (rng.random(), rng.random(), rng.random());
         }
         let id = rng.random();
-        let ind = self.generate_sector(&seccoord);
-        let sector = self.discovered.get(ind).unwrap();
+        let sector = &self.generate_sector(&seccoord);
 
         let Some(SpaceObject::Planet(pla)) = self
             .list_objects_in_sector(sector)
-            .iter()
-            .filter(|obj| matches!(obj, SpaceObject::Planet(_)))
-            .nth(0)
+            .find(|obj| matches!(obj, SpaceObject::Planet(_)))
         else {
             unreachable!("Planet inside generated sector");
         };
@@ -162,17 +145,13 @@ impl Galaxy {
             }
 
             let mut mindist = None;
-            for pla in self
-                .list_objects_in_sector(sector)
-                .iter()
-                .filter_map(|obj| {
-                    if let SpaceObject::Planet(p) = obj {
-                        Some(p)
-                    } else {
-                        None
-                    }
-                })
-            {
+            for pla in self.list_objects_in_sector(sector).filter_map(|obj| {
+                if let SpaceObject::Planet(p) = obj {
+                    Some(p)
+                } else {
+                    None
+                }
+            }) {
                 let dist = get_distance(&pla.position, &coord);
                 if let Some(ref mut m) = mindist {
                     if dist < *m {
@@ -254,6 +233,15 @@ pub fn translation(start: SpaceCoord, direction: (f64, f64, f64), dist: f64) ->
     )
 }
 
+#[inline]
+fn sector_key(coord: &SpaceCoord) -> SectorKey {
+    (
+        coord.0 / SECTOR_SIZE.0,
+        coord.1 / SECTOR_SIZE.1,
+        coord.2 / SECTOR_SIZE.2,
+    )
+}
+
 fn is_in_sector(coord: &SpaceCoord, sector: &GalaxySector) -> bool {
     coord.0 >= sector.0 .0
         && coord.0 < sector.0 .1
@@ -365,6 +353,87 @@ fn test_compute_sector() {
     );
 }
 
+#[test]
+fn test_galaxy_sector_index() {
+    let rt = tokio::runtime::Builder::new_current_thread()
+        .build()
+        .unwrap();
+    let mut galaxy = Galaxy::init();
+    let mut rng = rand::rng();
+    let first = (rng.random(), rng.random(), rng.random());
+    assert!(!galaxy.is_discovered(&first));
+    galaxy.generate_sector(&first);
+    assert!(galaxy.is_discovered(&first));
+    for _ in 0..200 {
+        galaxy.generate_sector(&(rng.random(), rng.random(), rng.random()));
+    }
+    let (_, station) = rt.block_on(galaxy.init_new_station());
+    assert!(galaxy.is_discovered(&station));
+    assert!(matches!(
+        galaxy.get(&station),
+        Some(SpaceObject::BaseStation(_))
+    ));
+
+    // Same objects as a search through the whole galaxy
+    for key in galaxy.discovered.iter() {
+        let start = (
+            key.0 * SECTOR_SIZE.0,
+            key.1 * SECTOR_SIZE.1,
+            key.2 * SECTOR_SIZE.2,
+        );
+        let sector = compute_sector(start.0, start.1, start.2);
+        let mut all: Vec<SpaceCoord> = galaxy
+            .objects
+            .values()
+            .flat_map(|objs| objs.keys())
+            .filter(|coord| is_in_sector(coord, &sector))
+            .cloned()
+            .collect();
+        all.sort();
+        let listed: Vec<SpaceCoord> = galaxy
+            .list_objects_in_sector(&sector)
+            .map(|obj| match obj {
+                SpaceObject::Planet(p) => p.position,
+                SpaceObject::BaseStation(s) => s.try_read().unwrap().position,
+            })
+            .collect();
+        assert_eq!(listed, all);
+        assert!(!listed.is_empty());
+        assert!(galaxy.is_discovered(&(start.0 + 1, start.1, start.2 + SECTOR_SIZE.2 - 1)));
+    }
+}
+
+// Time of a scan (rank 1, as the stations do) against the number of sectors discovered
+// It should stay the same, run with `make bench-galaxy`
+#[cfg(feature = "heavy_testing")]
+#[test]
+fn bench_scan_sector() {
+    let rt = tokio::runtime::Builder::new_current_thread()
+        .build()
+        .unwrap();
+    let center: SpaceCoord = (1_000_000_000, 1_000_000_000, 1_000_000_000);
+    let nscans = 1000;
+    let mut galaxy = Galaxy::init();
+    let mut rng = rand::rng();
+    let mut times = vec![];
+    galaxy.generate_sector(&center);
+    for nsectors in [100, 1_000, 10_000, 100_000] {
+        while galaxy.discovered.len() < nsectors {
+            galaxy.generate_sector(&(rng.random(), rng.random(), rng.random()));
+        }
+
+        let tstart = std::time::Instant::now();
+        for _ in 0..nscans {
+            let res = rt.block_on(galaxy.scan_sector(1, &center));
+            assert!(!res.planets.is_empty());
+        }
+        let took = tstart.elapsed() / nscans;
+        println!("{nsectors} sectors: {took:?} per scan");
+        times.push(took);
+    }
+    assert!(times[3] < times[0] * 3);
+}
+
 #[cfg(feature = "heavy_testing")]
 #[test]
 fn test_heavy_testing() {
@@ -1,7 +1,10 @@
 use base64::{prelude::BASE64_STANDARD, Engine};
-use std::collections::{BTreeMap, HashMap};
+use std::collections::{BTreeMap, BTreeSet, HashMap};
+use std::ops::Deref;
+use std::sync::atomic::{AtomicU64, Ordering};
 use std::sync::Arc;
 use std::time::{Duration, Instant};
+use tokio::runtime::Handle;
 use tokio::sync::mpsc::{Receiver, Sender};
 use tokio::sync::RwLock;
 use tokio::task::JoinHandle;
@@ -16,18 +19,72 @@ use crate::galaxy::Galaxy;
 use crate::market::{Market, MARKET_CHANGE_SEC};
 use crate::player::{Player, PlayerId, PlayerKey};
 use crate::ship::ShipState;
+use crate::stats::{GameStats, PlayerStats, StatsBoard, TickTimes, STATS_PERIOD};
 use crate::syslog::{SyslogEvent, SyslogFifo, SyslogRecv, SyslogSend};
+use crate::timers::TimerWheel;
 
 const ITER_PERIOD: Duration = Duration::from_millis(20);
 
+// A tick splits the players in shards, each shard is updated by a task of the tick workers
+// (one per core by default, or SIMEIS_TICK_THREADS), with at least this number of players
+const SHARD_MIN_PLAYERS: usize = 16;
+
+// Time of the game in secs since its start
+// With the testing feature, only the ticks make it advance (the tests tick by hand)
+pub struct GameClock {
+    start: Instant,
+    ticks: AtomicU64,
+}
+
+impl GameClock {
+    fn new() -> GameClock {
+        GameClock {
+            start: Instant::now(),
+            ticks: AtomicU64::new(0),
+        }
+    }
+
+    pub fn now(&self) -> f64 {
+        #[cfg(feature = "testing")]
+        let now = self.tick() as f64 * ITER_PERIOD.as_secs_f64();
+
+        #[cfg(not(feature = "testing"))]
+        let now = self.start.elapsed().as_secs_f64();
+        now
+    }
+
+    // Number of periods of the game elapsed
+    pub fn tick(&self) -> u64 {
+        #[cfg(feature = "testing")]
+        let tick = self.ticks.load(Ordering::Relaxed);
+
+        #[cfg(not(feature = "testing"))]
+        let tick = (self.start.elapsed().as_secs_f64() / ITER_PERIOD.as_secs_f64()) as u64;
+        tick
+    }
+
+    fn advance(&self) {
+        self.ticks.fetch_add(1, Ordering::Relaxed);
+    }
+
+    // First tick where the time of the game is at least `t`
+    fn tick_of(t: f64) -> u64 {
+        (t / ITER_PERIOD.as_secs_f64()).ceil() as u64
+    }
+}
+
 // TODO (#23) Have a global "inflation" rate for all users, that increases over time
 //     Equipment becomes more and more expansive
 
 pub enum GameSignal {
     Stop,
     Tick,
+    // Answered once all the signals sent before it are handled
+    Sync(tokio::sync::oneshot::Sender<()>),
 }
 
+type DirtyPlayers = Arc<std::sync::Mutex<BTreeSet<PlayerId>>>;
+
 #[derive(Clone)]
 pub struct Game {
     pub players: Arc<RwLock<BTreeMap<PlayerId, Arc<RwLock<Player>>>>>,
@@ -38,10 +95,59 @@ pub struct Game {
     pub fifo_events: SyslogFifo,
     pub tstart: f64,
     pub send_sig: Sender<GameSignal>,
+    pub stats: Arc<RwLock<Arc<GameStats>>>,
+    pub tick_times: Arc<TickTimes>,
+    // Lazy mode (SIMEIS_LAZY=1): the players are only updated when a request uses them, or
+    // when something is due for them (see settle)
+    pub lazy: bool,
+    pub clock: Arc<GameClock>,
+    // Players changed by a request since the last tick, their timer must be computed again
+    // Only locked for an insert or a take, never across an await (see SettledPlayer)
+    dirty: DirtyPlayers,
+    // Players used by a request since the last stats, they are read again (see publish_stats)
+    touched: DirtyPlayers,
+}
+
+// A player settled for a request (see Game::settle), gives access to the player like its Arc
+// The request may change what comes next for the player (a flight, an extraction...): once
+// the request drops it, and so its locks on the player, the timer is computed again at the
+// next tick. A tick in the middle of the request still sees the state before it
+// The player is also read again for the next stats
+pub struct SettledPlayer {
+    player: Arc<RwLock<Player>>,
+    id: PlayerId,
+    dirty: Option<DirtyPlayers>,
+    touched: DirtyPlayers,
+}
+
+impl Deref for SettledPlayer {
+    type Target = Arc<RwLock<Player>>;
+
+    fn deref(&self) -> &Self::Target {
+        &self.player
+    }
+}
+
+impl Drop for SettledPlayer {
+    fn drop(&mut self) {
+        if let Some(dirty) = self.dirty.take() {
+            dirty.lock().unwrap().insert(self.id);
+        }
+        self.touched.lock().unwrap().insert(self.id);
+    }
 }
 
 impl Game {
     pub fn init() -> (JoinHandle<()>, Game) {
+        let (data, recv_stop, sysrecv) = Game::new();
+        let thread_data = data.clone();
+        // TODO Reduce stack size of this task
+        let thread = tokio::spawn(async move { thread_data.start(recv_stop, sysrecv).await });
+        (thread, data)
+    }
+
+    // The game, without its thread
+    fn new() -> (Game, Receiver<GameSignal>, SyslogRecv) {
         let (send_stop, recv_stop) = tokio::sync::mpsc::channel(5);
         let (syssend, sysrecv) = SyslogSend::channel();
         let tstart = std::time::SystemTime::now()
@@ -57,12 +163,14 @@ impl Game {
             syslog: syssend.clone(),
             fifo_events: sysrecv.fifo.clone(),
             tstart,
+            stats: Arc::new(RwLock::new(Arc::new(GameStats::default()))),
+            tick_times: Arc::new(TickTimes::default()),
+            lazy: std::env::var("SIMEIS_LAZY").is_ok_and(|v| v == "1"),
+            clock: Arc::new(GameClock::new()),
+            dirty: Arc::new(std::sync::Mutex::new(BTreeSet::new())),
+            touched: Arc::new(std::sync::Mutex::new(BTreeSet::new())),
         };
-
-        let thread_data = data.clone();
-        // TODO Reduce stack size of this task
-        let thread = tokio::spawn(async move { thread_data.start(recv_stop, sysrecv).await });
-        (thread, data)
+        (data, recv_stop, sysrecv)
     }
 
     #[allow(unused_variables, unused_mut)]
@@ -72,6 +180,20 @@ impl Game {
         let mut last_iter = Instant::now();
         let mut market_last_tick = Instant::now();
         let mut rng = rand::rngs::SmallRng::from_os_rng();
+        let mut ticks: u64 = 0;
+
+        let nworkers = std::env::var("SIMEIS_TICK_THREADS")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or_else(|| std::thread::available_parallelism().map_or(1, |n| n.get()))
+            .max(1);
+        let mut timers = TimerWheel::new();
+        let mut board = StatsBoard::default();
+        let workers = tokio::runtime::Builder::new_multi_thread()
+            .worker_threads(nworkers)
+            .thread_name("simeis-tick")
+            .build()
+            .unwrap();
 
         'main: loop {
             #[cfg(feature = "testing")]
@@ -89,8 +211,21 @@ impl Game {
 
             match got {
                 Some(GameSignal::Tick) => {
-                    self.threadloop(&mut rng, &mut market_last_tick, &syslog)
-                        .await;
+                    self.clock.advance();
+                    self.threadloop(
+                        &mut rng,
+                        &mut market_last_tick,
+                        &syslog,
+                        &mut timers,
+                        &mut board,
+                        workers.handle(),
+                        nworkers,
+                    )
+                    .await;
+                    ticks += 1;
+                    if ticks % STATS_PERIOD == 0 {
+                        self.publish_stats(&mut board).await;
+                    }
 
                     #[cfg(not(feature = "testing"))]
                     {
@@ -100,67 +235,205 @@ impl Game {
                     }
                 }
 
+                Some(GameSignal::Sync(done)) => {
+                    let _ = done.send(());
+                }
+
                 None | Some(GameSignal::Stop) => break 'main,
             }
         }
+        // Can't wait for the workers to stop from an async task
+        workers.shutdown_background();
         log::info!("Exiting game thread");
     }
 
-    async fn threadloop<R: Rng>(&self, rng: &mut R, mlt: &mut Instant, syslog: &SyslogRecv) {
+    async fn threadloop<R: Rng>(
+        &self,
+        rng: &mut R,
+        mlt: &mut Instant,
+        syslog: &SyslogRecv,
+        timers: &mut TimerWheel<PlayerId>,
+        board: &mut StatsBoard,
+        workers: &Handle,
+        nworkers: usize,
+    ) {
+        let tstart = Instant::now();
         let market_change_proba = (mlt.elapsed().as_secs_f64() / MARKET_CHANGE_SEC).min(1.0);
 
-        // OK
+        let (nplayers, nshards, slowest) = if self.lazy {
+            self.update_due(syslog, timers, board).await
+        } else {
+            self.update_sharded(syslog, board, workers, nworkers).await
+        };
+
+        if rng.random_bool(market_change_proba) {
+            #[cfg(not(feature = "testing"))]
+            self.market.write().await.update_prices(rng); // OK
+            *mlt = Instant::now();
+        }
+
+        syslog.update().await;
+        self.tick_times
+            .record(tstart.elapsed(), ITER_PERIOD, slowest, nshards, nplayers);
+    }
+
+    // The lock on the list of players is only held to copy it, then each shard locks its
+    // players one at a time: a request never waits for more than the update of one player.
+    // The events are sent to the syslog once all the shards are done, no lock held
+    async fn update_sharded(
+        &self,
+        syslog: &SyslogRecv,
+        board: &mut StatsBoard,
+        workers: &Handle,
+        nworkers: usize,
+    ) -> (usize, usize, Duration) {
+        // Sorted by ID, the events are sent in the same order at each run
+        let players: Vec<(PlayerId, Arc<RwLock<Player>>)> = self
+            .players
+            .read()
+            .await
+            .iter()
+            .map(|(id, player)| (*id, player.clone()))
+            .collect();
+        let nshards = players.len().div_ceil(SHARD_MIN_PLAYERS).clamp(1, nworkers);
+        let shard_size = players.len().div_ceil(nshards).max(1);
+        let shards: Vec<_> = players
+            .chunks(shard_size)
+            .map(|shard| workers.spawn(update_players(shard.to_vec())))
+            .collect();
+
+        let mut slowest = Duration::ZERO;
+        for shard in shards {
+            let (events, money, took) = shard.await.unwrap();
+            slowest = slowest.max(took);
+            for (player_id, money, lost) in money {
+                board.update_money(player_id, money, lost, 0.0);
+            }
+            for (player_id, event) in events {
+                syslog.event(player_id, event).await;
+            }
+        }
+        (players.len(), nshards, slowest)
+    }
+
+    // Lazy mode: only the players with a timer due at this tick are updated, the cost of a
+    // tick depends on the events happening, not on the number of players and ships
+    async fn update_due(
+        &self,
+        syslog: &SyslogRecv,
+        timers: &mut TimerWheel<PlayerId>,
+        board: &mut StatsBoard,
+    ) -> (usize, usize, Duration) {
+        let tstart = Instant::now();
+        let dirty = std::mem::take(&mut *self.dirty.lock().unwrap());
+        for (player_id, player) in self.get_players(dirty.iter()).await {
+            schedule_player(timers, player_id, &*player.read().await);
+        }
+
+        let now = self.clock.now();
+        let due = timers.advance(self.clock.tick());
+        for (player_id, player) in self.get_players(due.iter()).await {
+            let mut events = vec![];
+            {
+                let mut player = player.write().await; // OK
+                settle_player(&mut player, now, &mut events);
+                schedule_player(timers, player_id, &player);
+                board.update_money(player_id, player.money, player.lost, player.settled);
+            }
+            for event in events {
+                syslog.event(player_id, event).await;
+            }
+        }
+        (due.len(), 1, tstart.elapsed())
+    }
+
+    async fn get_players<'a, I: Iterator<Item = &'a PlayerId>>(
+        &self,
+        ids: I,
+    ) -> Vec<(PlayerId, Arc<RwLock<Player>>)> {
         let players = self.players.read().await;
-        let mut all_players: Vec<PlayerId> = players.keys().cloned().collect();
-        all_players.sort();
-        for player_id in all_players {
-            let mut player = players.get(&player_id).unwrap().write().await; // OK
-            player.update_money(syslog, ITER_PERIOD.as_secs_f64()).await;
-
-            let mut deadship = vec![];
-            for (id, ship) in player.ships.iter_mut() {
-                match ship.state {
-                    ShipState::InFlight(..) => {
-                        let finished = ship.update_flight(ITER_PERIOD.as_secs_f64());
-                        if finished {
-                            ship.state = ShipState::Idle;
-                            if ship.hull_decay >= ship.hull_decay_capacity {
-                                deadship.push(*id);
-                            } else {
-                                syslog
-                                    .event(player_id, SyslogEvent::ShipFlightFinished(*id))
-                                    .await;
-                            }
-                        }
-                    }
+        ids.filter_map(|id| players.get(id).map(|player| (*id, player.clone())))
+            .collect()
+    }
 
-                    ShipState::Extracting(..) => {
-                        let finished = ship.update_extract(ITER_PERIOD.as_secs_f64());
-                        if finished {
-                            ship.state = ShipState::Idle;
-                            syslog
-                                .event(player_id, SyslogEvent::ExtractionStopped(*id))
-                                .await;
-                        }
+    // Lazy mode: computes the state of the player for the current time, before a request uses it
+    // Its timer is computed again once the request drops the SettledPlayer
+    pub async fn settle(&self, player_id: PlayerId, player: Arc<RwLock<Player>>) -> SettledPlayer {
+        let mut settled = SettledPlayer {
+            player,
+            id: player_id,
+            dirty: None,
+            touched: self.touched.clone(),
+        };
+        if !self.lazy {
+            return settled;
+        }
+        let mut events = vec![];
+        settle_player(
+            &mut *settled.player.write().await, // OK
+            self.clock.now(),
+            &mut events,
+        );
+        for event in events {
+            self.syslog.event(&player_id, event).await;
+        }
+        settled.dirty = Some(self.dirty.clone());
+        settled
+    }
+
+    // Snapshot of the stats of the players for /gamestats, a new one only if something changed
+    // Only the players used by a request since the last one are read again, one at a time, the
+    // tick keeps the money of the others up to date (see StatsBoard)
+    async fn publish_stats(&self, board: &mut StatsBoard) {
+        let touched = std::mem::take(&mut *self.touched.lock().unwrap());
+        for (player_id, player) in self.get_players(touched.iter()).await {
+            let (mut stats, costs, settled) = {
+                let p = player.read().await;
+                let stats = PlayerStats {
+                    created: self.tstart
+                        + p.created
+                            .saturating_duration_since(self.clock.start)
+                            .as_secs_f64(),
+                    lost: p.lost,
+                    money: p.money,
+                    name: p.name.clone(),
+                    potential: 0.0,
+                    score: p.score,
+                    stations: p.stations.clone(),
+                };
+                (stats, p.costs, p.settled)
+            };
+
+            // The lock on the galaxy is only held to get the stations
+            let mut stations = vec![];
+            {
+                let galaxy = self.galaxy.read().await;
+                for coord in stats.stations.values() {
+                    if let Some(station) = galaxy.get_station(coord).await {
+                        stations.push(station);
                     }
-                    _ => {}
                 }
             }
-            for id in deadship {
-                syslog
-                    .event(player_id, SyslogEvent::ShipDestroyed(id))
-                    .await;
-                player.ships.remove(&id);
+            for station in stations {
+                stats.potential += station
+                    .read()
+                    .await
+                    .cargo
+                    .resources
+                    .iter()
+                    .map(|(r, amnt)| r.base_price() * amnt)
+                    .sum::<f64>();
             }
+            board.set(player_id, stats, costs, settled);
         }
 
-        if rng.random_bool(market_change_proba) {
-            #[cfg(not(feature = "testing"))]
-            self.market.write().await.update_prices(rng); // OK
-            *mlt = Instant::now();
+        let players = board.snapshot(self.lazy.then(|| self.clock.now()));
+        let last = self.stats.read().await.clone();
+        if last.version > 0 && last.players == players {
+            return;
         }
-
-        syslog.update().await;
+        let stats = GameStats::new(last.version + 1, players);
+        *self.stats.write().await = Arc::new(stats);
     }
 
     pub async fn stop(self, handle: JoinHandle<()>) {
@@ -176,13 +449,205 @@ impl Game {
         let mut galaxy = self.galaxy.write().await;
         let station = galaxy.init_new_station().await;
 
-        let player = Player::new(station, name);
+        let mut player = Player::new(station, name);
+        player.settled = self.clock.now();
         let pid = player.id;
         let key = BASE64_STANDARD.encode(player.key);
 
         index.insert(player.key, player.id);
         players.insert(player.id, Arc::new(RwLock::new(player)));
+        self.touched.lock().unwrap().insert(pid);
         self.syslog.event(&pid, SyslogEvent::GameStarted).await;
         Ok((pid, key))
     }
 }
+
+// The events of the players of a shard, their money (and if they lost) for the stats, and the
+// time it took
+type ShardUpdate = (
+    Vec<(PlayerId, SyslogEvent)>,
+    Vec<(PlayerId, f64, bool)>,
+    Duration,
+);
+
+async fn update_players(players: Vec<(PlayerId, Arc<RwLock<Player>>)>) -> ShardUpdate {
+    let tstart = Instant::now();
+    let mut events = vec![];
+    let mut money = Vec::with_capacity(players.len());
+    let mut player_events = vec![];
+    for (player_id, player) in players {
+        let mut player = player.write().await; // OK
+        update_player(&mut player, ITER_PERIOD.as_secs_f64(), &mut player_events);
+        money.push((player_id, player.money, player.lost));
+        drop(player);
+        events.extend(player_events.drain(..).map(|ev| (player_id, ev)));
+    }
+    (events, money, tstart.elapsed())
+}
+
+fn update_player(player: &mut Player, tdelta: f64, events: &mut Vec<SyslogEvent>) {
+    player.update_money(tdelta, events);
+
+    let mut deadship = vec![];
+    for (id, ship) in player.ships.iter_mut() {
+        match ship.state {
+            ShipState::InFlight(..) => {
+                let finished = ship.update_flight(tdelta);
+                if finished {
+                    ship.state = ShipState::Idle;
+                    if ship.hull_decay >= ship.hull_decay_capacity {
+                        deadship.push(*id);
+                    } else {
+                        events.push(SyslogEvent::ShipFlightFinished(*id));
+                    }
+                }
+            }
+
+            ShipState::Extracting(..) => {
+                let finished = ship.update_extract(tdelta);
+                if finished {
+                    ship.state = ShipState::Idle;
+                    events.push(SyslogEvent::ExtractionStopped(*id));
+                }
+            }
+            _ => {}
+        }
+    }
+    for id in deadship {
+        events.push(SyslogEvent::ShipDestroyed(id));
+        player.ships.remove(&id);
+    }
+}
+
+fn settle_player(player: &mut Player, now: f64, events: &mut Vec<SyslogEvent>) {
+    let tdelta = now - player.settled;
+    if tdelta > 0.0 {
+        update_player(player, tdelta, events);
+        player.settled = now;
+    }
+}
+
+fn schedule_player(timers: &mut TimerWheel<PlayerId>, player_id: PlayerId, player: &Player) {
+    match player.next_event() {
+        Some(t) => timers.schedule(player_id, GameClock::tick_of(player.settled + t)),
+        None => timers.cancel(&player_id),
+    }
+}
+
+// A ship flying to (500, 500, 500), and the duration of its flight
+#[cfg(test)]
+fn flying_ship() -> (crate::ship::Ship, f64) {
+    use crate::crew::{CrewMember, CrewMemberType};
+    use crate::ship::Ship;
+
+    let mut ship = Ship::random((0, 0, 0));
+    ship.fuel_tank_capacity = 1e6;
+    ship.fuel_tank = ship.fuel_tank_capacity;
+    ship.hull_decay_capacity = 1e9;
+    ship.crew
+        .0
+        .insert(0, CrewMember::from(CrewMemberType::Pilot));
+    ship.pilot = Some(0);
+    ship.update_perf_stats();
+    let costs = ship.set_travel((500, 500, 500)).unwrap();
+    (ship, costs.duration)
+}
+
+#[test]
+fn test_lazy_settle() {
+    let (ship, duration) = flying_ship();
+    let new_player = || {
+        let mut player = Player::new((0, (0, 0, 0)), "lazy".to_string());
+        player.costs = 10.0;
+        player.ships.insert(ship.id, ship.clone());
+        player
+    };
+
+    // Nothing to do until the timer fires
+    let mut lazy = new_player();
+    let tevent = lazy.next_event().unwrap();
+    assert!((tevent - duration).abs() < 1e-9);
+    let mut timers = TimerWheel::new();
+    schedule_player(&mut timers, lazy.id, &lazy);
+    let tick = GameClock::tick_of(tevent);
+    assert!(timers.advance(tick - 1).is_empty());
+    assert_eq!(timers.advance(tick), vec![lazy.id]);
+
+    let mut events = vec![];
+    settle_player(
+        &mut lazy,
+        tick as f64 * ITER_PERIOD.as_secs_f64(),
+        &mut events,
+    );
+    assert!(matches!(events[..], [SyslogEvent::ShipFlightFinished(_)]));
+    assert!(lazy.next_event().unwrap() > 60.0);
+
+    // Same state as the game updating the player at each tick
+    let mut stepped = new_player();
+    let mut stepped_events = vec![];
+    for _ in 0..tick {
+        update_player(&mut stepped, ITER_PERIOD.as_secs_f64(), &mut stepped_events);
+    }
+    assert_eq!(stepped_events.len(), events.len());
+    assert!((stepped.money - lazy.money).abs() < 1e-6);
+    let (sship, lship) = (&stepped.ships[&ship.id], &lazy.ships[&ship.id]);
+    assert_eq!(sship.position, lship.position);
+    assert!((sship.fuel_tank - lship.fuel_tank).abs() < 1e-6);
+}
+
+#[test]
+fn test_lazy_request_timer() {
+    let rt = tokio::runtime::Builder::new_current_thread()
+        .build()
+        .unwrap();
+    rt.block_on(async {
+        let (mut game, _signals, syslog) = Game::new();
+        game.lazy = true;
+        let (player_id, _) = game.new_player("lazy".to_string()).await.unwrap();
+        let player = game.players.read().await[&player_id].clone();
+        let mut timers = TimerWheel::new();
+        let mut board = StatsBoard::default();
+
+        let settled = game.settle(player_id, player).await;
+        // Ticks while the request waits for another lock, then changes the player
+        game.update_due(&syslog, &mut timers, &mut board).await;
+        assert!(timers.is_empty());
+        {
+            let (ship, _) = flying_ship();
+            settled.write().await.ships.insert(ship.id, ship);
+        }
+        game.update_due(&syslog, &mut timers, &mut board).await;
+        assert!(timers.is_empty());
+
+        // The request is done with the player, the next tick sees the flight
+        drop(settled);
+        game.update_due(&syslog, &mut timers, &mut board).await;
+        assert_eq!(timers.len(), 1);
+    });
+}
+
+#[test]
+fn test_stats_touched_players() {
+    let rt = tokio::runtime::Builder::new_current_thread()
+        .build()
+        .unwrap();
+    rt.block_on(async {
+        let (game, _signals, _syslog) = Game::new();
+        let (player_id, _) = game.new_player("stats".to_string()).await.unwrap();
+        let player = game.players.read().await[&player_id].clone();
+        let mut board = StatsBoard::default();
+        game.publish_stats(&mut board).await;
+        let stats = game.stats.read().await.clone();
+        assert_eq!((stats.version, stats.players[&player_id].score), (1, 0.0));
+
+        // Not read again as long as no request used the player
+        player.write().await.score = 10.0;
+        game.publish_stats(&mut board).await;
+        assert_eq!(game.stats.read().await.version, 1);
+
+        drop(game.settle(player_id, player).await);
+        game.publish_stats(&mut board).await;
+        let stats = game.stats.read().await.clone();
+        assert_eq!((stats.version, stats.players[&player_id].score), (2, 10.0));
+    });
+}
@@ -7,7 +7,9 @@ pub mod game;
 pub mod market;
 pub mod player;
 pub mod ship;
+pub mod stats;
 pub mod syslog;
+pub mod timers;
 
 #[cfg(test)]
 pub mod tests;
@@ -2,7 +2,9 @@ use rand::Rng;
 use rand_distr::{Distribution, Normal};
 use serde::{Deserialize, Serialize};
 use std::collections::BTreeMap;
+use std::sync::Arc;
 use strum::IntoEnumIterator;
+use tokio::sync::broadcast;
 
 use crate::{crew::CrewMember, ship::resources::Resource};
 
@@ -18,6 +20,12 @@ const PRICE_INC_DIV: f64 = 40000.0;
 const PRICE_INC_RANGE_MAX: f64 = 10.0 / 100.0;
 const PRICE_INC_MIN_RATIO: f64 = 75.0 / 100.0;
 
+// Number of changes kept for a subscriber too slow to read them
+const PRICE_CHANGES_BUFFER: usize = 64;
+
+// The new price of the resources that changed
+pub type PriceChanges = Arc<BTreeMap<Resource, f64>>;
+
 #[inline]
 pub fn fee_rate(rank: u8) -> f64 {
     BASE_FEE_RATE / (rank as f64).powf(FEE_RATE_DEC_POWF)
@@ -26,6 +34,9 @@ pub fn fee_rate(rank: u8) -> f64 {
 #[derive(Serialize)]
 pub struct Market {
     pub prices: BTreeMap<Resource, f64>,
+    // Every change of price is sent here, see subscribe()
+    #[serde(skip)]
+    changes: broadcast::Sender<PriceChanges>,
 }
 
 impl Market {
@@ -34,7 +45,22 @@ impl Market {
         for r in Resource::iter() {
             prices.insert(r, r.base_price());
         }
-        Market { prices }
+        let (changes, _) = broadcast::channel(PRICE_CHANGES_BUFFER);
+        Market { prices, changes }
+    }
+
+    // Receives the prices changed by the game (update_prices) and by the players (buy / sell)
+    // A receiver lagging behind more than PRICE_CHANGES_BUFFER changes gets a RecvError::Lagged
+    pub fn subscribe(&self) -> broadcast::Receiver<PriceChanges> {
+        self.changes.subscribe()
+    }
+
+    fn publish<I: IntoIterator<Item = Resource>>(&self, changed: I) {
+        if self.changes.receiver_count() == 0 {
+            return;
+        }
+        let prices = changed.into_iter().map(|r| (r, self.prices[&r])).collect();
+        let _ = self.changes.send(Arc::new(prices));
     }
 
     fn rand_distrib(&self, r: &Resource, now_price: f64) -> Normal<f64> {
@@ -64,11 +90,15 @@ impl Market {
             new_prices.push((*res, self.get_new_price(rng, res, *price)));
         }
 
+        let changed: Vec<Resource> = new_prices.iter().map(|(r, _)| *r).collect();
         for (r, price) in new_prices {
             let p = self.prices.get_mut(&r).unwrap();
             log::debug!("{r:?} {price} ({:?}%)", (price / r.base_price()) * 100.0);
             *p = price;
         }
+        if !changed.is_empty() {
+            self.publish(changed);
+        }
     }
 
     pub fn buy(&mut self, trader: &CrewMember, r: &Resource, amnt: f64) -> MarketTx {
@@ -84,6 +114,7 @@ impl Market {
         let mut rng = rand::rng();
         let inc = rng.random_range(price_inc_min..=price_inc_max);
         *self.prices.get_mut(r).unwrap() *= 1.0 + inc;
+        self.publish([*r]);
 
         MarketTx {
             added_cargo: Some((*r, amnt)),
@@ -107,6 +138,7 @@ impl Market {
         let mut rng = rand::rng();
         let dec = rng.random_range(price_dec_min..=price_dec_max);
         *self.prices.get_mut(r).unwrap() *= 1.0 - dec;
+        self.publish([*r]);
 
         MarketTx {
             removed_cargo: Some((*r, amnt)),
@@ -126,3 +158,26 @@ pub struct MarketTx {
     pub removed_money: Option<f64>,
     pub fees: f64,
 }
+
+#[test]
+fn test_market_price_changes() {
+    use rand::SeedableRng;
+
+    let mut market = Market::init();
+    let mut changes = market.subscribe();
+    let mut rng = rand::rngs::SmallRng::seed_from_u64(0);
+    for _ in 0..10 {
+        market.update_prices(&mut rng);
+    }
+
+    // The last change of each resource is its current price
+    let mut last = BTreeMap::new();
+    while let Ok(changed) = changes.try_recv() {
+        assert!(!changed.is_empty());
+        last.extend(changed.iter().map(|(r, p)| (*r, *p)));
+    }
+    assert!(!last.is_empty());
+    for (r, price) in last {
+        assert_eq!(market.prices[&r], price);
+    }
+}
@@ -11,7 +11,7 @@ use crate::galaxy::{Galaxy, SpaceCoord};
 use crate::ship::module::{ShipModuleId, ShipModuleType};
 use crate::ship::upgrade::ShipUpgrade;
 use crate::ship::{Ship, ShipId};
-use crate::syslog::{SyslogEvent, SyslogRecv};
+use crate::syslog::SyslogEvent;
 
 const INIT_MONEY: f64 = 72000.0;
 
@@ -29,6 +29,8 @@ pub struct Player {
     pub name: String,
     pub money: f64,
     pub costs: f64,
+    // Time of the game (secs) the state was computed for, in lazy mode (see Game::settle)
+    pub settled: f64,
 
     pub stations: BTreeMap<StationId, SpaceCoord>,
     pub ships: BTreeMap<ShipId, Ship>,
@@ -60,6 +62,7 @@ impl Player {
             money,
             score: 0.0,
             costs: 0.0,
+            settled: 0.0,
 
             name,
             stations,
@@ -88,17 +91,35 @@ impl Player {
             .sum::<f64>();
     }
 
-    pub async fn update_money(&mut self, syslog: &SyslogRecv, tdelta: f64) {
+    // Time before something happens without any action of the player: a ship arriving or
+    // with a full cargo, the money getting low or exhausted
+    pub fn next_event(&self) -> Option<f64> {
+        let mut next = f64::INFINITY;
+        for ship in self.ships.values() {
+            next = next.min(ship.time_before_event());
+        }
+        if self.costs > 0.0 && !self.lost {
+            let low = self.money - (self.costs * 60.0);
+            if low > 0.0 {
+                next = next.min(low / self.costs);
+            }
+            next = next.min(self.money.max(0.0) / self.costs);
+        }
+        next.is_finite().then_some(next)
+    }
+
+    // The events to send to the player are added to `events`
+    pub fn update_money(&mut self, tdelta: f64, events: &mut Vec<SyslogEvent>) {
         let before = self.money < (self.costs * 60.0);
         self.money -= self.costs * tdelta;
         let after = self.money < (self.costs * 60.0);
         if after && !before {
             let tleft = std::time::Duration::from_secs_f64(self.money / self.costs);
-            syslog.event(self.id, SyslogEvent::LowFunds(tleft)).await;
+            events.push(SyslogEvent::LowFunds(tleft));
         }
         if self.money < 0.0 && !self.lost {
             self.lost = true;
-            syslog.event(self.id, SyslogEvent::GameLost).await;
+            events.push(SyslogEvent::GameLost);
             // TODO (#19)  Allow to create a new game with the same name if old one lost
             // TODO (#19)  What to do with its resources, ships, etc...
         }
@@ -198,44 +198,60 @@ impl Ship {
         Ok(cost)
     }
 
-    pub fn update_flight(&mut self, mut tdelta: f64) -> bool {
-        let ShipState::InFlight(ref mut data) = self.state else {
-            unreachable!();
+    // Time before the end of the flight, before running out of fuel, before wearing out the hull
+    fn flight_limits(&self) -> (f64, f64, f64) {
+        let ShipState::InFlight(ref data) = self.state else {
+            return (f64::INFINITY, f64::INFINITY, f64::INFINITY);
         };
+        let speed = self.stats.speed;
+        let tdest = (data.dist_tot - data.dist_done) / speed;
+        let tfuel = self.fuel_tank / self.stats.fuel_consumption;
+        let thull =
+            (self.hull_decay_capacity - self.hull_decay) / (self.stats.hull_usage_rate * speed);
+        (tdest.max(0.0), tfuel.max(0.0), thull.max(0.0))
+    }
 
-        let mut finished = false;
-        let mut dist_delta = self.stats.speed * tdelta;
-        data.dist_done += dist_delta;
-        if data.dist_done > data.dist_tot {
-            finished = true;
-            let doverflow = data.dist_done - data.dist_tot;
-            data.dist_done -= doverflow;
-            dist_delta -= doverflow;
-
-            let toverflow = doverflow / self.stats.speed;
-            tdelta -= toverflow;
-            debug_assert!(((tdelta * self.stats.speed) - dist_delta).abs() < 1e-7);
+    // Time before the current action of the ship stops by itself
+    pub fn time_before_event(&self) -> f64 {
+        match self.state {
+            ShipState::InFlight(..) => {
+                let (tdest, tfuel, thull) = self.flight_limits();
+                tdest.min(tfuel).min(thull)
+            }
+            ShipState::Extracting(ref rates) => rates.time_before_full(&self.cargo),
+            ShipState::Idle => f64::INFINITY,
         }
+    }
 
-        self.position = translation(data.start, data.direction, data.dist_done);
-
-        self.fuel_tank -= self.stats.fuel_consumption * tdelta;
-        if self.fuel_tank <= 0.0 {
-            self.fuel_tank = 0.0;
-            log::debug!("Ship {} has an empty fuel tank", self.id);
-            return true;
-        }
+    // Closed form, the result is the same for one call with a long `tdelta` or many short ones
+    // Returns true when the flight is over: arrived, out of fuel, or hull worn out
+    pub fn update_flight(&mut self, tdelta: f64) -> bool {
+        let (tdest, tfuel, thull) = self.flight_limits();
+        let tleft = tdest.min(tfuel).min(thull);
+        let ShipState::InFlight(ref mut data) = self.state else {
+            unreachable!();
+        };
 
+        let tdelta = tdelta.min(tleft);
+        let dist_delta = self.stats.speed * tdelta;
+        data.dist_done = (data.dist_done + dist_delta).min(data.dist_tot);
+        self.position = translation(data.start, data.direction, data.dist_done);
+        self.fuel_tank = (self.fuel_tank - self.stats.fuel_consumption * tdelta).max(0.0);
         self.hull_decay += self.stats.hull_usage_rate * dist_delta;
-        if self.hull_decay >= self.hull_decay_capacity {
-            log::debug!("Ship {} worn out all its hull", self.id);
-            return true;
+        if tdelta < tleft {
+            return false;
         }
 
-        if finished {
+        if thull == tleft {
+            self.hull_decay = self.hull_decay.max(self.hull_decay_capacity);
+            log::debug!("Ship {} worn out all its hull", self.id);
+        } else if tfuel == tleft {
+            self.fuel_tank = 0.0;
+            log::debug!("Ship {} has an empty fuel tank", self.id);
+        } else {
             debug_assert_eq!(self.position, data.destination);
         }
-        finished
+        true
     }
 
     pub fn stop_navigation(&mut self) -> Result<SpaceCoord, Errcode> {
@@ -356,3 +372,40 @@ fn test_ship_flight() {
         // TODO Check distance
     });
 }
+
+#[test]
+fn test_ship_flight_closed_form() {
+    crate::tests::create_property_based_test(1000, &[], |rng| {
+        let mut ship = Ship::random((0, 0, 0));
+        ship.fuel_tank = ship.fuel_tank_capacity;
+        ship.crew
+            .0
+            .insert(0, crate::crew::CrewMember::from(CrewMemberType::Pilot));
+        ship.pilot = Some(0);
+        ship.update_perf_stats();
+
+        let add = rng.random_range(1..1000);
+        let Ok(costs) = ship.set_travel((add, add, add)) else {
+            return;
+        };
+        let mut stepped = ship.clone();
+
+        // A single update, long after the arrival
+        assert!(ship.update_flight(costs.duration * 3.0));
+        assert_eq!(ship.position, (add, add, add));
+        let fuel_left = ship.fuel_tank_capacity - costs.fuel_consumption;
+        assert!((ship.fuel_tank - fuel_left).abs() < 1e-6);
+        assert!((ship.hull_decay - costs.hull_usage).abs() < 1e-6);
+
+        // Same result with the 20 ms steps of the game
+        let mut nsteps = 0;
+        while !stepped.update_flight(0.02) {
+            nsteps += 1;
+        }
+        let expected = (costs.duration / 0.02).ceil() as usize - 1;
+        assert!(nsteps.abs_diff(expected) <= 1);
+        assert_eq!(stepped.position, ship.position);
+        assert!((stepped.fuel_tank - ship.fuel_tank).abs() < 1e-6);
+        assert!((stepped.hull_decay - ship.hull_decay).abs() < 1e-6);
+    });
+}
@@ -127,13 +127,23 @@ impl ExtractionInfo {
         ExtractionInfo(extraction)
     }
 
+    // Closed form, stops when the cargo is full: each resource gets its share until then
     pub fn update_cargo(&self, cargo: &mut ShipCargo, tdelta: f64) -> bool {
+        let tfull = self.time_before_full(cargo);
         for (res, rate) in self.0.iter() {
-            cargo.add_resource(res, *rate * tdelta);
+            cargo.add_resource(res, *rate * tdelta.min(tfull));
+        }
+        if tdelta >= tfull {
+            cargo.usage = cargo.capacity;
         }
         cargo.is_full()
     }
 
+    pub fn time_before_full(&self, cargo: &ShipCargo) -> f64 {
+        let vol_per_sec: f64 = self.0.iter().map(|(res, rate)| res.volume() * rate).sum();
+        ((cargo.capacity - cargo.usage) / vol_per_sec).max(0.0)
+    }
+
     pub fn time_before_cargo_full(&self, cargocap: f64) -> std::time::Duration {
         let mut vol_per_sec = 0.0;
         for (res, rate) in self.0.iter() {
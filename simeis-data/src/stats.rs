@@ -0,0 +1,309 @@
+use std::collections::hash_map::DefaultHasher;
+use std::collections::BTreeMap;
+use std::hash::{Hash, Hasher};
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::time::Duration;
+
+use serde::Serialize;
+use serde_json::{json, to_value, Value};
+
+use crate::galaxy::station::StationId;
+use crate::galaxy::SpaceCoord;
+use crate::player::PlayerId;
+
+// Number of ticks between two snapshots of the stats
+#[cfg(not(feature = "testing"))]
+pub const STATS_PERIOD: u64 = 50;
+
+// The tests tick by hand, they see the stats right away
+#[cfg(feature = "testing")]
+pub const STATS_PERIOD: u64 = 1;
+
+// Fields sorted by name, same output as the json! macro
+// Only what changes with the game: the clients compute the age of a player from `created`
+// (UNIX time in secs), a snapshot isn't made outdated by the time going by
+#[derive(Clone, Debug, Serialize, PartialEq)]
+pub struct PlayerStats {
+    pub created: f64,
+    pub lost: bool,
+    pub money: f64,
+    pub name: String,
+    pub potential: f64,
+    pub score: f64,
+    pub stations: BTreeMap<StationId, SpaceCoord>,
+}
+
+impl PlayerStats {
+    fn rank_value(&self) -> f64 {
+        self.score + self.potential
+    }
+}
+
+// The stats of each player, kept up to date by the game thread, the snapshots are built from it
+//     - The money of a player is set by the tick that updated it
+//     - A player used by a request is read again, with the cargo of its stations (see
+//       Game::publish_stats), the others are left as they are
+// Building a snapshot doesn't lock anything
+#[derive(Debug, Default)]
+pub struct StatsBoard {
+    players: BTreeMap<PlayerId, BoardEntry>,
+}
+
+#[derive(Debug)]
+struct BoardEntry {
+    stats: PlayerStats,
+    // Lazy mode: the wages per sec, and the time the money was computed for
+    costs: f64,
+    settled: f64,
+}
+
+impl StatsBoard {
+    pub fn set(&mut self, id: PlayerId, stats: PlayerStats, costs: f64, settled: f64) {
+        let entry = BoardEntry {
+            stats,
+            costs,
+            settled,
+        };
+        self.players.insert(id, entry);
+    }
+
+    // Nothing to do for a player not read yet, it's added with all its stats
+    pub fn update_money(&mut self, id: PlayerId, money: f64, lost: bool, settled: f64) {
+        if let Some(entry) = self.players.get_mut(&id) {
+            entry.stats.money = money;
+            entry.stats.lost = lost;
+            entry.settled = settled;
+        }
+    }
+
+    // With `now` (lazy mode), the wages not taken from the money yet are removed
+    pub fn snapshot(&self, now: Option<f64>) -> BTreeMap<PlayerId, PlayerStats> {
+        self.players
+            .iter()
+            .map(|(id, entry)| {
+                let mut stats = entry.stats.clone();
+                if let Some(now) = now {
+                    stats.money -= entry.costs * (now - entry.settled).max(0.0);
+                }
+                (*id, stats)
+            })
+            .collect()
+    }
+}
+
+// Snapshot of the stats of all the players, built by the game thread and never modified
+// The requests on /gamestats only clone the Arc of the last one
+#[derive(Debug, Default)]
+pub struct GameStats {
+    pub version: u64,
+    pub players: BTreeMap<PlayerId, PlayerStats>,
+    // From the best player to the worst (score + potential), the players that lost last
+    pub ranking: Vec<PlayerId>,
+    pub active: usize,
+}
+
+impl GameStats {
+    pub fn new(version: u64, players: BTreeMap<PlayerId, PlayerStats>) -> GameStats {
+        let mut ranking: Vec<PlayerId> = players.keys().cloned().collect();
+        ranking.sort_by(|a, b| {
+            let (pa, pb) = (&players[a], &players[b]);
+            pa.lost
+                .cmp(&pb.lost)
+                .then(pb.rank_value().total_cmp(&pa.rank_value()))
+                .then(a.cmp(b))
+        });
+        let active = players.values().filter(|p| !p.lost).count();
+        GameStats {
+            version,
+            players,
+            ranking,
+            active,
+        }
+    }
+
+    // Hash of `data` (from to_json) and of the counts sent in the headers: a new snapshot only
+    // changes the ETag if it changes what the client gets
+    pub fn etag(&self, data: &Value) -> String {
+        let mut hasher = DefaultHasher::new();
+        data.to_string().hash(&mut hasher);
+        (self.players.len(), self.active).hash(&mut hasher);
+        format!("\"{:x}\"", hasher.finish())
+    }
+
+    // All the players, or only the `top` best ones
+    pub fn to_json(&self, top: Option<usize>) -> Value {
+        let Some(top) = top else {
+            return to_value(&self.players).unwrap();
+        };
+        let best: BTreeMap<&PlayerId, &PlayerStats> = self
+            .ranking
+            .iter()
+            .take(top)
+            .map(|id| (id, &self.players[id]))
+            .collect();
+        to_value(best).unwrap()
+    }
+}
+
+// Time taken by the ticks of the game, written by the game thread and read by /tickstats
+// A tick updates the players in shards, each one in its own task (see Game::threadloop)
+#[derive(Debug, Default)]
+pub struct TickTimes {
+    ticks: AtomicU64,
+    // Ticks longer than the period of the game
+    slow: AtomicU64,
+    total_us: AtomicU64,
+    last_us: AtomicU64,
+    max_us: AtomicU64,
+    // Longest shard of the last tick, and of all the ticks
+    shard_last_us: AtomicU64,
+    shard_max_us: AtomicU64,
+    shards: AtomicU64,
+    // Players updated by the last tick (in lazy mode, only the ones with something due)
+    players: AtomicU64,
+}
+
+impl TickTimes {
+    pub fn record(
+        &self,
+        took: Duration,
+        period: Duration,
+        shard: Duration,
+        shards: usize,
+        players: usize,
+    ) {
+        let (us, shard_us) = (took.as_micros() as u64, shard.as_micros() as u64);
+        self.ticks.fetch_add(1, Ordering::Relaxed);
+        if took > period {
+            self.slow.fetch_add(1, Ordering::Relaxed);
+        }
+        self.total_us.fetch_add(us, Ordering::Relaxed);
+        self.last_us.store(us, Ordering::Relaxed);
+        self.max_us.fetch_max(us, Ordering::Relaxed);
+        self.shard_last_us.store(shard_us, Ordering::Relaxed);
+        self.shard_max_us.fetch_max(shard_us, Ordering::Relaxed);
+        self.shards.store(shards as u64, Ordering::Relaxed);
+        self.players.store(players as u64, Ordering::Relaxed);
+    }
+
+    // Times in milliseconds
+    pub fn to_json(&self) -> Value {
+        let ms = |v: &AtomicU64| v.load(Ordering::Relaxed) as f64 / 1000.0;
+        let ticks = self.ticks.load(Ordering::Relaxed);
+        json!({
+            "ticks": ticks,
+            "slow": self.slow.load(Ordering::Relaxed),
+            "avg": if ticks == 0 { 0.0 } else { ms(&self.total_us) / ticks as f64 },
+            "last": ms(&self.last_us),
+            "max": ms(&self.max_us),
+            "shard_last": ms(&self.shard_last_us),
+            "shard_max": ms(&self.shard_max_us),
+            "shards": self.shards.load(Ordering::Relaxed),
+            "players": self.players.load(Ordering::Relaxed),
+        })
+    }
+}
+
+#[test]
+fn test_gamestats_ranking() {
+    let player = |score: f64, potential: f64, lost: bool| PlayerStats {
+        created: 0.0,
+        lost,
+        money: 0.0,
+        name: String::new(),
+        potential,
+        score,
+        stations: BTreeMap::new(),
+    };
+    let mut players = BTreeMap::new();
+    players.insert(1, player(10.0, 0.0, false));
+    players.insert(2, player(1000.0, 0.0, true));
+    players.insert(3, player(5.0, 20.0, false));
+    players.insert(4, player(10.0, 0.0, false));
+    let stats = GameStats::new(1, players);
+    assert_eq!(stats.ranking, vec![3, 1, 4, 2]);
+    assert_eq!(stats.active, 3);
+
+    let top = stats.to_json(Some(2));
+    let top = top.as_object().unwrap();
+    assert_eq!(top.len(), 2);
+    assert!(top.contains_key("3") && top.contains_key("1"));
+}
+
+#[test]
+fn test_gamestats_etag() {
+    let player = |score: f64, money: f64| PlayerStats {
+        created: 0.0,
+        lost: false,
+        money,
+        name: String::new(),
+        potential: 0.0,
+        score,
+        stations: BTreeMap::new(),
+    };
+    let snapshot = |version: u64, low_money: f64| {
+        let mut players = BTreeMap::new();
+        players.insert(1, player(10.0, 100.0));
+        players.insert(2, player(5.0, low_money));
+        GameStats::new(version, players)
+    };
+    let etag = |stats: &GameStats, top: Option<usize>| stats.etag(&stats.to_json(top));
+    let (first, second) = (snapshot(1, 50.0), snapshot(2, 40.0));
+
+    // Only the data sent counts, not the version of the snapshot
+    assert_eq!(etag(&first, Some(1)), etag(&second, Some(1)));
+    assert_ne!(etag(&first, None), etag(&second, None));
+    assert_ne!(etag(&first, Some(1)), etag(&first, None));
+    assert_eq!(etag(&first, None), etag(&snapshot(3, 50.0), None));
+}
+
+#[test]
+fn test_stats_board() {
+    let stats = |money: f64| PlayerStats {
+        created: 0.0,
+        lost: false,
+        money,
+        name: String::new(),
+        potential: 5.0,
+        score: 1.0,
+        stations: BTreeMap::new(),
+    };
+    let mut board = StatsBoard::default();
+    board.update_money(1, 100.0, false, 0.0);
+    assert!(board.snapshot(None).is_empty());
+
+    board.set(1, stats(100.0), 2.0, 10.0);
+    board.set(2, stats(50.0), 0.0, 0.0);
+    board.update_money(1, 80.0, false, 20.0);
+    let snapshot = board.snapshot(None);
+    assert_eq!(snapshot[&1], stats(80.0));
+    assert_eq!(snapshot[&2], stats(50.0));
+
+    // Lazy mode, 5 secs of wages not taken yet
+    let snapshot = board.snapshot(Some(25.0));
+    assert_eq!(snapshot[&1].money, 70.0);
+    assert_eq!(snapshot[&2].money, 50.0);
+}
+
+#[test]
+fn test_tick_times() {
+    let times = TickTimes::default();
+    let period = Duration::from_millis(20);
+    let ms = Duration::from_millis;
+    times.record(ms(10), period, ms(4), 3, 40);
+    times.record(ms(30), period, ms(12), 3, 40);
+    times.record(ms(2), period, ms(2), 1, 10);
+
+    let json = times.to_json();
+    assert_eq!(json["ticks"], 3);
+    assert_eq!(json["slow"], 1);
+    assert_eq!(json["avg"], 14.0);
+    assert_eq!(json["last"], 2.0);
+    assert_eq!(json["max"], 30.0);
+    assert_eq!(json["shard_last"], 2.0);
+    assert_eq!(json["shard_max"], 12.0);
+    assert_eq!(
+        (json["shards"].clone(), json["players"].clone()),
+        (json!(1), json!(10))
+    );
+}
@@ -1,69 +1,128 @@
 #![allow(clippy::type_complexity)]
-use std::collections::BTreeMap;
+use std::collections::{BTreeMap, VecDeque};
 use std::sync::Arc;
 use tokio::sync::mpsc::{error::TryRecvError, Receiver, Sender};
-use tokio::sync::{Mutex, RwLock};
+use tokio::sync::{Mutex, Notify, RwLock};
 
 use serde::{Deserialize, Serialize};
 use strum::IntoStaticStr;
 
 use crate::player::PlayerId;
 
-const SYSLOG_FIFO_MAX_SIZE: usize = 10;
+// Number of events kept for each player, can be changed with SIMEIS_SYSLOG_SIZE
+const SYSLOG_DEFAULT_SIZE: usize = 1000;
 
 type SyslogData = (PlayerId, f64, SyslogEvent);
-pub struct Fifo<T> {
-    list: [Option<T>; SYSLOG_FIFO_MAX_SIZE],
-    push_ind: usize,
-    pop_ind: usize,
-    len: usize,
+
+// Events of a player, each one with a sequence number (0 for the first event, then +1 each time)
+// Only the last `capacity` events are kept, the readers know what they missed from the
+// sequence number of the oldest one
+pub struct EventLog<T> {
+    list: VecDeque<T>,
+    capacity: usize,
+    next_seq: u64,
+    // Where the reads without a sequence number continue from
+    drained: u64,
 }
 
-impl<T: Copy> Default for Fifo<T> {
-    fn default() -> Self {
-        Self::new()
-    }
+// The events read, with the sequence number of the first one
+pub struct LogRead<T> {
+    pub first: u64,
+    pub next: u64,
+    pub events: Vec<(u64, T)>,
 }
 
-impl<T> Fifo<T> {
-    pub fn new() -> Fifo<T> {
-        Fifo {
-            len: 0,
-            push_ind: 0,
-            pop_ind: 0,
-            list: [const { None }; SYSLOG_FIFO_MAX_SIZE],
+impl<T: Clone> EventLog<T> {
+    pub fn new(capacity: usize) -> EventLog<T> {
+        EventLog {
+            list: VecDeque::with_capacity(capacity.min(64)),
+            capacity: capacity.max(1),
+            next_seq: 0,
+            drained: 0,
         }
     }
 
-    pub fn push(&mut self, data: T) {
-        if (self.len > 0) && (self.push_ind == self.pop_ind) {
-            self.pop_ind = (self.pop_ind + 1) % SYSLOG_FIFO_MAX_SIZE;
+    pub fn push(&mut self, data: T) -> u64 {
+        if self.list.len() == self.capacity {
+            self.list.pop_front();
         }
-        *self.list.get_mut(self.push_ind).unwrap() = Some(data);
-        self.push_ind = (self.push_ind + 1) % SYSLOG_FIFO_MAX_SIZE;
-        self.len = (self.len + 1).min(SYSLOG_FIFO_MAX_SIZE);
+        self.list.push_back(data);
+        self.next_seq += 1;
+        self.next_seq - 1
+    }
+
+    // Sequence number of the oldest event kept
+    pub fn first_seq(&self) -> u64 {
+        self.next_seq - self.list.len() as u64
     }
 
-    fn pop(&mut self) -> Option<T> {
-        if self.len == 0 {
-            return None;
+    pub fn next_seq(&self) -> u64 {
+        self.next_seq
+    }
+
+    // The events from the sequence number `seq`, without removing them
+    pub fn since(&self, seq: u64) -> LogRead<T> {
+        let first = self.first_seq();
+        let start = seq.saturating_sub(first).min(self.list.len() as u64) as usize;
+        let events = self
+            .list
+            .iter()
+            .enumerate()
+            .skip(start)
+            .map(|(n, ev)| (first + n as u64, ev.clone()))
+            .collect();
+        LogRead {
+            first,
+            next: self.next_seq,
+            events,
         }
+    }
 
-        let data = std::mem::take(self.list.get_mut(self.pop_ind).unwrap());
-        self.pop_ind = (self.pop_ind + 1) % SYSLOG_FIFO_MAX_SIZE;
-        self.len -= 1;
-        data
+    // The events not read by the previous calls
+    pub fn drain(&mut self) -> LogRead<T> {
+        let read = self.since(self.drained);
+        self.drained = self.next_seq;
+        read
     }
+}
+
+// The log of a player, and what wakes up the requests waiting for its next event
+pub struct PlayerLog {
+    pub events: RwLock<EventLog<(f64, SyslogEvent)>>,
+    pub notify: Notify,
+}
 
-    pub fn remove_all(&mut self) -> Vec<T> {
-        let mut data = vec![];
-        while self.len > 0 {
-            let Some(got) = self.pop() else {
-                continue;
-            };
-            data.push(got);
+pub struct Syslogs {
+    players: RwLock<BTreeMap<PlayerId, Arc<PlayerLog>>>,
+    capacity: usize,
+}
+
+impl Syslogs {
+    fn new() -> Syslogs {
+        let capacity = std::env::var("SIMEIS_SYSLOG_SIZE")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(SYSLOG_DEFAULT_SIZE);
+        Syslogs {
+            players: RwLock::new(BTreeMap::new()),
+            capacity,
         }
-        data
+    }
+
+    pub async fn get(&self, id: PlayerId) -> Arc<PlayerLog> {
+        if let Some(log) = self.players.read().await.get(&id) {
+            return log.clone();
+        }
+        let mut players = self.players.write().await; // OK
+        players
+            .entry(id)
+            .or_insert_with(|| {
+                Arc::new(PlayerLog {
+                    events: RwLock::new(EventLog::new(self.capacity)),
+                    notify: Notify::new(),
+                })
+            })
+            .clone()
     }
 }
 
@@ -87,7 +146,7 @@ impl SyslogSend {
     }
 }
 
-pub type SyslogFifo = Arc<RwLock<BTreeMap<PlayerId, Arc<RwLock<Fifo<(f64, SyslogEvent)>>>>>>;
+pub type SyslogFifo = Arc<Syslogs>;
 
 pub struct SyslogRecv {
     recv: Mutex<Receiver<SyslogData>>,
@@ -100,7 +159,7 @@ impl SyslogRecv {
         SyslogRecv {
             recv: Mutex::new(recv),
             tstart,
-            fifo: Arc::new(RwLock::new(BTreeMap::new())),
+            fifo: Arc::new(Syslogs::new()),
         }
     }
 
@@ -125,23 +184,9 @@ impl SyslogRecv {
 
     async fn add_to_fifo(&self, id: PlayerId, ns: f64, evt: SyslogEvent) {
         log::debug!("Player {id} got event {evt:?}");
-        let ok = {
-            let sysfifo = self.fifo.read().await; // OK
-            if let Some(fifo) = sysfifo.get(&id) {
-                let mut player_fifo = fifo.write().await; // OK
-                player_fifo.push((ns, evt.clone()));
-                true
-            } else {
-                false
-            }
-        };
-
-        if !ok {
-            let mut fifo = Fifo::new();
-            fifo.push((ns, evt));
-            let mut sysfifo = self.fifo.write().await; // OK
-            sysfifo.insert(id, Arc::new(RwLock::new(fifo)));
-        }
+        let log = self.fifo.get(id).await;
+        log.events.write().await.push((ns, evt)); // OK
+        log.notify.notify_waiters();
     }
 }
 
@@ -168,53 +213,40 @@ pub enum SyslogEvent {
 }
 
 #[test]
-fn test_syslog_fifo() {
-    let mut fifo = Fifo::<usize>::new();
-
-    fifo.push(0);
-    assert_eq!(fifo.remove_all(), vec![0]);
-
-    let ntest = SYSLOG_FIFO_MAX_SIZE + 5;
-    for n in 0..ntest {
-        fifo.push(n);
-        println!("{} {} {:?}", fifo.len, fifo.push_ind, fifo.list);
-        assert_eq!(fifo.len, (n + 1).min(SYSLOG_FIFO_MAX_SIZE), "iter {}", n);
-    }
-
-    println!();
-    println!("{} {} {}", fifo.len, fifo.push_ind, fifo.pop_ind);
-
-    for n in 0..ntest {
-        let got = fifo.pop();
-        println!("{} {} {:?}", fifo.len, fifo.pop_ind, fifo.list);
-        assert_eq!(
-            fifo.len,
-            SYSLOG_FIFO_MAX_SIZE.saturating_sub(n + 1),
-            "iter {}",
-            n
-        );
-
-        if n < SYSLOG_FIFO_MAX_SIZE {
-            assert_eq!(got, Some((ntest + n) - SYSLOG_FIFO_MAX_SIZE), "iter {}", n);
-        } else {
-            assert_eq!(got, None, "iter {}", n);
-        }
+fn test_syslog_eventlog() {
+    let size = 10;
+    let mut log = EventLog::<usize>::new(size);
+
+    assert_eq!(log.push(0), 0);
+    let read = log.drain();
+    assert_eq!(read.events, vec![(0, 0)]);
+    assert_eq!((read.first, read.next), (0, 1));
+    assert!(log.drain().events.is_empty());
+
+    let ntest = size + 5;
+    for n in 1..=ntest {
+        assert_eq!(log.push(n), n as u64);
     }
+    // The oldest events were dropped, the sequence numbers tell how many
+    assert_eq!(log.first_seq(), (ntest + 1 - size) as u64);
+    assert_eq!(log.next_seq(), (ntest + 1) as u64);
 
-    for n in 0..(2 * ntest) {
-        fifo.push(n);
-        println!("{} {} {:?}", fifo.len, fifo.push_ind, fifo.list);
-        assert_eq!(fifo.len, (n + 1).min(SYSLOG_FIFO_MAX_SIZE), "iter {}", n);
-    }
+    let read = log.since(0);
+    assert_eq!(read.first, (ntest + 1 - size) as u64);
+    assert_eq!(read.events.len(), size);
+    assert_eq!(read.events.first(), Some(&(read.first, ntest + 1 - size)));
+    assert_eq!(read.events.last(), Some(&(ntest as u64, ntest)));
 
-    println!();
-    fifo.push(usize::MAX);
-    let all = fifo.remove_all();
-    println!("{all:?}");
-    assert_eq!(all.len(), SYSLOG_FIFO_MAX_SIZE);
+    let read = log.since(ntest as u64 - 1);
     assert_eq!(
-        all.first(),
-        Some(&(((2 * ntest) + 1) - SYSLOG_FIFO_MAX_SIZE))
+        read.events,
+        vec![(ntest as u64 - 1, ntest - 1), (ntest as u64, ntest)]
     );
-    assert_eq!(all.last(), Some(&usize::MAX));
+    assert!(log.since(log.next_seq()).events.is_empty());
+    assert!(log.since(u64::MAX).events.is_empty());
+
+    // Reading with a cursor doesn't change what the reads without one get
+    let read = log.drain();
+    assert_eq!(read.events.len(), size);
+    assert!(log.drain().events.is_empty());
 }
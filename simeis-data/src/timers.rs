@@ -0,0 +1,109 @@
+use std::collections::BTreeMap;
+
+// Number of ticks in a turn of the wheel, a timer due later waits for the next turns in its slot
+const WHEEL_SLOTS: usize = 1024;
+
+// Hashed timer wheel: the keys to wake up at a given tick
+//     - A timer is put in the slot (tick % WHEEL_SLOTS), advancing to a tick only looks at
+//       the slots of the ticks elapsed, whatever the number of timers
+//     - A key has at most one timer, scheduling it again replaces the previous one
+pub struct TimerWheel<K> {
+    slots: Vec<Vec<(u64, K)>>,
+    // Tick of each key, the entries of the slots with another tick are outdated
+    due: BTreeMap<K, u64>,
+    // First tick not expired yet
+    next: u64,
+}
+
+impl<K: Copy + Ord> TimerWheel<K> {
+    pub fn new() -> TimerWheel<K> {
+        TimerWheel {
+            slots: (0..WHEEL_SLOTS).map(|_| vec![]).collect(),
+            due: BTreeMap::new(),
+            next: 0,
+        }
+    }
+
+    // A tick already expired fires at the next call to advance()
+    pub fn schedule(&mut self, key: K, tick: u64) {
+        let tick = tick.max(self.next);
+        if self.due.insert(key, tick) == Some(tick) {
+            return;
+        }
+        self.slots[(tick % WHEEL_SLOTS as u64) as usize].push((tick, key));
+    }
+
+    pub fn cancel(&mut self, key: &K) {
+        self.due.remove(key);
+    }
+
+    pub fn len(&self) -> usize {
+        self.due.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.due.is_empty()
+    }
+
+    // The keys due until `tick` (included), sorted
+    pub fn advance(&mut self, tick: u64) -> Vec<K> {
+        let mut fired = vec![];
+        if tick < self.next {
+            return fired;
+        }
+        let nslots = (tick - self.next + 1).min(WHEEL_SLOTS as u64);
+        for t in self.next..(self.next + nslots) {
+            let slot = &mut self.slots[(t % WHEEL_SLOTS as u64) as usize];
+            let mut n = 0;
+            while n < slot.len() {
+                let (due, key) = slot[n];
+                if due > tick {
+                    n += 1;
+                    continue;
+                }
+                slot.swap_remove(n);
+                if self.due.get(&key) == Some(&due) {
+                    self.due.remove(&key);
+                    fired.push(key);
+                }
+            }
+        }
+        self.next = tick + 1;
+        fired.sort();
+        fired
+    }
+}
+
+impl<K: Copy + Ord> Default for TimerWheel<K> {
+    fn default() -> Self {
+        Self::new()
+    }
+}
+
+#[test]
+fn test_timer_wheel() {
+    let mut wheel = TimerWheel::new();
+    wheel.schedule(3, 10);
+    wheel.schedule(1, 10);
+    wheel.schedule(2, 12);
+    // Later than a turn of the wheel, same slot as tick 10
+    wheel.schedule(4, 10 + WHEEL_SLOTS as u64);
+    assert_eq!(wheel.len(), 4);
+
+    assert!(wheel.advance(9).is_empty());
+    assert_eq!(wheel.advance(10), vec![1, 3]);
+    // Moved earlier, the old timer is ignored
+    wheel.schedule(2, 11);
+    assert_eq!(wheel.advance(11), vec![2]);
+    assert!(wheel.advance(12).is_empty());
+
+    // Already expired, fires at the next tick
+    wheel.schedule(5, 3);
+    wheel.schedule(6, 20);
+    wheel.cancel(&6);
+    assert_eq!(wheel.advance(13), vec![5]);
+
+    // Jump over more than a turn
+    assert_eq!(wheel.advance(10 * WHEEL_SLOTS as u64), vec![4]);
+    assert!(wheel.is_empty());
+}
@@ -1,24 +1,32 @@
 use std::collections::BTreeMap;
 use std::ops::{Deref, DerefMut};
+use std::pin::Pin;
 use std::str::FromStr;
-use std::time::Instant;
+use std::sync::Arc;
+use std::task::{Context, Poll};
+use std::time::{Duration, Instant};
 
 use base64::{prelude::BASE64_STANDARD, Engine};
+use ntex::http::header::{self, HeaderName, HeaderValue};
+use ntex::util::{Bytes, Stream};
 use ntex::web::types::Path;
 use ntex::web::{self, HttpRequest, HttpResponse, ServiceConfig};
 use rand::Rng;
 use serde_json::{json, to_value, Value};
 use simeis_data::crew::{CrewId, CrewMember, CrewMemberType};
-use simeis_data::galaxy::station::StationId;
-use simeis_data::galaxy::SpaceUnit;
-use simeis_data::market::fee_rate;
-use simeis_data::player::{PlayerId, PlayerKey};
+use simeis_data::galaxy::station::{Station, StationId};
+use simeis_data::galaxy::{Galaxy, SpaceUnit};
+use simeis_data::market::{fee_rate, Market, PriceChanges};
+use simeis_data::player::{Player, PlayerId, PlayerKey};
 use simeis_data::ship::module::{ShipModuleId, ShipModuleType};
 use simeis_data::ship::resources::Resource;
 use simeis_data::ship::upgrade::ShipUpgrade;
 use simeis_data::ship::{Ship, ShipId};
-use simeis_data::syslog::SyslogEvent;
+use simeis_data::syslog::{PlayerLog, SyslogEvent};
 use strum::IntoEnumIterator;
+use tokio::sync::broadcast::{self, error::RecvError};
+use tokio::sync::mpsc;
+use tokio::sync::RwLock;
 
 pub type ApiResult = Result<Value, Errcode>;
 
@@ -39,12 +47,16 @@ macro_rules! get_player {
         let Some(id) = index.get(&key) else {
             return build_response(Err(Errcode::NoPlayerWithKey));
         };
-        let players = $srv.players.read().await;
-        let player = players.get(id).unwrap();
+        let id = *id;
+        let player = $srv.players.read().await.get(&id).unwrap().clone();
+        drop(index);
+        // Lazy mode, the state of the player is computed up to now, and its timer again once
+        // the handler drops it (and its stats, in any mode)
+        let player = $srv.settle(id, player).await;
         if player.read().await.lost {
             return build_response(Err(Errcode::PlayerLost));
         }
-        player.clone()
+        player
     }};
 }
 
@@ -83,6 +95,18 @@ macro_rules! get_station {
     }};
 }
 
+// Same as get_station!, for the actions returning an ApiResult
+async fn owned_station(
+    galaxy: &Galaxy,
+    player: &Player,
+    id: &StationId,
+) -> Result<Arc<RwLock<Station>>, Errcode> {
+    let Some(station_coord) = player.stations.get(id).cloned() else {
+        return Err(Errcode::NoSuchStation(*id));
+    };
+    Ok(galaxy.get_station(&station_coord).await.unwrap())
+}
+
 // TODO    Ensure that multiple players cannot lock themselves:
 //     Ask for write on X, wait for read on Y
 //     Ask for write on Y, wait for read on X
@@ -114,6 +138,15 @@ fn get_player_key(req: &HttpRequest) -> Option<PlayerKey> {
     None
 }
 
+fn get_query_param(req: &HttpRequest, name: &str) -> Option<String> {
+    for q in req.query_string().split("&") {
+        if let Some(val) = q.strip_prefix(name).and_then(|q| q.strip_prefix("=")) {
+            return urlencoding::decode(val).ok().map(|v| v.into_owned());
+        }
+    }
+    None
+}
+
 pub fn jsonmerge(a: &mut Value, b: &Value) {
     match (a, b) {
         (Value::Object(a), Value::Object(b)) => {
@@ -148,30 +181,178 @@ async fn ping() -> impl web::Responder {
 }
 
 // CHECKED
+// The events of the player, with their sequence number
+//     - Without `since`, the events not returned by the previous calls without `since`
+//     - With `since`, the events from this sequence number (reply["next"] for the next call)
+//     - With `wait`, holds the request up to `wait` ms until there is an event to return
+// reply["first"] is the oldest event still kept, the events before it are lost
 #[web::get("/syslogs")]
 async fn get_syslogs(srv: GameState, req: HttpRequest) -> impl web::Responder {
     let player = get_player!(srv, req);
     let pid = player.read().await.id;
-    let allfifo = srv.fifo_events.read().await;
-    let Some(fifo) = allfifo.get(&pid) else {
-        return build_response(Ok(json!({"nb": 0, "events": []})));
+    let since = match get_query_param(&req, "since").map(|v| parse_arg::<u64>(&v, "since")) {
+        Some(Err(e)) => return build_response(Err(e)),
+        Some(Ok(seq)) => Some(seq),
+        None => None,
     };
-    let fifo = fifo.clone();
-    drop(allfifo);
-    let mut fifo = fifo.write().await;
-    let all_ev = fifo.remove_all();
-    let res = all_ev
+    let wait = match get_query_param(&req, "wait").map(|v| parse_arg::<u64>(&v, "wait")) {
+        Some(Err(e)) => return build_response(Err(e)),
+        Some(Ok(ms)) => ms.min(SYSLOG_MAX_WAIT_MS),
+        None => 0,
+    };
+
+    let log = srv.fifo_events.get(pid).await;
+    let deadline = Instant::now() + Duration::from_millis(wait);
+    let read = loop {
+        // Registered before reading, so an event pushed in between still wakes us up
+        let mut notified = std::pin::pin!(log.notify.notified());
+        notified.as_mut().enable();
+        let read = match since {
+            Some(seq) => log.events.read().await.since(seq),
+            None => log.events.write().await.drain(),
+        };
+        let now = Instant::now();
+        if !read.events.is_empty() || now >= deadline {
+            break read;
+        }
+        let _ = tokio::time::timeout(deadline - now, notified).await;
+    };
+
+    let res = read
+        .events
         .into_iter()
-        .map(|(t, ev)| {
-            let s: &'static str = ev.clone().into();
-            json!({
-                "timestamp": srv.tstart + t,
-                "type": s,
-                "event": ev,
-            })
-        })
+        .map(|(seq, (t, ev))| syslog_json(srv.tstart, seq, t, ev))
         .collect::<Vec<Value>>();
-    build_response(Ok(json!({ "nb": res.len(), "events": res, })))
+    build_response(Ok(json!({
+        "nb": res.len(),
+        "events": res,
+        "first": read.first,
+        "next": read.next,
+    })))
+}
+
+fn syslog_json(tstart: f64, seq: u64, t: f64, ev: SyslogEvent) -> Value {
+    let s: &'static str = ev.clone().into();
+    json!({
+        "seq": seq,
+        "timestamp": tstart + t,
+        "type": s,
+        "event": ev,
+    })
+}
+
+// A line of /stream, or the error ending it
+type StreamLine = Result<Bytes, std::io::Error>;
+
+fn stream_line(data: Value) -> StreamLine {
+    let mut line = serde_json::to_vec(&data).unwrap();
+    line.push(b'\n');
+    Ok(Bytes::from(line))
+}
+
+// The lines waiting to be sent to the client, at most STREAM_BUFFER of them
+struct StreamLines(mpsc::Receiver<StreamLine>);
+
+impl Stream for StreamLines {
+    type Item = StreamLine;
+
+    fn poll_next(mut self: Pin<&mut Self>, cx: &mut Context<'_>) -> Poll<Option<StreamLine>> {
+        self.0.poll_recv(cx)
+    }
+}
+
+// Waits for room in the buffer of the stream, false once the client is gone, or when it
+// didn't read anything for STREAM_SEND_TIMEOUT (the stream is given up)
+async fn stream_send(tx: &mpsc::Sender<StreamLine>, data: Value) -> bool {
+    let sent = tokio::time::timeout(STREAM_SEND_TIMEOUT, tx.send(stream_line(data))).await;
+    matches!(sent, Ok(Ok(())))
+}
+
+// Pushes the changes of the market prices until the client is gone
+// A ping is sent when nothing changed for STREAM_PING_PERIOD, it's how we notice a closed stream
+// A client reading slower than the prices change makes the broadcast lag behind, it gets all
+// the prices once it caught up
+async fn stream_prices(
+    market: Arc<RwLock<Market>>,
+    mut changes: broadcast::Receiver<PriceChanges>,
+    tx: mpsc::Sender<StreamLine>,
+) {
+    loop {
+        let line = match tokio::time::timeout(STREAM_PING_PERIOD, changes.recv()).await {
+            Ok(Ok(changed)) => json!({"stream": "market", "prices": changed.as_ref()}),
+            // Some changes were dropped, all the prices again
+            Ok(Err(RecvError::Lagged(_))) => {
+                json!({"stream": "market", "prices": market.read().await.prices})
+            }
+            Ok(Err(RecvError::Closed)) => break,
+            Err(_) => json!({"stream": "ping"}),
+        };
+        if !stream_send(&tx, line).await {
+            break;
+        }
+    }
+}
+
+// Pushes the events of the player from the sequence number `next`, until the client is gone
+// The log of the player is the buffer: a slow client only makes the cursor wait
+async fn stream_syslogs(
+    log: Arc<PlayerLog>,
+    tstart: f64,
+    mut next: u64,
+    tx: mpsc::Sender<StreamLine>,
+) {
+    // Stops with the prices too, the stream ends once both tasks dropped their sender
+    while !tx.is_closed() && tx.strong_count() > 1 {
+        // Registered before reading, so an event pushed in between still wakes us up
+        let mut notified = std::pin::pin!(log.notify.notified());
+        notified.as_mut().enable();
+        let read = log.events.read().await.since(next);
+        next = read.next;
+        for (seq, (t, ev)) in read.events {
+            let mut line = syslog_json(tstart, seq, t, ev);
+            jsonmerge(&mut line, &json!({"stream": "syslog"}));
+            if !stream_send(&tx, line).await {
+                return;
+            }
+        }
+        let _ = tokio::time::timeout(STREAM_PING_PERIOD, notified).await;
+    }
+}
+
+// Stream of the market prices, and of the events of the player if a key is given
+// One JSON object per line (NDJSON), the stream stays open until the client closes it:
+//     - {"stream": "market", "prices": {...}}: all the prices first, then the ones that changed
+//     - {"stream": "syslog", "seq": ..., ...}: the events of /syslogs, from the sequence number `since`
+//     - {"stream": "ping"}: nothing changed for STREAM_PING_PERIOD
+#[web::get("/stream")]
+async fn event_stream(srv: GameState, req: HttpRequest) -> impl web::Responder {
+    let since = match get_query_param(&req, "since").map(|v| parse_arg::<u64>(&v, "since")) {
+        Some(Err(e)) => return build_response(Err(e)),
+        Some(Ok(seq)) => seq,
+        None => 0,
+    };
+    let player = match get_query_param(&req, "key") {
+        Some(_) => Some(get_player!(srv, req)),
+        None => None,
+    };
+
+    let (tx, rx) = mpsc::channel(STREAM_BUFFER);
+    // Subscribed while reading the prices, no change can be missed in between
+    let (prices, changes) = {
+        let market = srv.market.read().await;
+        (market.prices.clone(), market.subscribe())
+    };
+    let _ = tx.try_send(stream_line(json!({"stream": "market", "prices": prices})));
+    if let Some(player) = player {
+        let pid = player.read().await.id;
+        let log = srv.fifo_events.get(pid).await;
+        ntex::rt::spawn(stream_syslogs(log, srv.tstart, since, tx.clone()));
+    }
+    ntex::rt::spawn(stream_prices(srv.market.clone(), changes, tx));
+
+    HttpResponse::Ok()
+        .content_type("application/x-ndjson")
+        .streaming(StreamLines(rx))
 }
 
 // CHECKED
@@ -205,10 +386,10 @@ async fn get_player(srv: GameState, id: Path<PlayerId>, req: HttpRequest) -> imp
     };
     let id = id.as_ref();
 
-    let players = srv.players.read().await;
-    let Some(player) = players.get(id) else {
+    let Some(player) = srv.players.read().await.get(id).cloned() else {
         return build_response(Err(Errcode::PlayerNotFound(*id)));
     };
+    let player = srv.settle(*id, player).await;
     let player = player.read().await;
 
     let res = if player.key == key {
@@ -240,17 +421,27 @@ async fn get_station_status(
     req: HttpRequest,
 ) -> impl web::Responder {
     let player = get_player!(srv, req);
-    let station = get_station!(srv, player, id.as_ref());
+    build_response(station_status(&srv, &player, id.as_ref()).await)
+}
+
+async fn station_status(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    id: &StationId,
+) -> ApiResult {
+    let player = player.read().await;
+    let station = owned_station(&srv.galaxy.read().await, &player, id).await?;
+    drop(player);
     let station = station.read().await;
 
-    build_response(Ok(json!({
+    Ok(json!({
         "id": station.id,
         "position": station.position,
         "crew": station.crew,
         "cargo": station.cargo,
         "idle_crew": station.idle_crew,
         "trader": station.trader,
-    })))
+    }))
 }
 
 // CHECKED
@@ -358,14 +549,23 @@ async fn hire_crew(
     req: HttpRequest,
 ) -> impl web::Responder {
     let (station_id, crewtype) = args.as_ref();
-    let Ok(crewtype) = CrewMemberType::from_str(crewtype.as_str()) else {
-        return build_response(Err(Errcode::InvalidArgument("crewtype")));
+    let player = get_player!(srv, req);
+    build_response(hire_crew_member(&srv, &player, station_id, crewtype).await)
+}
+
+async fn hire_crew_member(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    station_id: &StationId,
+    crewtype: &str,
+) -> ApiResult {
+    let Ok(crewtype) = CrewMemberType::from_str(crewtype) else {
+        return Err(Errcode::InvalidArgument("crewtype"));
     };
 
-    let player = get_player!(srv, req);
     let mut player = player.write().await;
     let galaxy = srv.galaxy.read().await;
-    let station = get_station!(srv, station_id; player; galaxy);
+    let station = owned_station(&galaxy, &player, station_id).await?;
     let mut station = station.write().await;
 
     let mut rng = rand::rng();
@@ -374,7 +574,7 @@ async fn hire_crew(
     station.idle_crew.0.insert(id, member);
     drop(station);
     player.update_wages(&galaxy).await;
-    build_response(Ok(serde_json::json!({ "id": id })))
+    Ok(serde_json::json!({ "id": id }))
 }
 
 // CHECKED
@@ -468,10 +668,21 @@ async fn assign_trader(
     let (station_id, crew_id) = args.as_ref();
 
     let player = get_player!(srv, req);
-    let station = get_station!(srv, player, station_id);
+    build_response(assign_trader_on(&srv, &player, station_id, crew_id).await)
+}
+
+async fn assign_trader_on(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    station_id: &StationId,
+    crew_id: &CrewId,
+) -> ApiResult {
+    let player = player.read().await;
+    let station = owned_station(&srv.galaxy.read().await, &player, station_id).await?;
+    drop(player);
     let mut station = station.write().await;
 
-    build_response(station.assign_trader(*crew_id).map(|_| json!({})))
+    station.assign_trader(*crew_id).map(|_| json!({}))
 }
 
 // CHECKED
@@ -484,15 +695,25 @@ async fn assign_pilot(
     let (station_id, crew_id, ship_id) = args.as_ref();
 
     let player = get_player!(srv, req);
+    build_response(assign_pilot_on(&srv, &player, station_id, crew_id, ship_id).await)
+}
+
+async fn assign_pilot_on(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    station_id: &StationId,
+    crew_id: &CrewId,
+    ship_id: &ShipId,
+) -> ApiResult {
     let mut player = player.write().await;
 
-    let station = get_station!(srv, station_id; player);
+    let station = owned_station(&srv.galaxy.read().await, &player, station_id).await?;
     let mut station = station.write().await;
 
     let Some(ship) = player.ships.get_mut(ship_id) else {
-        return build_response(Err(Errcode::ShipNotFound(*ship_id)));
+        return Err(Errcode::ShipNotFound(*ship_id));
     };
-    build_response(station.onboard_pilot(*crew_id, ship).map(|_| json!({})))
+    station.onboard_pilot(*crew_id, ship).map(|_| json!({}))
 }
 
 // CHECKED
@@ -505,19 +726,28 @@ async fn assign_operator(
     let (station_id, crew_id, ship_id, modid) = args.as_ref();
 
     let player = get_player!(srv, req);
+    build_response(assign_operator_on(&srv, &player, station_id, crew_id, ship_id, modid).await)
+}
+
+async fn assign_operator_on(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    station_id: &StationId,
+    crew_id: &CrewId,
+    ship_id: &ShipId,
+    modid: &ShipModuleId,
+) -> ApiResult {
     let mut player = player.write().await;
 
-    let station = get_station!(srv, station_id; player);
+    let station = owned_station(&srv.galaxy.read().await, &player, station_id).await?;
     let mut station = station.write().await;
 
     let Some(ship) = player.ships.get_mut(ship_id) else {
-        return build_response(Err(Errcode::ShipNotFound(*ship_id)));
+        return Err(Errcode::ShipNotFound(*ship_id));
     };
-    build_response(
-        station
-            .onboard_operator(*crew_id, ship, modid)
-            .map(|_| json!({})),
-    )
+    station
+        .onboard_operator(*crew_id, ship, modid)
+        .map(|_| json!({}))
 }
 
 // CHECKED
@@ -563,22 +793,29 @@ async fn buy_ship_module(
     req: HttpRequest,
 ) -> impl web::Responder {
     let (station_id, ship_id, modtype) = args.as_ref();
-    let Ok(modtype) = ShipModuleType::from_str(modtype.as_str()) else {
-        return build_response(Err(Errcode::InvalidArgument("modtype")));
-    };
 
     let player = get_player!(srv, req);
-    let mut player = player.write().await;
+    build_response(buy_module(&player, station_id, ship_id, modtype).await)
+}
 
-    build_response(
-        player
-            .buy_ship_module(station_id, ship_id, modtype)
-            .map(|v| {
-                json!({
-                    "id": v,
-                })
-            }),
-    )
+async fn buy_module(
+    player: &Arc<RwLock<Player>>,
+    station_id: &StationId,
+    ship_id: &ShipId,
+    modtype: &str,
+) -> ApiResult {
+    let Ok(modtype) = ShipModuleType::from_str(modtype) else {
+        return Err(Errcode::InvalidArgument("modtype"));
+    };
+
+    let mut player = player.write().await;
+    player
+        .buy_ship_module(station_id, ship_id, modtype)
+        .map(|v| {
+            json!({
+                "id": v,
+            })
+        })
 }
 
 // CHECKED
@@ -699,17 +936,25 @@ async fn refuel_ship(
     let (station_id, ship_id) = args.as_ref();
 
     let player = get_player!(srv, req);
+    build_response(refuel(&srv, &player, station_id, ship_id).await)
+}
+
+async fn refuel(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    station_id: &StationId,
+    ship_id: &ShipId,
+) -> ApiResult {
     let mut player = player.write().await;
 
-    let station = get_station!(srv, station_id; player);
+    let station = owned_station(&srv.galaxy.read().await, &player, station_id).await?;
     let mut station = station.write().await;
 
     let Some(ship) = player.ships.get_mut(ship_id) else {
-        return build_response(Err(Errcode::ShipNotFound(*ship_id)));
+        return Err(Errcode::ShipNotFound(*ship_id));
     };
 
-    let res = station.refuel_ship(ship).map(|v| json!({"added-fuel": v}));
-    build_response(res)
+    station.refuel_ship(ship).map(|v| json!({"added-fuel": v}))
 }
 
 // CHECKED
@@ -721,17 +966,25 @@ async fn repair_ship(
 ) -> impl web::Responder {
     let (station_id, ship_id) = args.as_ref();
     let player = get_player!(srv, req);
+    build_response(repair(&srv, &player, station_id, ship_id).await)
+}
+
+async fn repair(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    station_id: &StationId,
+    ship_id: &ShipId,
+) -> ApiResult {
     let mut player = player.write().await;
 
-    let station = get_station!(srv, station_id; player);
+    let station = owned_station(&srv.galaxy.read().await, &player, station_id).await?;
     let mut station = station.write().await;
 
     let Some(ship) = player.ships.get_mut(ship_id) else {
-        return build_response(Err(Errcode::ShipNotFound(*ship_id)));
+        return Err(Errcode::ShipNotFound(*ship_id));
     };
 
-    let res = station.repair_ship(ship).map(|v| json!({"added-hull": v}));
-    build_response(res)
+    station.repair_ship(ship).map(|v| json!({"added-hull": v}))
 }
 
 // FIXME Sometimes under heavy load, sometimes get a "Ship not found"
@@ -743,12 +996,16 @@ async fn get_ship_status(
     req: HttpRequest,
 ) -> impl web::Responder {
     let player = get_player!(srv, req);
+    build_response(ship_status(&player, id.as_ref()).await)
+}
+
+async fn ship_status(player: &Arc<RwLock<Player>>, id: &ShipId) -> ApiResult {
     let player = player.read().await;
 
-    let Some(ship) = player.ships.get(id.as_ref()) else {
-        return build_response(Err(Errcode::ShipNotFound(*id)));
+    let Some(ship) = player.ships.get(id) else {
+        return Err(Errcode::ShipNotFound(*id));
     };
-    build_response(Ok(to_value(ship).unwrap()))
+    Ok(to_value(ship).unwrap())
 }
 
 // CHECKED
@@ -781,16 +1038,23 @@ async fn ask_navigate(
     req: HttpRequest,
 ) -> impl web::Responder {
     let (id, x, y, z) = args.as_ref();
-    let coord = (*x, *y, *z);
 
     let player = get_player!(srv, req);
+    build_response(navigate(&player, id, (*x, *y, *z)).await)
+}
+
+async fn navigate(
+    player: &Arc<RwLock<Player>>,
+    id: &ShipId,
+    coord: (SpaceUnit, SpaceUnit, SpaceUnit),
+) -> ApiResult {
     let mut player = player.write().await;
 
     let Some(ship) = player.ships.get_mut(id) else {
-        return build_response(Err(Errcode::ShipNotFound(*id)));
+        return Err(Errcode::ShipNotFound(*id));
     };
 
-    build_response(ship.set_travel(coord).map(|cost| json!(cost)))
+    ship.set_travel(coord).map(|cost| json!(cost))
 }
 
 // CHECKED
@@ -819,16 +1083,18 @@ async fn start_extraction(
     req: HttpRequest,
 ) -> impl web::Responder {
     let player = get_player!(srv, req);
+    build_response(extract(&srv, &player, id.as_ref()).await)
+}
+
+async fn extract(srv: &GameState, player: &Arc<RwLock<Player>>, id: &ShipId) -> ApiResult {
     let mut player = player.write().await;
-    let Some(ship) = player.ships.get_mut(id.as_ref()) else {
-        return build_response(Err(Errcode::ShipNotFound(*id)));
+    let Some(ship) = player.ships.get_mut(id) else {
+        return Err(Errcode::ShipNotFound(*id));
     };
     let galaxy = srv.galaxy.read().await;
-    build_response(
-        ship.start_extraction(&galaxy)
-            .await
-            .map(|v| to_value(v).unwrap()),
-    )
+    ship.start_extraction(&galaxy)
+        .await
+        .map(|v| to_value(v).unwrap())
 }
 
 // CHECKED
@@ -857,27 +1123,37 @@ async fn unload_ship_cargo(
 ) -> impl web::Responder {
     let (id, resource, amnt) = args.as_ref();
 
+    let player = get_player!(srv, req);
+    build_response(unload(&srv, &player, id, resource, *amnt).await)
+}
+
+async fn unload(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    id: &ShipId,
+    resource: &str,
+    amnt: f64,
+) -> ApiResult {
     let Ok(resource) = Resource::from_str(resource) else {
-        return build_response(Err(Errcode::InvalidArgument("resource")));
+        return Err(Errcode::InvalidArgument("resource"));
     };
 
-    let player = get_player!(srv, req);
     let mut player = player.write().await;
 
     let Some(ship) = player.ships.get(id) else {
-        return build_response(Err(Errcode::ShipNotFound(*id)));
+        return Err(Errcode::ShipNotFound(*id));
     };
 
     let Some(station) = player.stations.iter().find(|(_, s)| *s == &ship.position) else {
-        return build_response(Err(Errcode::ShipNotInStation));
+        return Err(Errcode::ShipNotInStation);
     };
 
-    let station = get_station!(srv, station.0; player);
+    let station = owned_station(&srv.galaxy.read().await, &player, station.0).await?;
     let mut station = station.write().await;
 
     let pid = player.id;
     let ship = player.ships.get_mut(id).unwrap();
-    let res = ship.unload_cargo(&resource, *amnt, station.deref_mut());
+    let res = ship.unload_cargo(&resource, amnt, station.deref_mut());
 
     if let Ok(0.0) = res {
         srv.syslog
@@ -890,7 +1166,7 @@ async fn unload_ship_cargo(
             )
             .await;
     }
-    build_response(res.map(|v| json!({ "unloaded": v })))
+    res.map(|v| json!({ "unloaded": v }))
 }
 
 // CHECKED
@@ -909,22 +1185,31 @@ async fn buy_resource(
     req: HttpRequest,
 ) -> impl web::Responder {
     let (station_id, resource, amnt) = args.as_ref();
+
+    let player = get_player!(srv, req);
+    build_response(market_buy(&srv, &player, station_id, resource, *amnt).await)
+}
+
+async fn market_buy(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    station_id: &StationId,
+    resource: &str,
+    amnt: f64,
+) -> ApiResult {
     let Ok(resource) = Resource::from_str(resource) else {
-        return build_response(Err(Errcode::InvalidArgument("resource")));
+        return Err(Errcode::InvalidArgument("resource"));
     };
 
-    let player = get_player!(srv, req);
     let mut player = player.write().await;
 
-    let station = get_station!(srv, station_id; player);
+    let station = owned_station(&srv.galaxy.read().await, &player, station_id).await?;
     let mut station = station.write().await;
 
     let mut market = srv.market.write().await;
-    build_response(
-        station
-            .buy_resource(&resource, *amnt, player.deref_mut(), market.deref_mut())
-            .map(|tx| to_value(tx).unwrap()),
-    )
+    station
+        .buy_resource(&resource, amnt, player.deref_mut(), market.deref_mut())
+        .map(|tx| to_value(tx).unwrap())
 }
 
 // CHECKED
@@ -935,21 +1220,31 @@ async fn sell_resource(
     req: HttpRequest,
 ) -> impl web::Responder {
     let (station_id, resource, amnt) = args.as_ref();
+
+    let player = get_player!(srv, req);
+    build_response(market_sell(&srv, &player, station_id, resource, *amnt).await)
+}
+
+async fn market_sell(
+    srv: &GameState,
+    player: &Arc<RwLock<Player>>,
+    station_id: &StationId,
+    resource: &str,
+    amnt: f64,
+) -> ApiResult {
     let Ok(resource) = Resource::from_str(resource) else {
-        return build_response(Err(Errcode::InvalidArgument("resource")));
+        return Err(Errcode::InvalidArgument("resource"));
     };
 
-    let player = get_player!(srv, req);
     let mut player = player.write().await;
 
-    let station = get_station!(srv, station_id; player);
+    let station = owned_station(&srv.galaxy.read().await, &player, station_id).await?;
     let mut station = station.write().await;
 
     let mut market = srv.market.write().await;
-    let res = station
-        .sell_resource(&resource, *amnt, player.deref_mut(), market.deref_mut())
-        .map(|tx| to_value(tx).unwrap());
-    build_response(res)
+    station
+        .sell_resource(&resource, amnt, player.deref_mut(), market.deref_mut())
+        .map(|tx| to_value(tx).unwrap())
 }
 
 // CHECKED
@@ -979,22 +1274,35 @@ async fn get_fee_rate(
 #[cfg(feature = "testing")]
 #[web::get("/tick")]
 async fn tick_server(srv: GameState) -> impl web::Responder {
-    let Ok(_) = srv.send_sig.send(simeis_data::game::GameSignal::Tick).await else {
-        return build_response(Err(Errcode::GameSignalSend));
-    };
-    build_response(Ok(json!({})))
+    build_response(run_ticks(&srv, 1).await)
 }
 
 #[cfg(feature = "testing")]
 #[web::get("/tick/{n}")]
 async fn tick_server_n(srv: GameState, n: Path<usize>) -> impl web::Responder {
-    let n = n.as_ref().clone();
+    build_response(run_ticks(&srv, *n.as_ref()).await)
+}
+
+// Replies once the game thread has run the `n` ticks, so the next requests see their result
+#[cfg(feature = "testing")]
+async fn run_ticks(srv: &GameState, n: usize) -> ApiResult {
     for _ in 0..n {
         let Ok(_) = srv.send_sig.send(simeis_data::game::GameSignal::Tick).await else {
-            return build_response(Err(Errcode::GameSignalSend));
+            return Err(Errcode::GameSignalSend);
         };
     }
-    build_response(Ok(json!({})))
+    let (send, recv) = tokio::sync::oneshot::channel();
+    let Ok(_) = srv
+        .send_sig
+        .send(simeis_data::game::GameSignal::Sync(send))
+        .await
+    else {
+        return Err(Errcode::GameSignalSend);
+    };
+    let Ok(_) = recv.await else {
+        return Err(Errcode::GameSignalSend);
+    };
+    Ok(json!({}))
 }
 
 // CHECKED
@@ -1027,46 +1335,195 @@ async fn resources_info() -> impl web::Responder {
 }
 
 // CHECKED
+// The stats are computed by the game thread (see simeis_data::stats), this only sends the last
+// snapshot: 304 if the client already has the same data, or the `top` best players only if asked
 #[web::get("/gamestats")]
-async fn gamestats(srv: GameState) -> impl web::Responder {
-    let mut data = BTreeMap::new();
-    let all_players = srv.players.read().await;
-    let mut players = vec![];
-    for (id, player) in all_players.iter() {
-        players.push((id, player.read().await));
+async fn gamestats(srv: GameState, req: HttpRequest) -> impl web::Responder {
+    let stats = srv.stats.read().await.clone();
+    let top = match get_query_param(&req, "top").map(|n| parse_arg::<usize>(&n, "top")) {
+        Some(Err(e)) => return build_response(Err(e)),
+        Some(Ok(n)) => Some(n),
+        None => None,
+    };
+    let data = stats.to_json(top);
+    let etag = stats.etag(&data);
+    let cached = req
+        .headers()
+        .get(header::IF_NONE_MATCH)
+        .and_then(|v| v.to_str().ok())
+        .is_some_and(|v| v.split(',').any(|t| t.trim() == etag));
+
+    let mut resp = if cached {
+        HttpResponse::NotModified().finish()
+    } else {
+        build_response(Ok(data))
+    };
+
+    let headers = resp.headers_mut();
+    headers.insert(header::ETAG, HeaderValue::from_str(&etag).unwrap());
+    headers.insert(
+        HeaderName::from_static("x-players"),
+        HeaderValue::from(stats.players.len()),
+    );
+    headers.insert(
+        HeaderName::from_static("x-players-active"),
+        HeaderValue::from(stats.active),
+    );
+    resp
+}
+
+// Time taken by the ticks of the game, in milliseconds (see simeis_data::stats::TickTimes)
+#[web::get("/tickstats")]
+async fn tickstats(srv: GameState) -> impl web::Responder {
+    build_response(Ok(srv.tick_times.to_json()))
+}
+
+// Maximum time a call to /syslogs can wait for an event
+const SYSLOG_MAX_WAIT_MS: u64 = 30_000;
+
+// Time without any line on /stream before a ping is sent
+const STREAM_PING_PERIOD: Duration = Duration::from_secs(15);
+
+// Lines of /stream waiting for the client, the tasks filling the stream wait for room
+const STREAM_BUFFER: usize = 64;
+
+// A client not reading anything for this long has its stream closed
+const STREAM_SEND_TIMEOUT: Duration = Duration::from_secs(30);
+
+// Maximum number of paths in a single call to /batch
+const BATCH_MAX_SIZE: usize = 64;
+
+fn parse_arg<T: FromStr>(arg: &str, name: &'static str) -> Result<T, Errcode> {
+    arg.parse().map_err(|_| Errcode::InvalidArgument(name))
+}
+
+// Replace the "{N.field}" parts of the path with the field of the Nth result of the batch
+// Allows to chain actions, like hiring a crew member and assigning it
+fn resolve_batch_path(path: &str, results: &[Value]) -> Result<Vec<String>, Errcode> {
+    let mut parts = vec![];
+    for part in path.trim_start_matches('/').split('/') {
+        let Some(reference) = part.strip_prefix('{').and_then(|p| p.strip_suffix('}')) else {
+            parts.push(part.to_string());
+            continue;
+        };
+        let Some((n, field)) = reference.split_once('.') else {
+            return Err(Errcode::InvalidArgument("batch reference"));
+        };
+        let Some(val) = n
+            .parse::<usize>()
+            .ok()
+            .and_then(|n| results.get(n))
+            .and_then(|res| res.get(field))
+        else {
+            return Err(Errcode::InvalidArgument("batch reference"));
+        };
+        parts.push(match val {
+            Value::String(s) => s.clone(),
+            val => val.to_string(),
+        });
     }
-    let galaxy = srv.galaxy.read().await;
+    Ok(parts)
+}
+
+// The actions that can be chained in a batch, with the same arguments as their endpoint
+async fn run_batch_path(srv: &GameState, player: &Arc<RwLock<Player>>, path: &[&str]) -> ApiResult {
+    match path {
+        ["ship", id] => ship_status(player, &parse_arg(id, "ship_id")?).await,
+        ["ship", id, "navigate", x, y, z] => {
+            let coord = (parse_arg(x, "x")?, parse_arg(y, "y")?, parse_arg(z, "z")?);
+            navigate(player, &parse_arg(id, "ship_id")?, coord).await
+        }
+        ["ship", id, "extraction", "start"] => {
+            extract(srv, player, &parse_arg(id, "ship_id")?).await
+        }
+        ["ship", id, "unload", res, amnt] => {
+            let id = parse_arg(id, "ship_id")?;
+            unload(srv, player, &id, res, parse_arg(amnt, "amount")?).await
+        }
+        ["station", sta] => station_status(srv, player, &parse_arg(sta, "station_id")?).await,
+        ["station", sta, "crew", "hire", crewtype] => {
+            let sta = parse_arg(sta, "station_id")?;
+            hire_crew_member(srv, player, &sta, crewtype).await
+        }
+        ["station", sta, "crew", "assign", crew, "trading"] => {
+            let sta = parse_arg(sta, "station_id")?;
+            assign_trader_on(srv, player, &sta, &parse_arg(crew, "crewid")?).await
+        }
+        ["station", sta, "crew", "assign", crew, ship, "pilot"] => {
+            let sta = parse_arg(sta, "station_id")?;
+            let crew = parse_arg(crew, "crewid")?;
+            assign_pilot_on(srv, player, &sta, &crew, &parse_arg(ship, "shipid")?).await
+        }
+        ["station", sta, "crew", "assign", crew, ship, modid] => {
+            let sta = parse_arg(sta, "station_id")?;
+            let crew = parse_arg(crew, "crewid")?;
+            let ship = parse_arg(ship, "shipid")?;
+            assign_operator_on(srv, player, &sta, &crew, &ship, &parse_arg(modid, "modid")?).await
+        }
+        ["station", sta, "shop", "modules", ship, "buy", modtype] => {
+            let sta = parse_arg(sta, "station_id")?;
+            buy_module(player, &sta, &parse_arg(ship, "ship_id")?, modtype).await
+        }
+        ["station", sta, "refuel", ship] => {
+            let sta = parse_arg(sta, "station_id")?;
+            refuel(srv, player, &sta, &parse_arg(ship, "ship_id")?).await
+        }
+        ["station", sta, "repair", ship] => {
+            let sta = parse_arg(sta, "station_id")?;
+            repair(srv, player, &sta, &parse_arg(ship, "ship_id")?).await
+        }
+        ["market", sta, "buy", res, amnt] => {
+            let sta = parse_arg(sta, "station_id")?;
+            market_buy(srv, player, &sta, res, parse_arg(amnt, "amnt")?).await
+        }
+        ["market", sta, "sell", res, amnt] => {
+            let sta = parse_arg(sta, "station_id")?;
+            market_sell(srv, player, &sta, res, parse_arg(amnt, "amnt")?).await
+        }
+        _ => Err(Errcode::InvalidArgument("batch path")),
+    }
+}
 
-    for (id, p) in players {
-        let potential = {
-            let mut s = 0.0;
-            for (_, coord) in p.stations.iter() {
-                let sta = galaxy.get_station(coord).await.unwrap();
-                let station = sta.read().await;
-                s += station
-                    .cargo
-                    .resources
-                    .iter()
-                    .map(|(r, amnt)| r.base_price() * amnt)
-                    .sum::<f64>();
+// Runs a list of paths in order, the player is authenticated only once
+//     - paths: JSON list of paths, ex: ["/ship/1/unload/Iron/10", "/market/2/sell/Iron/10"]
+//     - Stops at the first failing path, "index" is its position in the list
+#[web::get("/batch")]
+async fn batch(srv: GameState, req: HttpRequest) -> impl web::Responder {
+    let player = get_player!(srv, req);
+    let Some(paths) = get_query_param(&req, "paths") else {
+        return build_response(Err(Errcode::InvalidArgument("paths")));
+    };
+    let Ok(paths) = serde_json::from_str::<Vec<String>>(&paths) else {
+        return build_response(Err(Errcode::InvalidArgument("paths")));
+    };
+    if paths.len() > BATCH_MAX_SIZE {
+        return build_response(Err(Errcode::InvalidArgument("paths")));
+    }
+
+    let mut results = vec![];
+    for (index, path) in paths.iter().enumerate() {
+        let res = match resolve_batch_path(path, &results) {
+            Ok(parts) => {
+                let parts = parts.iter().map(|p| p.as_str()).collect::<Vec<&str>>();
+                run_batch_path(&srv, &player, &parts).await
             }
-            s
+            Err(e) => Err(e),
         };
-
-        data.insert(
-            id,
-            json!({
-                "name": p.name,
-                "score": p.score,
-                "potential": potential,
-                "age": (Instant::now() - p.created).as_secs(),
-                "lost": p.lost,
-                "money": p.money,
-                "stations": p.stations,
-            }),
-        );
+        match res {
+            Ok(data) => results.push(data),
+            Err(e) => {
+                return HttpResponse::Ok()
+                    .content_type("application/json")
+                    .json(&json!({
+                        "error": e.errmsg(),
+                        "type": format!("{e:?}"),
+                        "index": index,
+                        "results": results,
+                    }))
+            }
+        }
     }
-    build_response(Ok(to_value(data).unwrap()))
+    build_response(Ok(json!({ "results": results })))
 }
 
 #[web::get("/version")]
@@ -1082,8 +1539,11 @@ pub fn configure(srv: &mut ServiceConfig) {
     srv.service(ping)
         .service(get_version)
         .service(gamestats)
+        .service(tickstats)
         .service(resources_info)
         .service(get_syslogs)
+        .service(event_stream)
+        .service(batch)
         .service(hire_crew)
         .service(get_crew_upgrades)
         .service(buy_crew_upgrade)
@@ -1119,3 +1579,16 @@ pub fn configure(srv: &mut ServiceConfig) {
         .service(get_player)
         .service(new_player);
 }
+
+#[test]
+fn test_resolve_batch_path() {
+    let results = vec![json!({"id": 12}), json!({"id": 3, "name": "abc"})];
+    let path = resolve_batch_path("/station/1/crew/assign/{1.id}/7/{0.id}", &results).unwrap();
+    assert_eq!(path, vec!["station", "1", "crew", "assign", "3", "7", "12"]);
+    let path = resolve_batch_path("/player/{1.name}", &results).unwrap();
+    assert_eq!(path, vec!["player", "abc"]);
+
+    assert!(resolve_batch_path("/ship/{2.id}", &results).is_err());
+    assert!(resolve_batch_path("/ship/{0.name}", &results).is_err());
+    assert!(resolve_batch_path("/ship/{0}", &results).is_err());
+}